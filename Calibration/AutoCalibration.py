@@ -0,0 +1,150 @@
+import math
+import cv2
+import numpy as np
+from Constants import *
+
+
+def getSideLines(corners):
+    # Sides of the table as pairs of corners: top, right, bottom and left. Corners start at the top left
+    # and go clockwise like for getTableHomography.
+    corners = np.float64(corners)
+    return np.stack([corners, np.roll(corners, -1, axis=0)], axis=1)
+
+
+def medianFrame(frames):
+    # The puck, the robot and hands move between the frames, the table edges do not.
+    if len(frames) == 1:
+        return frames[0]
+    return np.median(np.stack(frames), axis=0).astype(np.uint8)
+
+
+def findTableCorners(frames, previousCorners, maxShift=AUTO_CALIBRATION_MAX_SHIFT,
+                     cannyLow=AUTO_CALIBRATION_CANNY_LOW, cannyHigh=AUTO_CALIBRATION_CANNY_HIGH,
+                     houghThreshold=AUTO_CALIBRATION_HOUGH_THRESHOLD, maxLines=AUTO_CALIBRATION_MAX_LINES,
+                     minArea=AUTO_CALIBRATION_MIN_AREA):
+    # Finds the table outline in a few camera frames. Every side is the strong straight edge closest to where
+    # it was in previousCorners, so a bumped table or camera is found again while the centre line and the
+    # goal markings are ignored. If a side moved by more than maxShift pixels, the outline is searched all
+    # over the frame instead and its sides are fitted the same way. Returns the corners like previousCorners,
+    # or None if the table was not found.
+    grey = cv2.cvtColor(medianFrame(frames), cv2.COLOR_BGR2GRAY)
+    grey = cv2.GaussianBlur(grey, (5, 5), 0)
+    edges = cv2.Canny(grey, cannyLow, cannyHigh)
+    lines = cv2.HoughLines(edges, 1, math.pi / 360, houghThreshold)
+    if lines is None:
+        return None
+    # Strongest lines first, every line as the normal form x * cos(theta) + y * sin(theta) = rho.
+    rho = lines[:maxLines, 0, 0].astype(np.float64)
+    theta = lines[:maxLines, 0, 1].astype(np.float64)
+    corners = fitSides(rho, theta, previousCorners, maxShift)
+    if corners is not None:
+        return corners
+    outline = findTableOutline(edges, previousCorners, minArea * edges.size)
+    if outline is None:
+        return None
+    return fitSides(rho, theta, outline, maxShift)
+
+
+def findTableOutline(edges, previousCorners, minArea):
+    # Largest four-sided outline in the edges, wherever it is. The corners are only roughly where the
+    # sides meet, they start at the corner closest to the first of previousCorners and go round the same way.
+    # Returns None if there is no such outline of at least minArea square pixels.
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    outline = None
+    for contour in contours:
+        hull = cv2.convexHull(contour)
+        area = cv2.contourArea(hull)
+        if area < minArea:
+            continue
+        polygon = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+        if len(polygon) == 4:
+            outline, minArea = np.float64(polygon[:, 0]), area
+    if outline is None:
+        return None
+    # Same direction round the table as previousCorners, starting at the closest corner.
+    previous = np.float64(previousCorners)
+    if np.cross(previous[1] - previous[0], previous[2] - previous[1]) * \
+            np.cross(outline[1] - outline[0], outline[2] - outline[1]) < 0:
+        outline = outline[::-1]
+    shifts = [np.roll(outline, -shift, axis=0) for shift in range(4)]
+    return min(shifts, key=lambda corners: np.linalg.norm(corners - previous, axis=1).sum())
+
+
+def fitSides(rho, theta, previousCorners, maxShift):
+    # Corners where the lines closest to the sides of previousCorners meet, None if a side has no line
+    # within maxShift pixels.
+    normals = np.stack([np.cos(theta), np.sin(theta)], axis=-1)
+    sides = getSideLines(previousCorners)
+    # Distance of both ends of every previous side from every line, shape (side, end, line).
+    distances = np.abs(sides @ normals.T - rho)
+    # Parallel lines only, so a line through one end of a side cannot match it.
+    directions = sides[:, 1] - sides[:, 0]
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    parallel = np.abs(directions @ normals.T) < math.sin(math.radians(AUTO_CALIBRATION_MAX_TILT))
+    cost = np.where(parallel, distances.max(axis=1), np.inf)
+    best = np.argmin(cost, axis=1)
+    if not np.all(cost[np.arange(4), best] <= maxShift):
+        return None
+    # Each corner is where its two sides meet: left and top, top and right, right and bottom, bottom and left.
+    matrix = normals[best]
+    offsets = rho[best]
+    previous = np.roll(np.arange(4), 1)
+    systems = np.stack([matrix[previous], matrix], axis=1)
+    if np.any(np.abs(np.linalg.det(systems)) < 1e-6):
+        return None
+    corners = np.linalg.solve(systems, np.stack([offsets[previous], offsets], axis=1)[..., None])[..., 0]
+    return [(int(round(x)), int(round(y))) for x, y in corners]
+
+
+def histogramRange(values, bins, coverage):
+    # Smallest and largest value of the part of the histogram that holds the middle coverage of the samples.
+    histogram = np.bincount(values, minlength=bins)
+    cumulative = np.cumsum(histogram) / max(histogram.sum(), 1)
+    tail = (1 - coverage) / 2
+    lower = int(np.searchsorted(cumulative, tail, side="right"))
+    upper = int(np.searchsorted(cumulative, 1 - tail, side="left"))
+    return lower, min(upper, bins - 1)
+
+
+def hueRange(hues, coverage, margin):
+    # Like histogramRange for the hue circle of OpenCV, 0 to 179. The hues are turned so that their circular
+    # mean is in the middle, so a red sample on both sides of 0 is not taken as every hue in between.
+    # Returns (lower, upper), lower is above upper if the range wraps through 0.
+    angles = np.float64(hues) * (2 * math.pi / 180)
+    mean = int(round(math.atan2(np.sin(angles).mean(), np.cos(angles).mean()) * 180 / (2 * math.pi))) % 180
+    shift = 90 - mean
+    lower, upper = histogramRange((np.int64(hues) + shift) % 180, 180, coverage)
+    if upper - lower + 2 * margin >= 179:
+        return 0, 179
+    return (lower - margin - shift) % 180, (upper + margin - shift) % 180
+
+
+def colourRangeFromSample(frame, x, y, radius=AUTO_CALIBRATION_SAMPLE_RADIUS, coverage=AUTO_CALIBRATION_COVERAGE,
+                          hueMargin=AUTO_CALIBRATION_HUE_MARGIN, saturationMargin=AUTO_CALIBRATION_SATURATION_MARGIN,
+                          valueMargin=AUTO_CALIBRATION_VALUE_MARGIN, minSaturation=AUTO_CALIBRATION_MIN_SATURATION):
+    # HSV boundaries for the object around (x, y) of the frame, from the histograms of the pixels within radius.
+    # Brighter is always accepted, a light change mostly makes things darker or paler. Grey and white objects
+    # have no usable hue, they get the full hue range but no more saturation than the sample plus the margin,
+    # so coloured objects do not match them. A hue range that wraps through 0 has the lower hue above the upper
+    # one. Returns None outside the frame.
+    height, width = frame.shape[:2]
+    x, y = int(round(x)), int(round(y))
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+    left, top = max(0, x - radius), max(0, y - radius)
+    patch = frame[top:min(height, y + radius + 1), left:min(width, x + radius + 1)]
+    mask = np.zeros(patch.shape[:2], np.uint8)
+    cv2.circle(mask, (x - left, y - top), radius, 255, -1)
+    pixels = cv2.cvtColor(patch, cv2.COLOR_BGR2HSV)[mask > 0]
+    saturation = histogramRange(pixels[:, 1], 256, coverage)
+    value = histogramRange(pixels[:, 2], 256, coverage)
+    if np.median(pixels[:, 1]) < minSaturation:
+        lowerHue, upperHue = 0, 255
+        upperSaturation = min(255, saturation[1] + saturationMargin)
+    else:
+        lowerHue, upperHue = hueRange(pixels[:, 0], coverage, hueMargin)
+        upperSaturation = 255
+    lowerBoundary = (lowerHue, max(0, saturation[0] - saturationMargin), max(0, value[0] - valueMargin))
+    upperBoundary = (upperHue, upperSaturation, 255)
+    return lowerBoundary, upperBoundary
@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import numpy as np
+from Constants import *
+from Processing.ProcessFrame import getTableHomography, buildWarpMaps, buildThresholdLUT, buildPlayfieldMask
+
+
+class CalibrationProfile:
+    # Everything that has to be tuned for one table and one lighting setup.
+    # The values are stored in <name>.json, the artefacts built from them in <name>.npz.
+    # The intercept table is too big to be loaded with the others, it is a separate file that is memory-mapped.
+    def __init__(self, name):
+        self.name = name
+        self.tableCorners = [(TABLE_CORNER_TOP_LEFT_X, TABLE_CORNER_TOP_LEFT_Y),
+                             (TABLE_CORNER_TOP_RIGHT_X, TABLE_CORNER_TOP_RIGHT_Y),
+                             (TABLE_CORNER_BOTTOM_RIGHT_X, TABLE_CORNER_BOTTOM_RIGHT_Y),
+                             (TABLE_CORNER_BOTTOM_LEFT_X, TABLE_CORNER_BOTTOM_LEFT_Y)]
+        self.puckLowerBoundary = (CAMERA_LOWER_HUE, CAMERA_LOWER_SATURATION, CAMERA_LOWER_VALUE)
+        self.puckUpperBoundary = (CAMERA_UPPER_HUE, CAMERA_UPPER_SATURATION, CAMERA_UPPER_VALUE)
+        self.robotLowerBoundary = (CAMERA_ROBOT_LOWER_HUE, CAMERA_ROBOT_LOWER_SATURATION, CAMERA_ROBOT_LOWER_VALUE)
+        self.robotUpperBoundary = (CAMERA_ROBOT_UPPER_HUE, CAMERA_ROBOT_UPPER_SATURATION, CAMERA_ROBOT_UPPER_VALUE)
+        self.opponentLowerBoundary = (CAMERA_OPPONENT_LOWER_HUE, CAMERA_OPPONENT_LOWER_SATURATION,
+                                      CAMERA_OPPONENT_LOWER_VALUE)
+        self.opponentUpperBoundary = (CAMERA_OPPONENT_UPPER_HUE, CAMERA_OPPONENT_UPPER_SATURATION,
+                                      CAMERA_OPPONENT_UPPER_VALUE)
+        self.speedThreshold = SPEED_THRESHOLD
+        self.defensiveLine = DEFENSIVE_LINE
+        self.stepperOffset = (STEPPER_OFFSET_X, STEPPER_OFFSET_Y)
+        self.stepperStretchX = STEPPER_STRETCH_X
+        # Size of the warped image, the table is stretched to fill it.
+        self.warpSize = (CAMERA_FRAME_HEIGHT, CAMERA_FRAME_WIDTH)
+        # Precomputed artefacts with the key of the values they were built from.
+        self.artefacts = {}
+        self.artefactKeys = {}
+
+    def toDict(self):
+        return {
+            "tableCorners": [list(corner) for corner in self.tableCorners],
+            "puckLowerBoundary": list(self.puckLowerBoundary),
+            "puckUpperBoundary": list(self.puckUpperBoundary),
+            "robotLowerBoundary": list(self.robotLowerBoundary),
+            "robotUpperBoundary": list(self.robotUpperBoundary),
+            "opponentLowerBoundary": list(self.opponentLowerBoundary),
+            "opponentUpperBoundary": list(self.opponentUpperBoundary),
+            "speedThreshold": self.speedThreshold,
+            "defensiveLine": self.defensiveLine,
+            "stepperOffset": list(self.stepperOffset),
+            "stepperStretchX": self.stepperStretchX,
+        }
+
+    def updateFromDict(self, values):
+        # Unknown keys are ignored and missing keys keep their value, so old profiles still load.
+        if "tableCorners" in values:
+            self.tableCorners = [tuple(corner) for corner in values["tableCorners"]]
+        for key in ("puckLowerBoundary", "puckUpperBoundary", "robotLowerBoundary", "robotUpperBoundary",
+                    "opponentLowerBoundary", "opponentUpperBoundary", "stepperOffset"):
+            if key in values:
+                setattr(self, key, tuple(values[key]))
+        for key in ("speedThreshold", "defensiveLine", "stepperStretchX"):
+            if key in values:
+                setattr(self, key, values[key])
+
+    def setTableCorners(self, corners):
+        self.tableCorners = [tuple(corner) for corner in corners]
+
+    def setBoundaries(self, puckLowerBoundary, puckUpperBoundary, robotLowerBoundary, robotUpperBoundary,
+                      opponentLowerBoundary=None, opponentUpperBoundary=None):
+        # The opponent boundaries are kept if they are not given.
+        self.puckLowerBoundary = tuple(int(value) for value in puckLowerBoundary)
+        self.puckUpperBoundary = tuple(int(value) for value in puckUpperBoundary)
+        self.robotLowerBoundary = tuple(int(value) for value in robotLowerBoundary)
+        self.robotUpperBoundary = tuple(int(value) for value in robotUpperBoundary)
+        if opponentLowerBoundary is not None:
+            self.opponentLowerBoundary = tuple(int(value) for value in opponentLowerBoundary)
+        if opponentUpperBoundary is not None:
+            self.opponentUpperBoundary = tuple(int(value) for value in opponentUpperBoundary)
+
+    def getBoundaries(self):
+        # Order of the objects is the bit order of the threshold LUT.
+        return [(self.puckLowerBoundary, self.puckUpperBoundary),
+                (self.robotLowerBoundary, self.robotUpperBoundary),
+                (self.opponentLowerBoundary, self.opponentUpperBoundary)]
+
+    def targetToSteps(self, x, y, velocityX=0.0, velocityY=0.0):
+        # Pixels of the warped frame to steps of the motors, the robot is mirrored in X.
+        # Velocities in pixels per second become steps per second.
+        xScale = TABLE_MAX_X / CAMERA_FRAME_HEIGHT
+        yScale = TABLE_MAX_Y / CAMERA_FRAME_ROBOT_MAX_Y
+        return self.calibrateSteps(TABLE_MAX_X - x * xScale, y * yScale, -velocityX * xScale, velocityY * yScale)
+
+    def calibrateSteps(self, x, y, velocityX=0.0, velocityY=0.0):
+        # Stepper offset and stretch for positions that are already in steps, like the manual moves.
+        x += (x - TABLE_MAX_X / 2) * self.stepperStretchX + self.stepperOffset[0]
+        y += self.stepperOffset[1]
+        return x, y, velocityX * (1 + self.stepperStretchX), velocityY
+
+    def stepsToTarget(self, x, y):
+        # Inverse of targetToSteps, where the motors put the robot in pixels of the warped frame.
+        x = (x - self.stepperOffset[0] + TABLE_MAX_X / 2 * self.stepperStretchX) / (1 + self.stepperStretchX)
+        return (TABLE_MAX_X - x) * CAMERA_FRAME_HEIGHT / TABLE_MAX_X, \
+            (y - self.stepperOffset[1]) * CAMERA_FRAME_ROBOT_MAX_Y / TABLE_MAX_Y
+
+    def getHomography(self):
+        return self.getArtefact("homography", self.getWarpKey(), self.buildHomography)
+
+    def getWarpMaps(self):
+        key = self.getWarpKey()
+        if self.artefactKeys.get("warpMap1") != key or self.artefactKeys.get("warpMap2") != key:
+            warpMap1, warpMap2 = buildWarpMaps(self.getHomography(), self.warpSize[0], self.warpSize[1])
+            self.setArtefact("warpMap1", key, warpMap1)
+            self.setArtefact("warpMap2", key, warpMap2)
+        return self.artefacts["warpMap1"], self.artefacts["warpMap2"]
+
+    def getPlayfieldMask(self):
+        return self.getArtefact("playfieldMask", self.hashValues([self.tableCorners, self.warpSize, PLAYFIELD_MARGIN]),
+                                lambda: buildPlayfieldMask(self.tableCorners, self.getHomography(),
+                                                           self.warpSize[0], self.warpSize[1], PLAYFIELD_MARGIN))
+
+    def getThresholdLUT(self):
+        return self.getArtefact("thresholdLUT", self.getThresholdKey(),
+                                lambda: buildThresholdLUT(self.getBoundaries()))
+
+    def buildHomography(self):
+        return getTableHomography(self.tableCorners, self.warpSize[0], self.warpSize[1])
+
+    def getArtefact(self, name, key, build):
+        # Rebuild only if the values changed since the artefact was built or loaded.
+        if self.artefactKeys.get(name) != key:
+            self.setArtefact(name, key, build())
+        return self.artefacts[name]
+
+    def setArtefact(self, name, key, artefact):
+        self.artefacts[name] = artefact
+        self.artefactKeys[name] = key
+
+    def getWarpKey(self):
+        return self.hashValues([self.tableCorners, self.warpSize])
+
+    def getThresholdKey(self):
+        return self.hashValues(self.getBoundaries())
+
+    def hashValues(self, values):
+        return hashlib.sha1(json.dumps(values).encode()).hexdigest()
+
+    def save(self, directory=CALIBRATION_PROFILE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, self.name + ".json"), "w") as file:
+            json.dump(self.toDict(), file, indent=4)
+        # Make sure the artefacts match the saved values before writing them.
+        self.getWarpMaps()
+        self.getThresholdLUT()
+        self.getPlayfieldMask()
+        arrays = {}
+        for name, artefact in self.artefacts.items():
+            arrays[name] = artefact
+            arrays[name + "Key"] = np.array(self.artefactKeys[name])
+        np.savez(os.path.join(directory, self.name + ".npz"), **arrays)
+
+    @staticmethod
+    def load(name, directory=CALIBRATION_PROFILE_DIR):
+        # A missing profile gives the defaults from Constants.py.
+        profile = CalibrationProfile(name)
+        valuesPath = os.path.join(directory, name + ".json")
+        if os.path.exists(valuesPath):
+            with open(valuesPath) as file:
+                profile.updateFromDict(json.load(file))
+        artefactsPath = os.path.join(directory, name + ".npz")
+        if os.path.exists(artefactsPath):
+            with np.load(artefactsPath) as arrays:
+                for key in arrays.files:
+                    if key.endswith("Key"):
+                        continue
+                    profile.artefacts[key] = arrays[key]
+                    profile.artefactKeys[key] = str(arrays[key + "Key"])
+        return profile
+
+    @staticmethod
+    def listProfiles(directory=CALIBRATION_PROFILE_DIR):
+        if not os.path.isdir(directory):
+            return []
+        return sorted(file[:-len(".json")] for file in os.listdir(directory) if file.endswith(".json"))
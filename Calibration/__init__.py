@@ -0,0 +1,9 @@
+from .CalibrationProfile import CalibrationProfile
+
+
+def __getattr__(name):
+    # The automatic calibration is only needed when it is started, it is imported on first use.
+    if name in ("findTableCorners", "colourRangeFromSample"):
+        from . import AutoCalibration
+        return getattr(AutoCalibration, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
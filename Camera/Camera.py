@@ -1,34 +1,118 @@
 import cv2
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from queue import Queue
+from threading import Thread, Event, Lock
 import time
 import platform
 import numpy as np
+from Runtime import pinCurrentThread, raiseCurrentThreadPriority
+
+
+def orientFrame(frame):
+    # The table corners of the profiles are in this view, the frames of the camera and of recordings need it.
+    frame = cv2.rotate(frame, rotateCode=cv2.ROTATE_90_CLOCKWISE)
+    frame = cv2.flip(frame, 1)  # Flip horizontally
+    # Flip again to mirror so the bot starts in the top right corner.
+    frame = cv2.flip(frame, 1)
+    return frame
 
 
 class Camera:
     def __init__(
-            self, camera_index, frame_width, frame_height, focus, buffer_size, fps
+            self, camera_index, frame_width, frame_height, focus, buffer_size, fps, fourcc=None, decode_threads=0
     ):
+        self.camera_index = camera_index
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.focus = focus
+        self.buffer_size = buffer_size
         self.fps = fps
+        self.fourcc = fourcc
+        self.decode_threads = decode_threads
+        # The stream is opened in the capture thread so creating the camera does not block the UI.
+        self.stream = None
+        self.grabbed = False
+        self.frame = None
+        # Wall clock time the current frame was grabbed.
+        self.frame_timestamp = 0.0
+        self.opened = Event()
+        self.stopped = False
+        self.new_frame = False
+        # Set when the camera delivers undecoded JPEG data which is decoded by the pool.
+        self.raw_mjpg = False
+        # Frames that are being decoded, oldest first. A frame is only submitted while one of the decoders is
+        # free, the others wait in a single slot where a newer frame replaces an older one, so a slow decoder
+        # drops the oldest frames instead of lagging behind.
+        self.decoding = Queue()
+        self.pool = None
+        self.free_decoders = decode_threads
+        self.waiting = None
+        self.decode_lock = Lock()
+        # Warnings for the user, the caller takes them with take_warnings() and shows them.
+        self.warnings = deque()
+        # Counters for get_rates().
+        self.captured = 0
+        self.decoded = 0
+        self.dropped = 0
+        self.rate_time = time.time()
+        self.rate_counts = (0, 0)
+        # Real-time mode. The capture thread runs on cpu_cores, the decoder threads on decode_cores, or on
+        # cpu_cores as well if they are not set.
+        self.cpu_cores = None
+        self.decode_cores = None
+        self.priority = None
+
+    def open(self):
         # Check if we are running on windows because then we need the CAP_DSHOW flag.
         if platform.system() == "Windows":
-            self.stream = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+            self.stream = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)
         else:
-            self.stream = cv2.VideoCapture(camera_index)
+            self.stream = cv2.VideoCapture(self.camera_index)
+        # The pixel format has to be set before the size, otherwise the driver picks the size for the old format.
+        if self.fourcc is not None:
+            self.stream.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
         self.stream.set(cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY)
-        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, frame_width)
-        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_height)
-        self.stream.set(cv2.CAP_PROP_FPS, fps)
-        self.stream.set(cv2.CAP_PROP_FOCUS, focus)
-        self.stream.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        self.stream.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
+        self.stream.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
+        self.stream.set(cv2.CAP_PROP_FPS, self.fps)
+        self.stream.set(cv2.CAP_PROP_FOCUS, self.focus)
+        self.stream.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        if self.fourcc is not None and self.get_fourcc() != self.fourcc:
+            self.warnings.append(f"WARNING: Camera does not support {self.fourcc}, using {self.get_fourcc()}.")
+        if self.decode_threads > 0 and self.get_fourcc() == "MJPG" and not self.is_file():
+            # Let retrieve() return the JPEG data so it can be decoded in parallel.
+            # Backends that ignore this still return decoded frames, they are used as they are.
+            self.raw_mjpg = self.stream.set(cv2.CAP_PROP_CONVERT_RGB, 0)
         (self.grabbed, self.frame) = self.stream.read()
-        self.stopped = False
-        self.new_frame = False
+        if self.grabbed and self.frame.ndim < 3:
+            self.frame = self.decode(self.frame)
+        self.opened.set()
+
+    def is_file(self):
+        # A recorded video instead of a camera. It is decoded by the backend and replayed at the frame rate.
+        return isinstance(self.camera_index, str)
+
+    def get_fourcc(self):
+        code = int(self.stream.get(cv2.CAP_PROP_FOURCC))
+        return "".join(chr((code >> shift) & 0xFF) for shift in (0, 8, 16, 24))
 
     def start(self):
-        Thread(target=self.get_next_frame, args=()).start()
+        Thread(target=self.run, args=(), daemon=True).start()
         return self
 
+    def run(self):
+        if self.cpu_cores is not None:
+            pinCurrentThread(self.cpu_cores)
+        if self.priority is not None:
+            raiseCurrentThreadPriority(self.priority)
+        self.open()
+        if self.decode_threads > 0 and not self.is_file():
+            Thread(target=self.deliver_frames, args=(), daemon=True).start()
+            self.capture_frames()
+        else:
+            self.get_next_frame()
+
     def get_current_frame(self):
         self.new_frame = False
         return self.frame
@@ -42,18 +126,105 @@ class Camera:
                 self.stop()
             else:
                 (self.grabbed, tmp_frame) = self.stream.read()
-                tmp_frame = cv2.rotate(
-                    tmp_frame, rotateCode=cv2.ROTATE_90_CLOCKWISE)
-                tmp_frame = cv2.flip(tmp_frame, 1)  # Flip horizontally
-                # Flip again to mirror so the bot starts in the top right corner.
-                tmp_frame = cv2.flip(tmp_frame, 1)
-                self.frame = tmp_frame
+                frame_timestamp = time.time()
+                if not self.grabbed:
+                    continue
+                self.captured += 1
+                self.frame = self.orient(tmp_frame)
+                self.frame_timestamp = frame_timestamp
+                self.decoded += 1
                 self.new_frame = True
             elapsed_time = time.time() - start_time
             time.sleep(max(0, frame_time - elapsed_time))
 
+    def capture_frames(self):
+        # grab() waits for the next frame of the driver and is all this loop does besides handing the data
+        # to the decoder pool, so the capture rate is only limited by the camera.
+        pool = self.pool = ThreadPoolExecutor(self.decode_threads, initializer=self.start_decoder)
+        while not self.stopped:
+            if not self.stream.grab():
+                self.stop()
+                break
+            frame_timestamp = time.time()
+            self.captured += 1
+            grabbed, data = self.stream.retrieve()
+            if not grabbed:
+                continue
+            with self.decode_lock:
+                if self.free_decoders > 0:
+                    self.free_decoders -= 1
+                    self.decoding.put((pool.submit(self.decode, data), frame_timestamp))
+                else:
+                    if self.waiting is not None:
+                        self.dropped += 1
+                    self.waiting = (data, frame_timestamp)
+        with self.decode_lock:
+            # Nothing is submitted after the end marker.
+            if self.waiting is not None:
+                self.dropped += 1
+            self.waiting = None
+            self.decoding.put(None)
+        pool.shutdown(wait=False)
+
+    def start_decoder(self):
+        # The decoder threads inherit the cores of the capture thread, move them off so they cannot delay grab().
+        if self.decode_cores is not None:
+            pinCurrentThread(self.decode_cores)
+
+    def deliver_frames(self):
+        # Takes the decoded frames in the order they were grabbed.
+        while True:
+            item = self.decoding.get()
+            if item is None:
+                break
+            future, frame_timestamp = item
+            frame = future.result()
+            with self.decode_lock:
+                # The decoder is free again, it takes the waiting frame if there is one.
+                if self.waiting is not None:
+                    data, waiting_timestamp = self.waiting
+                    self.waiting = None
+                    self.decoding.put((self.pool.submit(self.decode, data), waiting_timestamp))
+                else:
+                    self.free_decoders += 1
+            if frame is None:
+                self.dropped += 1
+                continue
+            self.frame = frame
+            self.frame_timestamp = frame_timestamp
+            self.decoded += 1
+            self.new_frame = True
+
+    def decode(self, data):
+        if data.ndim < 3:
+            data = cv2.imdecode(data.reshape(-1), cv2.IMREAD_COLOR)
+            if data is None:
+                return None
+        return self.orient(data)
+
+    def orient(self, frame):
+        return orientFrame(frame)
+
+    def take_warnings(self):
+        # Warnings since the last call, oldest first.
+        warnings = []
+        while self.warnings:
+            warnings.append(self.warnings.popleft())
+        return warnings
+
+    def get_rates(self):
+        # Captured and decoded frames per second since the last call.
+        now = time.time()
+        elapsed = max(now - self.rate_time, 1e-6)
+        captured, decoded = self.rate_counts
+        rates = ((self.captured - captured) / elapsed, (self.decoded - decoded) / elapsed)
+        self.rate_time = now
+        self.rate_counts = (self.captured, self.decoded)
+        return rates
+
     def stop(self):
         self.stopped = True
 
     def __del__(self):
-        self.stream.release()
+        if self.stream is not None:
+            self.stream.release()
@@ -1 +1,2 @@
 from .Camera import Camera
+from .Camera import orientFrame
@@ -14,6 +14,14 @@ CAMERA_ROBOT_UPPER_HUE = 255
 CAMERA_ROBOT_UPPER_SATURATION = 255
 CAMERA_ROBOT_UPPER_VALUE = 255
 
+# The opponent's mallet. It has no sliders, tune it in the calibration profile.
+CAMERA_OPPONENT_LOWER_HUE = 100
+CAMERA_OPPONENT_LOWER_SATURATION = 100
+CAMERA_OPPONENT_LOWER_VALUE = 40
+CAMERA_OPPONENT_UPPER_HUE = 130
+CAMERA_OPPONENT_UPPER_SATURATION = 255
+CAMERA_OPPONENT_UPPER_VALUE = 255
+
 CAMERA_INDEX = 2
 CAMERA_FRAME_WIDTH = 640
 CAMERA_FRAME_HEIGHT = 360
@@ -21,16 +29,75 @@ CAMERA_FRAME_ROBOT_MAX_Y = 270
 CAMERA_FRAMERATE = 90
 CAMERA_FOCUS = 1
 CAMERA_BUFFERSIZE = 2
+# Pixel format requested from the camera. MJPG is needed for high frame rates over USB, None keeps the driver default.
+CAMERA_FOURCC = "MJPG"
+# Threads that decode the JPEG frames so grabbing never waits for decoding. 0 decodes in the capture thread.
+CAMERA_DECODE_THREADS = 2
+# Exposure time in seconds. Has to match the camera setting, it turns the length of a motion blur streak into a speed.
+CAMERA_EXPOSURE_TIME = 0.008
 
 STEPPER_COM_PORT = "COM3"
 STEPPER_BAUDRATE = 115200
+# Seconds to wait for the answer to CALIBRATE, homing both axes four times takes several seconds.
+STEPPER_HOMING_TIMEOUT = 20
+# Seconds to wait for the Arduino to report ready after opening the port. After power-on the firmware homes first.
+STEPPER_READY_TIMEOUT = STEPPER_HOMING_TIMEOUT
+# Correction applied to every target before it is sent. X is stretched away from the middle of the table.
+STEPPER_OFFSET_X = 0
+STEPPER_OFFSET_Y = -50
+STEPPER_STRETCH_X = 1 / 9
+# Targets closer than this to the last one in stepper units are not sent.
+STEPPER_DEADBAND = 50
+# Streaming mode: the latest setpoint is sent STEPPER_STREAM_RATE times per second without waiting for an answer,
+# and the firmware reports its position every STEPPER_STATUS_INTERVAL seconds. No deadband is applied.
+STEPPER_STREAM_ENABLED = False
+STEPPER_STREAM_RATE = 200
+STEPPER_STATUS_INTERVAL = 0.02
+# The firmware brakes if no setpoint came for this many seconds, and extrapolates a setpoint for no longer.
+STEPPER_STREAM_TIMEOUT = 0.1
+STEPPER_STREAM_SEQUENCE_MODULO = 65536
+# Port name that connects to StepperEmulator instead of the Arduino.
+STEPPER_EMULATOR_PORT = "EMULATOR"
+# Seconds the emulated firmware takes to home after a reset and for CALIBRATE.
+STEPPER_EMULATOR_HOMING_TIME = 0.3
+# Limits of the motors in steps and steps per second, see defines.h of the firmware.
+STEPPER_MAX_SPEED = 8000
+STEPPER_MAX_ACCELERATION = 15000
 
 TABLE_MAX_X = 1885
 TABLE_MAX_Y = 1820
 
 SPEED_THRESHOLD = 20
 
-MAX_PUCK_POSITION_BUFFER = 10
+# Blob detection. Radii are in pixels of the warped frame.
+PUCK_MIN_RADIUS = 5
+PUCK_MAX_RADIUS = 30
+ROBOT_MIN_RADIUS = 10
+ROBOT_MAX_RADIUS = 50
+OPPONENT_MIN_RADIUS = 10
+OPPONENT_MAX_RADIUS = 50
+# Blobs further than this from the predicted position get a much lower score.
+DETECTION_MAX_JUMP = 120
+DETECTION_MIN_CONFIDENCE = 0.2
+# Size of the median filter that removes noise from the masks. Has to be odd.
+DETECTION_BLUR_SIZE = 19
+# Pixels along the table edges that are not searched, they only show rails and goal mouths.
+PLAYFIELD_MARGIN = 4
+# Detection is skipped while nothing moves in a frame downscaled by MOTION_SCALE. A pixel moved if its grey value
+# changed by more than MOTION_THRESHOLD, and at least MOTION_MIN_PIXELS have to move.
+# Every MOTION_REFRESH_FRAMES frames the detection runs anyway.
+MOTION_GATE_ENABLED = True
+MOTION_SCALE = 8
+MOTION_THRESHOLD = 12
+MOTION_MIN_PIXELS = 2
+MOTION_REFRESH_FRAMES = 30
+# Motion blur streaks. Streaks shorter than this many puck radii are treated as a puck standing still.
+STREAK_MIN_LENGTH = 1.5
+STREAK_MAX_ELONGATION = 4
+
+# Number of frames kept in the track history and used to fit velocities.
+TRACK_BUFFER_SIZE = 256
+TRACK_VELOCITY_WINDOW = 3
 
 TABLE_CORNER_TOP_LEFT_X = 42
 TABLE_CORNER_TOP_LEFT_Y = 66
@@ -46,5 +113,139 @@ TABLE_CORNER_BOTTOM_LEFT_Y = 551
 
 DEFENSIVE_LINE = 20
 
+# Strategy that decides where the robot goes, see Strategy/__init__.py.
+STRATEGY = "default"
+# Time one strategy update may take in seconds.
+STRATEGY_BUDGET = 0.001
+# The reflected path after a wall hit is steepened by this factor.
+STRATEGY_REFLECTION_FACTOR = 2.5
+# Wall hits followed when predicting the intercept, every hit steepens the path further.
+STRATEGY_MAX_BOUNCES = 4
+# Predictions closer than this to a side wall in pixels are not sent to the robot.
+STRATEGY_EDGE_GUARD = 50
+# Hit slow pucks in our half instead of only defending.
+STRATEGY_ATTACK_ENABLED = False
+# Distance in pixels at which the robot counts as back home.
+STRATEGY_HOME_TOLERANCE = 15
+# Contacts between the opponent's mallet and the puck are predicted this many seconds ahead.
+CONTACT_HORIZON = 0.15
+# The mallet has to close in on the puck faster than this in pixels per second.
+CONTACT_MIN_CLOSING_SPEED = 200
+# Share of the closing speed the puck keeps after the hit.
+CONTACT_RESTITUTION = 0.8
+
+# Binary telemetry of every frame and command. One file per session in this directory.
+TELEMETRY_ENABLED = True
+TELEMETRY_DIR = "logs"
+TELEMETRY_QUEUE_SIZE = 4096
+
+# Automatic calibration. The table sides are the strong straight edges in the median of AUTO_CALIBRATION_FRAMES
+# frames closest to the current corners, each may have moved by up to AUTO_CALIBRATION_MAX_SHIFT pixels and turned
+# by up to AUTO_CALIBRATION_MAX_TILT degrees. Only the AUTO_CALIBRATION_MAX_LINES strongest lines are considered.
+AUTO_CALIBRATION_FRAMES = 5
+AUTO_CALIBRATION_CANNY_LOW = 50
+AUTO_CALIBRATION_CANNY_HIGH = 150
+AUTO_CALIBRATION_HOUGH_THRESHOLD = 80
+AUTO_CALIBRATION_MAX_LINES = 60
+AUTO_CALIBRATION_MAX_SHIFT = 60
+AUTO_CALIBRATION_MAX_TILT = 10
+# If a side moved further, the largest four-sided outline of at least AUTO_CALIBRATION_MIN_AREA of the frame is
+# taken instead and its sides are fitted the same way.
+AUTO_CALIBRATION_MIN_AREA = 0.2
+# Colour ranges come from the pixels within AUTO_CALIBRATION_SAMPLE_RADIUS of a click. The middle
+# AUTO_CALIBRATION_COVERAGE of each channel is kept and widened by the margins. Samples that are less
+# saturated than AUTO_CALIBRATION_MIN_SATURATION are taken as grey.
+AUTO_CALIBRATION_SAMPLE_RADIUS = 6
+AUTO_CALIBRATION_COVERAGE = 0.95
+AUTO_CALIBRATION_HUE_MARGIN = 6
+AUTO_CALIBRATION_SATURATION_MARGIN = 40
+AUTO_CALIBRATION_VALUE_MARGIN = 60
+AUTO_CALIBRATION_MIN_SATURATION = 50
+
+# Calibration profiles are stored as <name>.json and <name>.npz in this directory.
+CALIBRATION_PROFILE_DIR = "profiles"
+CALIBRATION_PROFILE = "default"
+
 FRAME_PUCK_OUTLINE_COLOR = (0, 0, 255)
 FRAME_ROBOT_OUTLINE_COLOR = (0, 255, 255)
+FRAME_OPPONENT_OUTLINE_COLOR = (255, 0, 0)
+
+# Simulated table used by the offline tools. Sizes in pixels of the warped frame, speeds in pixels per second.
+SIMULATION_PUCK_RADIUS = 12
+SIMULATION_ROBOT_RADIUS = 20
+SIMULATION_WALL_RESTITUTION = 0.9
+SIMULATION_MIN_SHOT_SPEED = 300
+SIMULATION_MAX_SHOT_SPEED = 2500
+# The steppers do 8000 steps/s and 15000 steps/s^2 with 1885 steps over the 360 px table width.
+SIMULATION_ROBOT_MAX_SPEED = 1500
+SIMULATION_ROBOT_MAX_ACCELERATION = 2800
+# Time from sending a command until the motors start moving in seconds.
+SIMULATION_COMMAND_LATENCY = 0.01
+# Standard deviation of the detected position in pixels.
+SIMULATION_POSITION_NOISE = 1.0
+
+# Real-time mode, also enabled with --realtime. The vision thread and the OpenCV threads run on the vision cores,
+# capture and serial on the capture cores and the JPEG decoders on the decode cores. Priority is for SCHED_RR
+# where the system allows it.
+REALTIME_ENABLED = False
+REALTIME_VISION_CORES = [2, 3]
+REALTIME_CAPTURE_CORES = [1]
+REALTIME_DECODE_CORES = [0]
+REALTIME_PRIORITY = 20
+# Seconds spent measuring the timer jitter at start.
+REALTIME_JITTER_TEST_TIME = 1.0
+
+# Several tables driven from one process with MultiTable.py. The tables are listed in this JSON file.
+MULTI_TABLE_CONFIG = "tables.json"
+# Vision workers shared by all tables, 0 for one per core.
+MULTI_TABLE_WORKERS = 0
+# Seconds between two looks for new frames.
+MULTI_TABLE_DISPATCH_INTERVAL = 0.0005
+# Seconds between two metrics reports.
+MULTI_TABLE_REPORT_INTERVAL = 5.0
+# Frames per table the time percentiles are computed over.
+MULTI_TABLE_METRICS_WINDOW = 600
+
+# Work is shed when frames take longer than DEGRADE_RATIO times the frame time for DEGRADE_FRAMES frames in a row,
+# and restored one level at a time after RESTORE_FRAMES frames below RESTORE_RATIO times the frame time.
+QUALITY_GOVERNOR_ENABLED = True
+QUALITY_DEGRADE_RATIO = 1.0
+QUALITY_DEGRADE_FRAMES = 5
+QUALITY_RESTORE_RATIO = 0.5
+QUALITY_RESTORE_FRAMES = 90
+# Downscale factor of the frame at the coarse level.
+QUALITY_COARSE_SCALE = 2
+
+# HTTP preview with the annotated frame as MJPEG on /stream?fps=N and the state as JSON on /state.
+# Also enabled with --preview. Without the local display the Qt window shows no camera image.
+PREVIEW_ENABLED = False
+PREVIEW_HOST = "0.0.0.0"
+PREVIEW_PORT = 8080
+PREVIEW_JPEG_QUALITY = 70
+PREVIEW_DEFAULT_FPS = 15
+PREVIEW_MAX_FPS = 60
+LOCAL_DISPLAY_ENABLED = True
+
+# UDP datagram with the state of every frame for dashboards and recorders, see Telemetry/StateClient.py.
+# Sent to a broadcast address so any number of clients can listen, 127.255.255.255 stays on this machine
+# and an address like 192.168.1.255 reaches the whole LAN.
+BROADCAST_ENABLED = False
+BROADCAST_ADDRESS = "127.255.255.255"
+BROADCAST_PORT = 5005
+
+# Batch processing of recorded video. Every worker process gets chunks of this many frames.
+BATCH_CHUNK_FRAMES = 2000
+# Frames before a chunk that are processed again so the track and the strategy start warmed up.
+BATCH_CHUNK_OVERLAP = 30
+
+# Benchmarks, see Tools/Benchmark.py. A case is a regression if its median is this much slower than the baseline.
+BENCHMARK_FRAMES = 32
+BENCHMARK_MIN_TIME = 0.5
+BENCHMARK_MIN_ITERATIONS = 50
+BENCHMARK_REGRESSION_THRESHOLD = 0.1
+# Cases with a baseline median below this many microseconds are compared by their minimum, their median is noise.
+# Even the minimum of such a case moves by up to 30 % between runs, they get a threshold of their own.
+BENCHMARK_FAST_CASE_US = 20
+BENCHMARK_FAST_CASE_THRESHOLD = 0.5
+# Written with --save-baseline on the machine that runs the comparison, not part of the repository.
+BENCHMARK_BASELINE = "benchmark-baseline.json"
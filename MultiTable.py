@@ -0,0 +1,69 @@
+# Drives several tables from one process without the GUI and reports the metrics of every table.
+# Usage: python MultiTable.py --config tables.json --realtime
+import sys
+import json
+import argparse
+from Constants import *
+from Runtime import enableRealTime
+from Tables import TableRuntime, loadTableConfigs
+
+
+def printMetrics(metrics):
+    print(f"{'table':<12} {'link':>5} {'fps':>6} {'frames':>8} {'dropped':>8} {'errors':>6} {'ms':>6} "
+          f"{'p99 ms':>7} {'lat ms':>7} {'p99 lat':>7} {'level':>10} {'state':>12}")
+    for table in metrics:
+        link = {None: "...", True: "ok", False: "none"}[table["connected"]]
+        print(f"{table['name']:<12} {link:>5} {table['fps']:6.1f} {table['frames']:8d} {table['dropped']:8d} "
+              f"{table['errors']:6d} {table['processingMeanMs']:6.1f} {table['processingP99Ms']:7.1f} "
+              f"{table['latencyMeanMs']:7.1f} {table['latencyP99Ms']:7.1f} {table['level']:>10} "
+              f"{table['state']:>12}")
+        for warning in table["warnings"]:
+            print(f"{'':<12} {warning}")
+        if table["lastError"] is not None:
+            print(f"{'':<12} last error: {table['lastError']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive several tables from one process.")
+    parser.add_argument("--config", default=MULTI_TABLE_CONFIG, help="JSON file listing the tables.")
+    parser.add_argument("--workers", type=int, default=MULTI_TABLE_WORKERS,
+                        help="Vision workers shared by all tables, 0 for one per core.")
+    parser.add_argument("--realtime", action="store_true", default=REALTIME_ENABLED,
+                        help="Pin threads to cores, raise the priority and lock memory where permitted.")
+    parser.add_argument("--report-interval", type=float, default=MULTI_TABLE_REPORT_INTERVAL)
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds.")
+    parser.add_argument("--metrics-log", help="Append every report as a JSON line to this file.")
+    args = parser.parse_args()
+
+    try:
+        configs = loadTableConfigs(args.config)
+    except (OSError, ValueError, KeyError) as error:
+        print(f"ERROR: Cannot load the tables from {args.config}: {error!r}")
+        return 1
+    if args.realtime:
+        # Before any thread is started so they all inherit the core mask.
+        messages, _ = enableRealTime(REALTIME_VISION_CORES, REALTIME_PRIORITY, 1 / CAMERA_FRAMERATE,
+                                     REALTIME_JITTER_TEST_TIME)
+        for message in messages:
+            print(message)
+
+    def report(metrics):
+        printMetrics(metrics)
+        if args.metrics_log:
+            with open(args.metrics_log, "a") as file:
+                file.write(json.dumps(metrics) + "\n")
+
+    runtime = TableRuntime(configs, args.workers, args.realtime)
+    print(f"Driving {len(configs)} tables with {runtime.workers} vision workers.")
+    runtime.start()
+    try:
+        runtime.run(report, args.report_interval, args.duration)
+    except KeyboardInterrupt:
+        pass
+    runtime.stop()
+    report(runtime.getMetrics())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import cv2
+import json
+import math
+import time
+from enum import Enum
+from threading import Thread, Condition
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+STREAM_BOUNDARY = "frame"
+INDEX_PAGE = b"""<!DOCTYPE html>
+<html><head><title>Rocky Hockey</title></head>
+<body style="background:#222;color:#ddd;font-family:monospace">
+<img src="/stream" style="float:left;margin-right:16px">
+<pre id="state"></pre>
+<script>
+setInterval(() => fetch("/state").then(r => r.json()).then(s => {
+    document.getElementById("state").textContent = JSON.stringify(s, null, 2);
+}), 200);
+</script>
+</body></html>
+"""
+
+
+def toJSON(value):
+    # Namedtuples, enums and NaN as they should look in JSON.
+    if hasattr(value, "_asdict"):
+        return {key: toJSON(item) for key, item in value._asdict().items()}
+    if isinstance(value, dict):
+        return {key: toJSON(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [toJSON(item) for item in value]
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if hasattr(value, "item"):
+        # NumPy scalars.
+        return toJSON(value.item())
+    return value
+
+
+class PreviewServer:
+    # Serves the annotated frame as MJPEG stream on /stream and the current state as JSON on /state.
+    # publish() only keeps references, so the frame loop pays nothing for it. The frames are encoded on a
+    # worker thread, only while a stream client is connected and only as often as the fastest client asks for.
+    def __init__(self, host, port, quality=70, defaultFps=15, maxFps=60):
+        self.host = host
+        self.port = port
+        self.quality = quality
+        self.defaultFps = defaultFps
+        self.maxFps = maxFps
+        self.server = None
+        self.condition = Condition()
+        self.frame = None
+        self.frameNumber = 0
+        self.state = {}
+        # Latest encoded frame and the number of the frame it was encoded from.
+        self.jpeg = None
+        self.jpegNumber = 0
+        # Requested frame rate of every connected stream client.
+        self.clients = {}
+        self.stopped = False
+
+    def start(self):
+        preview = self
+
+        class Handler(PreviewRequestHandler):
+            server_preview = preview
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, args=(), daemon=True).start()
+        Thread(target=self.encode, args=(), daemon=True).start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def hasStreamClients(self):
+        return len(self.clients) > 0
+
+    def publish(self, frame, state):
+        # The frame must not be changed after it was published. state is converted to JSON only when asked for.
+        self.state = state
+        if not self.clients:
+            return
+        with self.condition:
+            self.frame = frame
+            self.frameNumber += 1
+            self.condition.notify_all()
+
+    def getStateJSON(self):
+        return json.dumps(toJSON(self.state)).encode()
+
+    def encode(self):
+        lastEncode = 0.0
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.clients or self.frameNumber == self.jpegNumber):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                frame = self.frame
+                frameNumber = self.frameNumber
+                fps = max(self.clients.values())
+            # Never encode faster than the fastest client reads.
+            delay = lastEncode + 1 / fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                continue
+            lastEncode = time.monotonic()
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                continue
+            with self.condition:
+                self.jpeg = jpeg.tobytes()
+                self.jpegNumber = frameNumber
+                self.condition.notify_all()
+
+    def addClient(self, client, fps):
+        with self.condition:
+            self.clients[client] = fps
+            self.condition.notify_all()
+
+    def removeClient(self, client):
+        with self.condition:
+            self.clients.pop(client, None)
+
+    def waitForJPEG(self, lastNumber, timeout):
+        # Returns the newest encoded frame once there is one newer than lastNumber.
+        with self.condition:
+            self.condition.wait_for(lambda: self.stopped or self.jpegNumber > lastNumber, timeout)
+            return self.jpeg, self.jpegNumber
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    server_preview = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/":
+            self.sendBody(INDEX_PAGE, "text/html")
+        elif url.path == "/state":
+            self.sendBody(self.server_preview.getStateJSON(), "application/json")
+        elif url.path == "/stream":
+            self.stream(parse_qs(url.query))
+        else:
+            self.send_error(404)
+
+    def sendBody(self, body, contentType):
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self, query):
+        preview = self.server_preview
+        try:
+            fps = float(query.get("fps", [preview.defaultFps])[0])
+        except ValueError:
+            fps = preview.defaultFps
+        fps = min(max(fps, 0.1), preview.maxFps)
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=" + STREAM_BOUNDARY)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        preview.addClient(self, fps)
+        lastNumber = 0
+        nextSend = time.monotonic()
+        try:
+            while not preview.stopped:
+                delay = nextSend - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                jpeg, number = preview.waitForJPEG(lastNumber, 1.0)
+                if jpeg is None or number == lastNumber:
+                    continue
+                lastNumber = number
+                nextSend = time.monotonic() + 1 / fps
+                self.wfile.write(f"--{STREAM_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            preview.removeClient(self)
+
+    def log_message(self, format, *args):
+        # Keep the console for the game.
+        pass
@@ -0,0 +1 @@
+from .PreviewServer import PreviewServer
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+from Constants import *
+
+
+class MotionGate:
+    # Decides if a frame is worth running the detection on, from the difference to the last frame
+    # in a strongly downscaled grey image. Costs a fraction of the detection.
+    def __init__(self, scale=MOTION_SCALE, threshold=MOTION_THRESHOLD, minPixels=MOTION_MIN_PIXELS,
+                 refreshFrames=MOTION_REFRESH_FRAMES):
+        self.scale = scale
+        self.threshold = threshold
+        self.minPixels = minPixels
+        self.refreshFrames = refreshFrames
+        self.lastSmall = None
+        # Downscaled playfield mask and the mask it was made from. The profile builds a new mask when the
+        # corners change, holding on to the old one keeps the identity check valid.
+        self.smallMask = None
+        self.smallMaskSource = None
+        self.skipped = 0
+
+    def reset(self):
+        self.lastSmall = None
+        self.smallMask = None
+        self.smallMaskSource = None
+        self.skipped = 0
+
+    def update(self, frame, mask=None):
+        # Returns True if something moved inside the mask or the detection has to be refreshed.
+        height, width = frame.shape[:2]
+        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (width // self.scale, height // self.scale),
+                           interpolation=cv2.INTER_AREA)
+        lastSmall = self.lastSmall
+        self.lastSmall = small
+        if lastSmall is None or lastSmall.shape != small.shape or self.skipped >= self.refreshFrames:
+            self.skipped = 0
+            return True
+        moved = cv2.compare(cv2.absdiff(small, lastSmall), self.threshold, cv2.CMP_GT)
+        if mask is not None:
+            if mask is not self.smallMaskSource or self.smallMask.shape != small.shape:
+                # A small pixel only counts if it lies completely on the playfield.
+                self.smallMask = cv2.resize(mask, (small.shape[1], small.shape[0]), interpolation=cv2.INTER_AREA)
+                self.smallMask = np.where(self.smallMask == 255, 255, 0).astype(np.uint8)
+                self.smallMaskSource = mask
+            moved = cv2.bitwise_and(moved, self.smallMask)
+        if cv2.countNonZero(moved) >= self.minPixels:
+            self.skipped = 0
+            return True
+        self.skipped += 1
+        return False
@@ -0,0 +1,162 @@
+import cv2
+import math
+from collections import namedtuple
+from Constants import *
+from Processing.ProcessFrame import findBestBlob, findPuckStreak, thresholdFrame, maskFromBits, warpFrame
+from Processing.TrackBuffer import TrackBuffer
+from Processing.MotionGate import MotionGate
+from Strategy import PuckState, RobotState, OpponentState
+from Runtime.QualityGovernor import QualityLevel
+
+# Result of one frame. Positions and velocities are in pixels of the warped frame, NaN if the object was not found.
+# puck, robot and opponent are the states handed to the strategy, None if the object was not found.
+Detection = namedtuple("Detection", [
+    "timestamp",
+    "puckX", "puckY", "puckRadius", "puckConfidence", "puckVelocityX", "puckVelocityY", "streak",
+    "robotX", "robotY", "robotRadius", "robotConfidence", "robotVelocityX", "robotVelocityY",
+    "opponentX", "opponentY", "opponentRadius", "opponentConfidence", "opponentVelocityX", "opponentVelocityY",
+    "puck", "robot", "opponent",
+])
+
+
+class VisionPipeline:
+    # Warp, threshold and detection of puck, robot and the opponent's mallet, one frame at a time.
+    # All three are thresholded in the same pass, they are the bits 0, 1 and 2 of the threshold LUT.
+    # Knows nothing about the GUI so the batch tools run exactly the same code as the live loop.
+    def __init__(self, profile, trackSize=TRACK_BUFFER_SIZE, motionGate=MOTION_GATE_ENABLED):
+        self.profile = profile
+        # Timestamped puck and robot positions of the last frames.
+        self.track = TrackBuffer(trackSize)
+        # Skips the detection while nothing on the table moves, None to detect every frame.
+        self.motionGate = MotionGate() if motionGate else None
+        self.lastDetection = None
+        self.skippedFrames = 0
+
+    def reset(self):
+        self.track.clear()
+        self.lastDetection = None
+        if self.motionGate is not None:
+            self.motionGate.reset()
+
+    def warp(self, frame):
+        # The remap tables are built from the corners once and kept in the profile.
+        return warpFrame(frame, self.profile.getWarpMaps())
+
+    def detect(self, frame, timestamp, level=QualityLevel.FULL, warped=True):
+        # The quality level decides how much of the frame is searched, see Runtime/QualityGovernor.py.
+        # Only a warped frame is limited to the playfield, the mask does not fit the camera image.
+        mask = self.profile.getPlayfieldMask() if warped else None
+        if self.motionGate is not None and self.lastDetection is not None \
+                and not self.motionGate.update(frame, mask):
+            self.skippedFrames += 1
+            return self.repeatDetection(timestamp)
+        lastPuckPosition = self.getLastPosition("puckX", "puckY")
+        # Only the puck is searched from the ROI level on, so the frame can be cut down before thresholding.
+        # Offset and scale map positions in the searched image back to the warped frame.
+        offsetX = offsetY = 0
+        scale = 1
+        if level.value >= QualityLevel.ROI.value and lastPuckPosition is not None:
+            # Everything further away than the maximum jump would hardly score anyway.
+            reach = DETECTION_MAX_JUMP + PUCK_MAX_RADIUS
+            height, width = frame.shape[:2]
+            offsetX = max(0, int(lastPuckPosition[0]) - reach)
+            offsetY = max(0, int(lastPuckPosition[1]) - reach)
+            frame = frame[offsetY:min(height, int(lastPuckPosition[1]) + reach),
+                          offsetX:min(width, int(lastPuckPosition[0]) + reach)]
+            if mask is not None:
+                mask = mask[offsetY:offsetY + frame.shape[0], offsetX:offsetX + frame.shape[1]]
+        if level == QualityLevel.COARSE:
+            scale = QUALITY_COARSE_SCALE
+            frame = cv2.resize(frame, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_NEAREST)
+            if mask is not None:
+                mask = cv2.resize(mask, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_NEAREST)
+        bits = thresholdFrame(frame, self.profile.getThresholdLUT())
+        if mask is not None and mask.shape == bits.shape:
+            # Nothing on the rails or off the table is detected.
+            bits = cv2.bitwise_and(bits, mask)
+        # The last position is used as the prediction so a blob close to it wins over reflections.
+        # A fast puck is smeared into a streak which already gives its velocity in this frame.
+        searchPosition = None
+        if lastPuckPosition is not None:
+            searchPosition = ((lastPuckPosition[0] - offsetX) / scale, (lastPuckPosition[1] - offsetY) / scale)
+        (x, y), radius, puckConfidence, streakVelocity = findPuckStreak(
+            maskFromBits(bits, 0), searchPosition, searchPosition, CAMERA_EXPOSURE_TIME,
+            PUCK_MIN_RADIUS / scale, PUCK_MAX_RADIUS / scale, DETECTION_BLUR_SIZE // scale | 1,
+            DETECTION_MAX_JUMP / scale)
+        x = offsetX + x * scale
+        y = offsetY + y * scale
+        radius *= scale
+        streakVelocity = (streakVelocity[0] * scale, streakVelocity[1] * scale)
+        robotConfidence = 0.0
+        opponentConfidence = 0.0
+        if level.value < QualityLevel.NO_ROBOT.value:
+            (robotX, robotY), robotRadius, robotConfidence = findBestBlob(
+                maskFromBits(bits, 1), self.getLastPosition("robotX", "robotY"), ROBOT_MIN_RADIUS, ROBOT_MAX_RADIUS)
+            (opponentX, opponentY), opponentRadius, opponentConfidence = findBestBlob(
+                maskFromBits(bits, 2), self.getLastPosition("opponentX", "opponentY"),
+                OPPONENT_MIN_RADIUS, OPPONENT_MAX_RADIUS)
+        # If nothing looks like the puck the position is unknown so no move is triggered.
+        puckFound = puckConfidence >= DETECTION_MIN_CONFIDENCE
+        if not puckFound:
+            x = y = radius = math.nan
+            streakVelocity = (0.0, 0.0)
+        # Robot detection is not that stable.
+        # If nothing looks like the robot then set the position invalid.
+        robotFound = robotConfidence >= DETECTION_MIN_CONFIDENCE
+        if not robotFound:
+            robotX = robotY = robotRadius = math.nan
+        opponentFound = opponentConfidence >= DETECTION_MIN_CONFIDENCE
+        if not opponentFound:
+            opponentX = opponentY = opponentRadius = math.nan
+        self.track.append(timestamp, x, y, radius, robotX, robotY, robotRadius, opponentX, opponentY, opponentRadius)
+        # A streak gives the velocity from a single frame, so a fast shot can be predicted right away.
+        # Otherwise fit the last few positions.
+        streak = streakVelocity != (0.0, 0.0)
+        if streak:
+            puckVelocityX, puckVelocityY = streakVelocity
+        else:
+            puckVelocityX, puckVelocityY = self.track.puckVelocity(TRACK_VELOCITY_WINDOW)
+        robotVelocityX, robotVelocityY = self.track.robotVelocity(TRACK_VELOCITY_WINDOW)
+        opponentVelocityX, opponentVelocityY = self.track.opponentVelocity(TRACK_VELOCITY_WINDOW)
+        puck = None
+        if puckFound:
+            puck = PuckState(timestamp, x, y, puckVelocityX, puckVelocityY, radius, streak)
+        robot = None
+        if robotFound:
+            robot = RobotState(timestamp, robotX, robotY, robotVelocityX, robotVelocityY)
+        opponent = None
+        if opponentFound:
+            opponent = OpponentState(timestamp, opponentX, opponentY, opponentVelocityX, opponentVelocityY,
+                                     opponentRadius)
+        self.lastDetection = Detection(timestamp, x, y, radius, puckConfidence, puckVelocityX, puckVelocityY, streak,
+                                       robotX, robotY, robotRadius, robotConfidence, robotVelocityX, robotVelocityY,
+                                       opponentX, opponentY, opponentRadius, opponentConfidence, opponentVelocityX,
+                                       opponentVelocityY, puck, robot, opponent)
+        return self.lastDetection
+
+    def repeatDetection(self, timestamp):
+        # Nothing moved since the last detection so everything is still where it was, at rest.
+        last = self.lastDetection
+        self.track.append(timestamp, last.puckX, last.puckY, last.puckRadius, last.robotX, last.robotY,
+                          last.robotRadius, last.opponentX, last.opponentY, last.opponentRadius)
+        puck = None
+        if last.puck is not None:
+            puck = last.puck._replace(timestamp=timestamp, velocityX=0.0, velocityY=0.0, streak=False)
+        robot = None
+        if last.robot is not None:
+            robot = last.robot._replace(timestamp=timestamp, velocityX=0.0, velocityY=0.0)
+        opponent = None
+        if last.opponent is not None:
+            opponent = last.opponent._replace(timestamp=timestamp, velocityX=0.0, velocityY=0.0)
+        self.lastDetection = last._replace(
+            timestamp=timestamp, puckVelocityX=0.0, puckVelocityY=0.0, streak=False, robotVelocityX=0.0,
+            robotVelocityY=0.0, opponentVelocityX=0.0, opponentVelocityY=0.0, puck=puck, robot=robot,
+            opponent=opponent)
+        return self.lastDetection
+
+    def getLastPosition(self, xField, yField):
+        # None if there was no valid detection in the last frame.
+        last = self.track.last()
+        if last is None or math.isnan(last[xField]):
+            return None
+        return last[xField], last[yField]
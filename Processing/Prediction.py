@@ -0,0 +1,88 @@
+import math
+from collections import namedtuple
+
+# Where the puck will cross the defensive line. Positions are in pixels of the warped frame.
+# collisionX and collisionY are NaN if the puck reaches the line without hitting a wall.
+Prediction = namedtuple("Prediction", ["originX", "originY", "collisionX", "collisionY", "x", "y", "pathLength"])
+
+
+def predictIntercept(x, y, velocityX, velocityY, radius, defensiveLine, tableWidth, reflectionFactor, maxBounces=1):
+    # Follows the puck over up to maxBounces wall hits. collisionX and collisionY of the result are the first one.
+    # Returns None if the puck goes straight up or across, then there is no usable crossing point.
+    if velocityX == 0:
+        return None
+    m = velocityY / velocityX
+    b = y - m * x
+    startX, startY = x, y
+    collisionX = collisionY = math.nan
+    pathLength = 0.0
+    for bounce in range(maxBounces):
+        # Check if we have a collision with the wall on either side.
+        if m >= 0:  # left edge
+            wallX = radius / 2
+        else:  # right edge
+            wallX = tableWidth - radius / 2
+        wallY = m * wallX + b
+        # Only if the puck hits the wall before it reaches the top the reflection is calculated.
+        if wallY <= 0:
+            break
+        if bounce == 0:
+            collisionX, collisionY = wallX, wallY
+        pathLength += math.hypot(wallX - startX, wallY - startY)
+        # The reflected slope is steepened by the reflection factor, measured on the real table.
+        m = -m * reflectionFactor
+        b = wallY - m * wallX
+        startX, startY = wallX, wallY
+    if m == 0:
+        return None
+    interceptX = (defensiveLine - b) / m
+    pathLength += math.hypot(interceptX - startX, defensiveLine - startY)
+    return Prediction(x, y, collisionX, collisionY, interceptX, defensiveLine, pathLength)
+
+
+# Where the opponent's mallet will hit the puck and the velocity of the puck after the hit.
+# time is in seconds from the observation, positions in pixels of the warped frame, velocities in pixels per second.
+ContactPrediction = namedtuple("ContactPrediction", ["time", "x", "y", "velocityX", "velocityY"])
+
+
+def predictContact(puckX, puckY, puckVelocityX, puckVelocityY, puckRadius,
+                   malletX, malletY, malletVelocityX, malletVelocityY, malletRadius,
+                   horizon, minClosingSpeed, restitution):
+    # Puck and mallet keep their velocities until they touch.
+    # Returns None if they do not touch within the horizon or the mallet is too slow to make a shot.
+    dx = puckX - malletX
+    dy = puckY - malletY
+    dvx = puckVelocityX - malletVelocityX
+    dvy = puckVelocityY - malletVelocityY
+    # Solve |d + dv t| = puckRadius + malletRadius for the first t.
+    a = dvx * dvx + dvy * dvy
+    b = 2 * (dx * dvx + dy * dvy)
+    c = dx * dx + dy * dy - (puckRadius + malletRadius) ** 2
+    if a == 0 or b >= 0:
+        # Not getting closer.
+        return None
+    if c <= 0:
+        t = 0.0
+    else:
+        discriminant = b * b - 4 * a * c
+        if discriminant < 0:
+            return None
+        t = (-b - math.sqrt(discriminant)) / (2 * a)
+    if t > horizon:
+        return None
+    contactX = puckX + puckVelocityX * t
+    contactY = puckY + puckVelocityY * t
+    normalX = contactX - (malletX + malletVelocityX * t)
+    normalY = contactY - (malletY + malletVelocityY * t)
+    length = math.hypot(normalX, normalY)
+    if length == 0:
+        return None
+    normalX /= length
+    normalY /= length
+    closingSpeed = -(dvx * normalX + dvy * normalY)
+    if closingSpeed < minClosingSpeed:
+        return None
+    # The mallet is held by a hand, so it counts as infinitely heavy. The puck bounces off it along the normal.
+    impulse = (1 + restitution) * closingSpeed
+    return ContactPrediction(t, contactX, contactY,
+                             puckVelocityX + impulse * normalX, puckVelocityY + impulse * normalY)
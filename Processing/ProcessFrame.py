@@ -4,10 +4,21 @@ import numpy as np
 from Constants import *
 
 
+def inHsvRange(hsv, lowerBoundary, upperBoundary):
+    # cv2.inRange with hue ranges that wrap through 0, their lower hue is above the upper one.
+    # Boundaries can be tuples, lists or arrays, OpenCV wants both as arrays of the same type.
+    lowerBoundary = np.array(lowerBoundary, np.uint8)
+    upperBoundary = np.array(upperBoundary, np.uint8)
+    if lowerBoundary[0] <= upperBoundary[0]:
+        return cv2.inRange(hsv, lowerBoundary, upperBoundary)
+    return cv2.bitwise_or(cv2.inRange(hsv, np.array([0, *lowerBoundary[1:]], np.uint8), upperBoundary),
+                          cv2.inRange(hsv, lowerBoundary, np.array([179, *upperBoundary[1:]], np.uint8)))
+
+
 def filterFrameHSV(frame, puckLowerBoundary, puckUpperBoundary, robotLowerBoundary, robotUpperBoundary):
     hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    maskPuck = cv2.inRange(hsv, puckLowerBoundary, puckUpperBoundary)
-    maskRobot = cv2.inRange(hsv, robotLowerBoundary, robotUpperBoundary)
+    maskPuck = inHsvRange(hsv, puckLowerBoundary, puckUpperBoundary)
+    maskRobot = inHsvRange(hsv, robotLowerBoundary, robotUpperBoundary)
     filteredFramePuck = cv2.bitwise_and(frame, frame, mask=maskPuck)
     filteredFrameRobot = cv2.bitwise_and(frame, frame, mask=maskRobot)
     filteredFrame = cv2.bitwise_or(filteredFramePuck, filteredFrameRobot)
@@ -16,7 +27,7 @@ def filterFrameHSV(frame, puckLowerBoundary, puckUpperBoundary, robotLowerBounda
 
 def detectPuck(filteredFrame, lowerBoundary, upperBoundary):
     hsv = cv2.cvtColor(filteredFrame, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, lowerBoundary, upperBoundary)
+    mask = inHsvRange(hsv, lowerBoundary, upperBoundary)
     mask_blur = cv2.medianBlur(mask, 19)
     contours, hierarchy = cv2.findContours(mask_blur, 1, 2)
     if not contours:
@@ -26,6 +37,165 @@ def detectPuck(filteredFrame, lowerBoundary, upperBoundary):
     return (x, y), radius
 
 
+def detectBlob(filteredFrame, lowerBoundary, upperBoundary, predictedPosition=None,
+               minRadius=PUCK_MIN_RADIUS, maxRadius=PUCK_MAX_RADIUS):
+    hsv = cv2.cvtColor(filteredFrame, cv2.COLOR_BGR2HSV)
+    mask = inHsvRange(hsv, lowerBoundary, upperBoundary)
+    return findBestBlob(mask, predictedPosition, minRadius, maxRadius)
+
+
+def findBestBlob(mask, predictedPosition=None, minRadius=PUCK_MIN_RADIUS, maxRadius=PUCK_MAX_RADIUS,
+                 blurSize=DETECTION_BLUR_SIZE, maxJump=DETECTION_MAX_JUMP):
+    mask_blur = cv2.medianBlur(mask, blurSize)
+    # One labelling pass gives area, bounding box and centroid of every blob.
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask_blur, connectivity=8)
+    label, confidence = scoreBlobs(stats, centroids, predictedPosition, minRadius, maxRadius, maxJump=maxJump)
+    if label == 0:
+        return (0, 0), 0, 0.0
+    x, y = centroids[label]
+    radius = max(stats[label, cv2.CC_STAT_WIDTH], stats[label, cv2.CC_STAT_HEIGHT]) / 2
+    return (float(x), float(y)), float(radius), confidence
+
+
+def detectPuckStreak(filteredFrame, lowerBoundary, upperBoundary, predictedPosition=None, lastPosition=None,
+                     exposureTime=CAMERA_EXPOSURE_TIME, minRadius=PUCK_MIN_RADIUS, maxRadius=PUCK_MAX_RADIUS):
+    hsv = cv2.cvtColor(filteredFrame, cv2.COLOR_BGR2HSV)
+    mask = inHsvRange(hsv, lowerBoundary, upperBoundary)
+    return findPuckStreak(mask, predictedPosition, lastPosition, exposureTime, minRadius, maxRadius)
+
+
+def findPuckStreak(mask, predictedPosition=None, lastPosition=None,
+                   exposureTime=CAMERA_EXPOSURE_TIME, minRadius=PUCK_MIN_RADIUS, maxRadius=PUCK_MAX_RADIUS,
+                   blurSize=DETECTION_BLUR_SIZE, maxJump=DETECTION_MAX_JUMP):
+    mask_blur = cv2.medianBlur(mask, blurSize)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask_blur, connectivity=8)
+    # A fast puck is smeared into a streak, so elongated blobs must not lose their score.
+    label, confidence = scoreBlobs(stats, centroids, predictedPosition, minRadius, maxRadius, STREAK_MAX_ELONGATION,
+                                   maxJump)
+    if label == 0:
+        return (0, 0), 0, 0.0, (0.0, 0.0)
+    left, top, width, height = stats[label, :4]
+    # Use the unblurred mask inside the blob so the median filter does not shift the centre.
+    blob = (labels[top:top + height, left:left + width] == label) & (mask[top:top + height, left:left + width] > 0)
+    moments = cv2.moments(blob.astype(np.uint8), binaryImage=True)
+    if moments["m00"] == 0:
+        x, y = centroids[label]
+        return (float(x), float(y)), max(width, height) / 2, confidence, (0.0, 0.0)
+    x = left + moments["m10"] / moments["m00"]
+    y = top + moments["m01"] / moments["m00"]
+    angle, length, radius = measureStreak(moments)
+    velocity = (0.0, 0.0)
+    # The perspective warp stretches a resting puck a little, so a streak has to be clearly longer than that.
+    if length >= STREAK_MIN_LENGTH * radius and lastPosition is not None:
+        # The moments give the axis of the streak but not the direction, take the one pointing away from the last position.
+        directionX, directionY = math.cos(angle), math.sin(angle)
+        if directionX * (x - lastPosition[0]) + directionY * (y - lastPosition[1]) < 0:
+            directionX, directionY = -directionX, -directionY
+        speed = length / exposureTime
+        velocity = (directionX * speed, directionY * speed)
+    return (float(x), float(y)), float(radius), confidence, velocity
+
+
+def measureStreak(moments):
+    # Covariance of the blob from the second order central moments.
+    a = moments["mu20"] / moments["m00"]
+    b = moments["mu11"] / moments["m00"]
+    c = moments["mu02"] / moments["m00"]
+    spread = math.sqrt(((a - c) / 2) ** 2 + b ** 2)
+    major = (a + c) / 2 + spread
+    minor = max(0.0, (a + c) / 2 - spread)
+    angle = 0.5 * math.atan2(2 * b, a - c)
+    # A disc of radius r has variance r^2/4 along every axis. Sweeping it over a length L
+    # adds L^2/12 along the direction of motion only.
+    radius = 2 * math.sqrt(minor)
+    length = math.sqrt(12 * max(0.0, major - minor))
+    return angle, length, radius
+
+
+def scoreBlobs(stats, centroids, predictedPosition, minRadius, maxRadius, maxElongation=1.0,
+               maxJump=DETECTION_MAX_JUMP):
+    # Label 0 is the background. Returns the best label and its score, or label 0 if nothing fits.
+    area = stats[1:, cv2.CC_STAT_AREA].astype(np.float32)
+    if area.size == 0:
+        return 0, 0.0
+    width = stats[1:, cv2.CC_STAT_WIDTH].astype(np.float32)
+    height = stats[1:, cv2.CC_STAT_HEIGHT].astype(np.float32)
+    # Radius of a disc with the same area. Blobs outside the expected range lose score quadratically.
+    radius = np.sqrt(area / math.pi)
+    maxRadius = maxRadius * math.sqrt(maxElongation)
+    areaScore = np.minimum(1.0, np.minimum(radius / minRadius, maxRadius / np.maximum(radius, 1e-6))) ** 2
+    # A disc fills pi/4 of its bounding box and has a square box.
+    fill = np.minimum(1.0, area / (0.25 * math.pi * width * height))
+    aspect = np.minimum(1.0, maxElongation * np.minimum(width, height) / np.maximum(width, height))
+    circularityScore = fill * aspect
+    score = areaScore * circularityScore
+    if predictedPosition is not None:
+        distance = np.hypot(centroids[1:, 0] - predictedPosition[0], centroids[1:, 1] - predictedPosition[1])
+        score *= np.exp(-(distance / maxJump) ** 2)
+    best = int(np.argmax(score))
+    return best + 1, float(score[best])
+
+
+def getTableHomography(corners, width, height):
+    # Corners start at the top left and go clockwise.
+    source = np.float32(corners)
+    target = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+    return cv2.getPerspectiveTransform(source, target)
+
+
+def buildWarpMaps(homography, width, height):
+    # For every pixel of the warped image look up where it comes from in the camera image.
+    inverse = np.linalg.inv(homography)
+    xs, ys = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+    points = np.stack([xs, ys, np.ones_like(xs)], axis=-1) @ inverse.T
+    mapX = (points[..., 0] / points[..., 2]).astype(np.float32)
+    mapY = (points[..., 1] / points[..., 2]).astype(np.float32)
+    # Fixed point maps are a lot faster to remap with than float maps.
+    return cv2.convertMaps(mapX, mapY, cv2.CV_16SC2)
+
+
+def buildPlayfieldMask(corners, homography, width, height, margin):
+    # 255 on the playing surface of the warped frame, 0 on the rails, goal mouths and everything off the table.
+    mask = np.zeros((height, width), np.uint8)
+    tableCorners = cv2.perspectiveTransform(np.float32(corners).reshape(-1, 1, 2), homography)
+    cv2.fillConvexPoly(mask, np.round(tableCorners).astype(np.int32).reshape(-1, 2), 255)
+    if margin > 0:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * margin + 1, 2 * margin + 1))
+        # Pixels outside the image count as off the table.
+        mask = cv2.erode(mask, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+    return mask
+
+
+def warpFrame(frame, warpMaps):
+    return cv2.remap(frame, warpMaps[0], warpMaps[1], cv2.INTER_LINEAR)
+
+
+def buildThresholdLUT(boundaries):
+    # Bit i of a channel entry is set if the value lies inside the range of the i-th (lower, upper) pair.
+    # A hue range whose lower end is above the upper one wraps through 0.
+    lut = np.zeros((256, 1, 3), np.uint8)
+    values = np.arange(256)
+    for index, (lowerBoundary, upperBoundary) in enumerate(boundaries):
+        for channel in range(3):
+            if channel == 0 and lowerBoundary[0] > upperBoundary[0]:
+                inside = (values >= lowerBoundary[0]) | (values <= upperBoundary[0])
+            else:
+                inside = (values >= lowerBoundary[channel]) & (values <= upperBoundary[channel])
+            lut[inside, 0, channel] |= 1 << index
+    return lut
+
+
+def thresholdFrame(frame, thresholdLUT):
+    # Thresholds all objects in one pass. Bit i of the result is set where object i matches in H, S and V.
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    hue, saturation, value = cv2.split(cv2.LUT(hsv, thresholdLUT))
+    return cv2.bitwise_and(cv2.bitwise_and(hue, saturation), value)
+
+
+def maskFromBits(bits, index):
+    return cv2.compare(cv2.bitwise_and(bits, 1 << index), 0, cv2.CMP_GT)
+
+
 def markInFrame(frame, x, y, radius, color):
     # Convert to int.
     center = (int(x), int(y))
@@ -35,6 +205,24 @@ def markInFrame(frame, x, y, radius, color):
     return frame
 
 
+def markPrediction(frame, prediction):
+    origin = (int(prediction.originX), int(prediction.originY))
+    predictedPoint = (int(prediction.x), int(prediction.y))
+    # Draw predicted point and where the prediction was made.
+    cv2.circle(frame, predictedPoint, 5, (255, 0, 255), -1)
+    cv2.circle(frame, origin, 5, (0, 0, 0), -1)
+    if math.isnan(prediction.collisionX):
+        # Draw prediction line.
+        cv2.line(frame, origin, predictedPoint, (255, 0, 0), thickness=2, lineType=4)
+    else:
+        collisionPoint = (int(prediction.collisionX), int(prediction.collisionY))
+        # Draw collision point, the line to it and the reflection line after it.
+        cv2.circle(frame, collisionPoint, 10, (255, 255, 255), -1)
+        cv2.line(frame, origin, collisionPoint, (255, 0, 0), thickness=2, lineType=4)
+        cv2.line(frame, collisionPoint, predictedPoint, (255, 255, 0), thickness=2, lineType=4)
+    return frame
+
+
 def markRobotRectangle(frame):
     # Only needs top left and bottom right corner.
     cv2.rectangle(frame, (0, 0, CAMERA_FRAME_HEIGHT, CAMERA_FRAME_ROBOT_MAX_Y), (0, 0, 255), 1)
@@ -0,0 +1,80 @@
+import numpy as np
+
+# One observation per frame. Positions are in pixels of the warped frame, NaN if the object was not found.
+TRACK_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("puckX", "<f4"),
+    ("puckY", "<f4"),
+    ("puckRadius", "<f4"),
+    ("robotX", "<f4"),
+    ("robotY", "<f4"),
+    ("robotRadius", "<f4"),
+    ("opponentX", "<f4"),
+    ("opponentY", "<f4"),
+    ("opponentRadius", "<f4"),
+])
+
+
+class TrackBuffer:
+    # Preallocated ring buffer of puck, robot and opponent observations.
+    # Every record is written twice, at i and at i + capacity. That way the last n records are always
+    # one contiguous slice of the array and window() can return a view instead of a copy.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.full(2 * capacity, np.nan, dtype=TRACK_DTYPE)
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, puckX, puckY, puckRadius, robotX, robotY, robotRadius,
+               opponentX=np.nan, opponentY=np.nan, opponentRadius=np.nan):
+        record = (timestamp, puckX, puckY, puckRadius, robotX, robotY, robotRadius,
+                  opponentX, opponentY, opponentRadius)
+        self.data[self.head] = record
+        self.data[self.head + self.capacity] = record
+        self.head += 1
+        if self.head == self.capacity:
+            self.head = 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def window(self, n):
+        # The last n records, oldest first. This is a view, it changes when the buffer wraps around.
+        n = min(n, self.count)
+        end = self.head + self.capacity
+        return self.data[end - n:end]
+
+    def last(self, age=0):
+        # Record from age frames ago, None if there is none.
+        if age >= self.count:
+            return None
+        return self.data[self.head + self.capacity - 1 - age]
+
+    def puckVelocity(self, n):
+        return self.velocity(self.window(n), "puckX", "puckY")
+
+    def robotVelocity(self, n):
+        return self.velocity(self.window(n), "robotX", "robotY")
+
+    def opponentVelocity(self, n):
+        return self.velocity(self.window(n), "opponentX", "opponentY")
+
+    def velocity(self, window, xField, yField):
+        # Least squares slope of the positions over time in pixels per second. Missing detections are skipped.
+        valid = ~np.isnan(window[xField])
+        if np.count_nonzero(valid) < 2:
+            return 0.0, 0.0
+        t = window["timestamp"][valid]
+        t = t - t.mean()
+        variance = np.dot(t, t)
+        if variance == 0:
+            return 0.0, 0.0
+        x = window[xField][valid]
+        y = window[yField][valid]
+        return float(np.dot(t, x) / variance), float(np.dot(t, y) / variance)
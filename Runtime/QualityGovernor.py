@@ -0,0 +1,61 @@
+from enum import Enum
+from Constants import *
+
+
+class QualityLevel(Enum):
+    # Every level also sheds the work of the levels before it.
+    FULL = 0
+    # No camera image, overlays or label updates.
+    NO_DISPLAY = 1
+    # No detection of our robot and the opponent's mallet, the strategy gets no states for them.
+    NO_ROBOT = 2
+    # The puck is only searched near its last position.
+    ROI = 3
+    # The puck is searched in a downscaled frame.
+    COARSE = 4
+
+
+class QualityGovernor:
+    # Watches the time every frame takes against the frame budget and sheds work when it is exceeded,
+    # one level at a time. The restore threshold is well below the budget so the levels do not flap.
+    def __init__(self, budget, degradeRatio=QUALITY_DEGRADE_RATIO, degradeFrames=QUALITY_DEGRADE_FRAMES,
+                 restoreRatio=QUALITY_RESTORE_RATIO, restoreFrames=QUALITY_RESTORE_FRAMES):
+        self.budget = budget
+        self.degradeRatio = degradeRatio
+        self.degradeFrames = degradeFrames
+        self.restoreRatio = restoreRatio
+        self.restoreFrames = restoreFrames
+        self.level = QualityLevel.FULL
+        # Frames in a row over the budget and with headroom.
+        self.overruns = 0
+        self.headroom = 0
+
+    def reset(self):
+        self.level = QualityLevel.FULL
+        self.overruns = 0
+        self.headroom = 0
+
+    def update(self, frameTime):
+        # Returns True if the level changed.
+        if frameTime > self.budget * self.degradeRatio:
+            self.overruns += 1
+            self.headroom = 0
+        elif frameTime < self.budget * self.restoreRatio:
+            self.headroom += 1
+            self.overruns = 0
+        else:
+            self.overruns = 0
+            self.headroom = 0
+        if self.overruns >= self.degradeFrames and self.level != QualityLevel.COARSE:
+            self.level = QualityLevel(self.level.value + 1)
+            self.overruns = 0
+            return True
+        if self.headroom >= self.restoreFrames and self.level != QualityLevel.FULL:
+            self.level = QualityLevel(self.level.value - 1)
+            self.headroom = 0
+            return True
+        return False
+
+    def sheds(self, level):
+        # True if the work that is dropped at the given level is currently dropped.
+        return self.level.value >= level.value
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import threading
+import cv2
+import numpy as np
+from collections import namedtuple
+
+# Frame pacing measured by measureJitter, in milliseconds.
+JitterStats = namedtuple("JitterStats", ["period", "mean", "std", "p99", "max", "samples"])
+
+# Flags of mlockall from sys/mman.h.
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+
+def pinCurrentThread(cores):
+    # Restricts the calling thread to the given cores. Threads started from it inherit the mask.
+    # Only Linux can pin single threads, returns False everywhere else.
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return False
+    available = os.sched_getaffinity(0)
+    cores = [core for core in cores if core in available]
+    if not cores:
+        return False
+    # On Linux a thread id works like a process id for the affinity calls.
+    os.sched_setaffinity(threading.get_native_id(), cores)
+    return True
+
+
+def raiseCurrentThreadPriority(priority):
+    # Tries the real-time round robin scheduler first and falls back to a lower nice value.
+    # Returns a description of what worked, None if the system did not allow anything.
+    if hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(threading.get_native_id(), os.SCHED_RR, os.sched_param(priority))
+            return f"SCHED_RR {priority}"
+        except (PermissionError, OSError):
+            pass
+    if hasattr(os, "nice"):
+        try:
+            os.nice(-10)
+            return "nice -10"
+        except (PermissionError, OSError):
+            pass
+    return None
+
+
+def lockMemory():
+    # Keeps all current and future pages in RAM so a page fault never stalls a frame.
+    if not sys.platform.startswith("linux"):
+        return False
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    return libc.mlockall(MCL_CURRENT | MCL_FUTURE) == 0
+
+
+def measureJitter(period, duration):
+    # Sleeps to a fixed schedule like the frame loop and measures how late every wake up is.
+    deadline = time.perf_counter()
+    end = deadline + duration
+    lateness = []
+    while deadline < end:
+        deadline += period
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        lateness.append(time.perf_counter() - deadline)
+    lateness = np.array(lateness) * 1000
+    return JitterStats(period * 1000, float(lateness.mean()), float(lateness.std()),
+                       float(np.percentile(lateness, 99)), float(lateness.max()), len(lateness))
+
+
+def enableRealTime(cores, priority, period, jitterTestTime):
+    # Prepares the calling thread for the frame loop. Has to run before OpenCV starts its worker threads
+    # so they inherit the affinity. Returns a list of messages for the log and the jitter statistics.
+    messages = []
+    if pinCurrentThread(cores):
+        messages.append(f"Vision pinned to cores {sorted(os.sched_getaffinity(threading.get_native_id()))}.")
+    else:
+        messages.append("Cannot pin threads to cores on this system.")
+    # One OpenCV thread per vision core, more would only preempt each other.
+    cv2.setNumThreads(max(1, len(cores)))
+    messages.append(f"OpenCV uses {cv2.getNumThreads()} threads.")
+    scheduling = raiseCurrentThreadPriority(priority)
+    if scheduling is not None:
+        messages.append("Vision priority raised to " + scheduling + ".")
+    else:
+        messages.append("Not allowed to raise the priority.")
+    if lockMemory():
+        messages.append("Memory locked.")
+    else:
+        messages.append("Not allowed to lock memory.")
+    stats = measureJitter(period, jitterTestTime)
+    messages.append(
+        f"Timer jitter over {stats.samples} periods of {stats.period:.1f}ms: mean {stats.mean:.3f}ms, "
+        f"std {stats.std:.3f}ms, p99 {stats.p99:.3f}ms, max {stats.max:.3f}ms.")
+    return messages, stats
@@ -0,0 +1,7 @@
+from .RealTime import JitterStats
+from .RealTime import enableRealTime
+from .RealTime import pinCurrentThread
+from .RealTime import raiseCurrentThreadPriority
+from .RealTime import measureJitter
+from .QualityGovernor import QualityLevel
+from .QualityGovernor import QualityGovernor
@@ -0,0 +1,97 @@
+import math
+import numpy as np
+from Constants import *
+
+
+class PuckPhysics:
+    # Puck sliding on the table in pixels of the warped frame. Y = 0 is our goal line,
+    # the puck bounces off the side walls and loses some of its sideways speed there.
+    def __init__(self, width=CAMERA_FRAME_HEIGHT, length=CAMERA_FRAME_WIDTH, radius=SIMULATION_PUCK_RADIUS,
+                 restitution=SIMULATION_WALL_RESTITUTION):
+        self.width = width
+        self.length = length
+        self.radius = radius
+        self.restitution = restitution
+
+    def step(self, x, y, velocityX, velocityY, dt):
+        x += velocityX * dt
+        y += velocityY * dt
+        if x < self.radius:
+            x = 2 * self.radius - x
+            velocityX = -velocityX * self.restitution
+        elif x > self.width - self.radius:
+            x = 2 * (self.width - self.radius) - x
+            velocityX = -velocityX * self.restitution
+        return x, y, velocityX, velocityY
+
+    def simulateShot(self, x, y, velocityX, velocityY, frameRate, noise=0.0, rng=None, maxDuration=3.0):
+        # Positions as the camera would see them, one per frame, until the puck passes our goal line.
+        # Returns timestamps, observed and true positions as arrays.
+        dt = 1 / frameRate
+        timestamps, trueX, trueY = [], [], []
+        t = 0.0
+        while y > -self.radius and t < maxDuration:
+            timestamps.append(t)
+            trueX.append(x)
+            trueY.append(y)
+            x, y, velocityX, velocityY = self.step(x, y, velocityX, velocityY, dt)
+            t += dt
+        timestamps = np.array(timestamps)
+        trueX = np.array(trueX)
+        trueY = np.array(trueY)
+        observedX, observedY = trueX, trueY
+        if noise > 0:
+            rng = rng if rng is not None else np.random.default_rng()
+            observedX = trueX + rng.normal(0, noise, trueX.shape)
+            observedY = trueY + rng.normal(0, noise, trueY.shape)
+        return timestamps, observedX, observedY, trueX, trueY
+
+    def randomShot(self, rng, minSpeed=SIMULATION_MIN_SHOT_SPEED, maxSpeed=SIMULATION_MAX_SHOT_SPEED):
+        # Start somewhere in the opponent half and shoot towards our side, straight or off a wall.
+        x = rng.uniform(self.radius, self.width - self.radius)
+        y = rng.uniform(self.length / 2, self.length - self.radius)
+        angle = rng.uniform(-math.radians(60), math.radians(60))
+        speed = rng.uniform(minSpeed, maxSpeed)
+        return x, y, speed * math.sin(angle), -speed * math.cos(angle)
+
+
+class MotionModel:
+    # Two independent axes that accelerate towards a target, limited in speed and acceleration,
+    # like the AccelStepper motors. Units are whatever the limits are given in.
+    def __init__(self, x, y, maxSpeed, maxAcceleration):
+        self.position = [float(x), float(y)]
+        self.velocity = [0.0, 0.0]
+        self.target = [float(x), float(y)]
+        self.maxSpeed = maxSpeed
+        self.maxAcceleration = maxAcceleration
+
+    def setTarget(self, x, y):
+        self.target = [float(x), float(y)]
+
+    def isMoving(self):
+        return self.velocity != [0.0, 0.0] or self.position != self.target
+
+    def advance(self, duration, maxStep=0.001):
+        # Integrate in small steps so the braking is accurate.
+        while duration > 0:
+            dt = min(maxStep, duration)
+            for axis in range(2):
+                self.advanceAxis(axis, dt)
+            duration -= dt
+
+    def advanceAxis(self, axis, dt):
+        distance = self.target[axis] - self.position[axis]
+        velocity = self.velocity[axis]
+        if distance == 0 and velocity == 0:
+            return
+        # Fastest speed from which we can still stop at the target.
+        desired = math.copysign(min(self.maxSpeed, math.sqrt(2 * self.maxAcceleration * abs(distance))), distance)
+        change = self.maxAcceleration * dt
+        velocity = max(velocity - change, min(velocity + change, desired))
+        position = self.position[axis] + velocity * dt
+        # Snap to the target instead of oscillating around it.
+        if (self.target[axis] - position) * distance <= 0 and abs(velocity) <= change:
+            position = self.target[axis]
+            velocity = 0.0
+        self.position[axis] = position
+        self.velocity[axis] = velocity
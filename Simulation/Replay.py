@@ -0,0 +1,75 @@
+import math
+import time
+from Constants import *
+from Processing.TrackBuffer import TrackBuffer
+from Strategy import PuckState, RobotState
+from .Physics import MotionModel
+
+
+def replayTrack(timestamps, xs, ys, strategy, profile, deadband=STEPPER_DEADBAND, puckRadius=SIMULATION_PUCK_RADIUS,
+                robotRadius=SIMULATION_ROBOT_RADIUS, robotMaxSpeed=SIMULATION_ROBOT_MAX_SPEED,
+                robotMaxAcceleration=SIMULATION_ROBOT_MAX_ACCELERATION, latency=SIMULATION_COMMAND_LATENCY):
+    # Runs the estimation and the strategy over observed puck positions and moves a simulated robot.
+    # Positions are in pixels of the warped frame, NaN where the puck was not found. The detection is not run.
+    # The dead-band is in steps and targets are mapped with profile.targetToSteps like the ones sent to the table.
+    # Returns one (saved, predictionError) pair per time the puck crossed the defensive line,
+    # and the total time spent in estimation and strategy.
+    track = TrackBuffer(TRACK_BUFFER_SIZE)
+    strategy.reset()
+    home = strategy.target
+    robot = MotionModel(home.x, home.y, robotMaxSpeed, robotMaxAcceleration)
+    lastMove = profile.targetToSteps(home.x, home.y)[:2]
+    # Commands that were sent but did not reach the robot yet, as (arrival time, x, y).
+    pending = []
+    prediction = None
+    events = []
+    computeTime = 0.0
+    # The home target lies on the defensive line.
+    defensiveLine = home.y
+    for i in range(len(timestamps)):
+        timestamp = timestamps[i]
+        x = xs[i]
+        y = ys[i]
+        start_time = time.perf_counter()
+        track.append(timestamp, x, y, puckRadius, robot.position[0], robot.position[1], robotRadius)
+        puck = None
+        if not math.isnan(x):
+            velocityX, velocityY = track.puckVelocity(TRACK_VELOCITY_WINDOW)
+            puck = PuckState(timestamp, x, y, velocityX, velocityY, puckRadius, False)
+        robotState = RobotState(timestamp, robot.position[0], robot.position[1], robot.velocity[0],
+                                robot.velocity[1])
+        target = strategy.step(puck, robotState)
+        computeTime += time.perf_counter() - start_time
+        if strategy.prediction is not None and prediction is None:
+            # Remember the first prediction of this shot.
+            prediction = strategy.prediction
+        # Same dead-band as isWithinDeadband.
+        steps = profile.targetToSteps(target.x, target.y)[:2]
+        if abs(steps[0] - lastMove[0]) >= deadband or abs(steps[1] - lastMove[1]) >= deadband:
+            lastMove = steps
+            pending.append((timestamp + latency, target.x, target.y))
+        if strategy.prediction is None and puck is not None and puck.velocityY >= 0:
+            prediction = None
+        if i + 1 == len(timestamps):
+            break
+        # Move the robot until the next frame and check if the puck crosses the line in between.
+        nextTimestamp = timestamps[i + 1]
+        while pending and pending[0][0] <= nextTimestamp:
+            arrival, targetX, targetY = pending.pop(0)
+            robot.advance(max(0.0, arrival - timestamp))
+            timestamp = max(timestamp, arrival)
+            robot.setTarget(targetX, targetY)
+        robot.advance(nextTimestamp - timestamp)
+        nextY = ys[i + 1]
+        if y > defensiveLine >= nextY:
+            # Interpolate where the puck crossed the line.
+            fraction = (y - defensiveLine) / (y - nextY)
+            crossingX = x + fraction * (xs[i + 1] - x)
+            saved = (abs(robot.position[0] - crossingX) <= robotRadius + puckRadius and
+                     abs(robot.position[1] - defensiveLine) <= robotRadius + puckRadius)
+            predictionError = math.nan
+            if prediction is not None:
+                predictionError = abs(prediction.x - crossingX)
+            events.append((saved, predictionError))
+            prediction = None
+    return events, computeTime
@@ -0,0 +1,217 @@
+import math
+import time
+from enum import Enum
+from threading import Thread, Lock
+import cv2
+import numpy as np
+from Constants import *
+from .Physics import PuckPhysics
+
+
+class ShotOutcome(Enum):
+    NONE = 0
+    SAVED = 1
+    GOAL = 2
+
+
+class TwinWorld:
+    # Puck and robot of the digital twin in pixels of the warped frame. The puck follows PuckPhysics and
+    # bounces off the robot, the robot is wherever the motors of the StepperEmulator are, mapped back with
+    # the stepper offset and stretch of the profile. Frames are rendered as the camera of that profile sees them.
+    # clock gives the time in seconds, the virtual clock of the emulator for runs that have to be repeatable.
+    def __init__(self, profile, emulator, physics=None, robotRadius=SIMULATION_ROBOT_RADIUS,
+                 restitution=CONTACT_RESTITUTION, exposureTime=CAMERA_EXPOSURE_TIME, seed=None, clock=time.monotonic):
+        self.profile = profile
+        self.clock = clock
+        self.emulator = emulator
+        self.physics = physics if physics is not None else PuckPhysics()
+        self.robotRadius = robotRadius
+        self.restitution = restitution
+        self.exposureTime = exposureTime
+        # (x, y, velocityX, velocityY) or None while there is no puck on the table.
+        self.puck = None
+        self.outcome = ShotOutcome.NONE
+        # Set when the robot touched the puck during the current shot.
+        self.hit = False
+        # Time the first frame that shows the launched puck moving was exposed, None before.
+        self.launchFrameTime = None
+        self.time = self.clock()
+        self.robot = self.getRobotPosition()
+        self.lock = Lock()
+        width, length = self.profile.warpSize
+        rng = np.random.default_rng(seed)
+        # Dark felt with a fixed texture, everything stays below the value threshold of the profile.
+        self.background = rng.integers(0, max(1, self.profile.puckLowerBoundary[2] // 2), (length, width, 3),
+                                       dtype=np.uint8)
+        self.puckColor = self.hsvColor(self.profile.puckLowerBoundary, self.profile.puckUpperBoundary)
+        # The robot is matched by value only, grey keeps it out of the puck and opponent hue ranges.
+        self.robotColor = (200, 200, 200)
+
+    @staticmethod
+    def hsvColor(lowerBoundary, upperBoundary):
+        # Middle of the hue range, saturated and bright within the range. A range that wraps through 0 goes on
+        # above 179.
+        upperHue = upperBoundary[0] + (180 if lowerBoundary[0] > upperBoundary[0] else 0)
+        hsv = np.uint8([[[(lowerBoundary[0] + upperHue) // 2 % 180,
+                          (lowerBoundary[1] + 3 * upperBoundary[1]) // 4,
+                          (lowerBoundary[2] + 3 * upperBoundary[2]) // 4]]])
+        return tuple(int(value) for value in cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0, 0])
+
+    def place(self, x, y):
+        # Puck at rest, a new shot starts.
+        with self.lock:
+            self.advanceLocked(self.clock())
+            self.puck = (x, y, 0.0, 0.0)
+            self.outcome = ShotOutcome.NONE
+            self.hit = False
+            self.launchFrameTime = None
+
+    def launch(self, velocityX, velocityY):
+        with self.lock:
+            self.advanceLocked(self.clock())
+            if self.puck is not None:
+                self.puck = (self.puck[0], self.puck[1], velocityX, velocityY)
+
+    def getRobotPosition(self):
+        (stepsX, stepsY), _ = self.emulator.get_state()
+        return self.profile.stepsToTarget(stepsX, stepsY)
+
+    def advance(self, now=None):
+        with self.lock:
+            self.advanceLocked(self.clock() if now is None else now)
+
+    def advanceLocked(self, now, maxStep=0.001):
+        # Small steps so a fast puck cannot pass through the robot.
+        duration = now - self.time
+        if duration <= 0:
+            return
+        previous = self.robot
+        robot = self.getRobotPosition()
+        self.time = now
+        self.robot = robot
+        if self.puck is None:
+            return
+        robotVelocity = ((robot[0] - previous[0]) / duration, (robot[1] - previous[1]) / duration)
+        steps = max(1, math.ceil(duration / maxStep))
+        x, y, velocityX, velocityY = self.puck
+        for i in range(steps):
+            x, y, velocityX, velocityY = self.physics.step(x, y, velocityX, velocityY, duration / steps)
+            # The robot moves little within one call, interpolate its position.
+            fraction = (i + 1) / steps
+            robotX = previous[0] + fraction * (robot[0] - previous[0])
+            robotY = previous[1] + fraction * (robot[1] - previous[1])
+            x, y, velocityX, velocityY = self.collide(x, y, velocityX, velocityY, robotX, robotY, robotVelocity)
+            if y < -self.physics.radius:
+                self.outcome = ShotOutcome.GOAL
+                self.puck = None
+                return
+            if y > self.physics.length + self.physics.radius:
+                self.puck = None
+                return
+            if self.hit and velocityY > 0 and self.outcome == ShotOutcome.NONE:
+                # Sent back by the robot.
+                self.outcome = ShotOutcome.SAVED
+        self.puck = (x, y, velocityX, velocityY)
+
+    def collide(self, x, y, velocityX, velocityY, robotX, robotY, robotVelocity):
+        dx = x - robotX
+        dy = y - robotY
+        distance = math.hypot(dx, dy)
+        contact = self.robotRadius + self.physics.radius
+        if distance >= contact or distance == 0:
+            return x, y, velocityX, velocityY
+        normalX, normalY = dx / distance, dy / distance
+        closing = (velocityX - robotVelocity[0]) * normalX + (velocityY - robotVelocity[1]) * normalY
+        if closing < 0:
+            self.hit = True
+            velocityX -= (1 + self.restitution) * closing * normalX
+            velocityY -= (1 + self.restitution) * closing * normalY
+        # Push the puck out of the robot.
+        return robotX + normalX * contact, robotY + normalY * contact, velocityX, velocityY
+
+    def render(self):
+        # Warped frame first, then into the camera view with the homography of the profile.
+        with self.lock:
+            now = self.clock()
+            self.advanceLocked(now)
+            puck = self.puck
+            robotX, robotY = self.robot
+            if puck is not None and self.launchFrameTime is None and (puck[2], puck[3]) != (0.0, 0.0):
+                self.launchFrameTime = now
+        frame = self.background.copy()
+        cv2.circle(frame, (round(robotX), round(robotY)), self.robotRadius, self.robotColor, -1)
+        if puck is not None:
+            x, y, velocityX, velocityY = puck
+            # Motion blur over the exposure, a fast puck is a streak.
+            start = (round(x - velocityX * self.exposureTime), round(y - velocityY * self.exposureTime))
+            cv2.line(frame, start, (round(x), round(y)), self.puckColor, 2 * self.physics.radius)
+        return cv2.warpPerspective(frame, self.profile.getHomography(), (CAMERA_FRAME_HEIGHT, CAMERA_FRAME_WIDTH),
+                                   flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+
+
+class SimulatedCamera:
+    # Stands in for Camera and delivers frames rendered by a TwinWorld at the frame rate. Instead of start(),
+    # a loop on a virtual clock calls capture() for every frame. Frames are stamped with clock.
+    def __init__(self, world, fps=CAMERA_FRAMERATE, clock=time.time):
+        self.world = world
+        self.fps = fps
+        self.clock = clock
+        self.frame = None
+        self.frame_timestamp = 0.0
+        self.new_frame = False
+        self.stopped = False
+        self.captured = 0
+        self.decoded = 0
+        self.dropped = 0
+        self.rate_time = time.time()
+        self.rate_counts = (0, 0)
+        # Ignored, there for code that configures the real camera.
+        self.cpu_cores = None
+        self.decode_cores = None
+        self.priority = None
+
+    def start(self):
+        Thread(target=self.run, args=(), daemon=True).start()
+        return self
+
+    def run(self):
+        frameTime = 1 / self.fps
+        nextFrame = time.monotonic()
+        while not self.stopped:
+            self.capture()
+            nextFrame += frameTime
+            delay = nextFrame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Too slow for the frame rate, skip instead of catching up.
+                nextFrame = time.monotonic()
+
+    def capture(self):
+        # Like a real camera the frame is exposed before it is delivered.
+        frame_timestamp = self.clock()
+        frame = self.world.render()
+        self.captured += 1
+        self.frame = frame
+        self.frame_timestamp = frame_timestamp
+        self.decoded += 1
+        self.new_frame = True
+
+    def get_current_frame(self):
+        self.new_frame = False
+        return self.frame
+
+    def take_warnings(self):
+        return []
+
+    def get_rates(self):
+        now = time.time()
+        elapsed = max(now - self.rate_time, 1e-6)
+        captured, decoded = self.rate_counts
+        rates = ((self.captured - captured) / elapsed, (self.decoded - decoded) / elapsed)
+        self.rate_time = now
+        self.rate_counts = (self.captured, self.decoded)
+        return rates
+
+    def stop(self):
+        self.stopped = True
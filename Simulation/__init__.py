@@ -0,0 +1,3 @@
+from .Physics import PuckPhysics
+from .Physics import MotionModel
+from .Twin import TwinWorld, SimulatedCamera, ShotOutcome
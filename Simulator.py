@@ -7,6 +7,7 @@ import qdarkstyle
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import QSplashScreen, QApplication
 from Processing.Line import *
+from Strategy import DefaultStrategy, PuckState
 import cv2
 
 WINDOW_TITLE = "HockeySimulator"
@@ -14,6 +15,7 @@ HOCKEY_TABLE_HEIGHT = 600
 HOCKEY_TABLE_WIDTH = 350
 HOCKEY_BAT_RADIUS = 10
 HOCKEY_PUCK_RADIUS = 5
+SIMULATOR_FRAMERATE = 100
 puck_pos = (0, 0)
 puck_pos2 = (0, 0)
 robot_pos = (0, 0)
@@ -52,6 +54,8 @@ hockey_table = cv2.convertScaleAbs(hockey_table)
 puck_pos = (int(HOCKEY_TABLE_WIDTH / 2), int(HOCKEY_TABLE_HEIGHT / 2))
 robot_pos = (int(HOCKEY_TABLE_WIDTH / 2), int(20))
 user_pos = (int(HOCKEY_TABLE_WIDTH / 2), int(HOCKEY_TABLE_HEIGHT - 20))
+# Same strategy as the live robot, only the table size differs.
+strategy = DefaultStrategy(tableWidth=HOCKEY_TABLE_WIDTH, frameRate=SIMULATOR_FRAMERATE)
 while True:
     # Copy Table Board
     frame = hockey_table.copy()
@@ -78,6 +82,14 @@ while True:
         final_point = (int(line.get_x(robot_pos[1])), int(robot_pos[1]))  # normal line prediction
         cv2.circle(frame, final_point, HOCKEY_PUCK_RADIUS, (100, 0, 255), -1)
         cv2.line(frame, puck_pos, final_point, (255, 255, 255), thickness=1, lineType=4)
+    # The puck moves from the user bat through the puck position. Its speed does not matter for the prediction.
+    strategy.defensiveLine = robot_pos[1]
+    strategy.reset()
+    puck = PuckState(time.time(), puck_pos[0], puck_pos[1],
+                     (puck_pos[0] - user_pos[0]) * SIMULATOR_FRAMERATE,
+                     (puck_pos[1] - user_pos[1]) * SIMULATOR_FRAMERATE, HOCKEY_PUCK_RADIUS, True)
+    target = strategy.step(puck, None)
+    cv2.circle(frame, (int(target.x), int(target.y)), HOCKEY_BAT_RADIUS, (0, 255, 255), 1)
     cv2.imshow(WINDOW_TITLE, frame)
     cv2.setMouseCallback(WINDOW_TITLE, mouse_event_handler)
     if cv2.waitKey(10) == 27:  # exit if ESC is pressed
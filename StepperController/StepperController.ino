@@ -5,6 +5,55 @@
 AccelStepper stepperx(1, MOTOR_X_STEP_PIN, MOTOR_X_DIR_PIN);
 AccelStepper steppery(1, MOTOR_Y_STEP_PIN, MOTOR_Y_DIR_PIN);
 bool st_enabled = false;
+// Characters of the command that is being received.
+String line_buffer = "";
+// Streaming mode, setpoints come without an answer and the position is reported every STATUS_INTERVAL_MS.
+bool streaming = false;
+long setpoint_seq = 0;
+long setpoint_x = 0;
+long setpoint_y = 0;
+long setpoint_vx = 0;
+long setpoint_vy = 0;
+// When the latest setpoint was computed by the host and when it arrived.
+unsigned long setpoint_time = 0;
+unsigned long setpoint_received = 0;
+unsigned long status_time = 0;
+long stream_target_x = -1;
+long stream_target_y = -1;
+bool stream_stopped = true;
+// Position kept over a reset, the startup code does not clear the .noinit section. Opening the serial port resets
+// most boards, with this a restart of the host does not home the robot again. After power-on the contents are
+// random and the magic word and the check do not match.
+struct WarmState {
+  unsigned long magic;
+  long x;
+  long y;
+  unsigned long check;
+};
+WarmState warm_state __attribute__((section(".noinit")));
+const unsigned long WARM_MAGIC = 0x524B4859UL;
+
+// Only valid while the motors stand still, a reset in the middle of a move loses steps.
+void save_position(bool valid) {
+  if (!valid) {
+    warm_state.magic = 0;
+    return;
+  }
+  warm_state.x = stepperx.currentPosition();
+  warm_state.y = steppery.currentPosition();
+  warm_state.check = WARM_MAGIC ^ warm_state.x ^ warm_state.y;
+  warm_state.magic = WARM_MAGIC;
+}
+
+bool restore_position() {
+  if (warm_state.magic != WARM_MAGIC || warm_state.check != (WARM_MAGIC ^ warm_state.x ^ warm_state.y)) {
+    return false;
+  }
+  stepperx.setCurrentPosition(warm_state.x);
+  steppery.setCurrentPosition(warm_state.y);
+  return true;
+}
+
 void setup() {
   pinMode(ENABLE_PIN, OUTPUT);
   pinMode(END_PIN_X, INPUT_PULLUP);
@@ -15,7 +64,16 @@ void setup() {
   stepperx.setEnablePin(ENABLE_PIN);
   steppery.setEnablePin(ENABLE_PIN);
   Serial.begin(115200);
-  calibrate();
+  // Home after power-on, a reset of a running board keeps the position.
+  if (!restore_position()) {
+    home();
+  }
+  // STATUS polls that came in while homing are answered by the banner, so nothing is left over for the host.
+  while (Serial.available() > 0) {
+    Serial.read();
+  }
+  // Tell the host we are up so it does not have to wait a fixed time after opening the port.
+  Serial.println("READY");
 }
 
 
@@ -41,14 +99,120 @@ void SetStepperSettings() {
   steppery.setAcceleration(MAX_ACCEL_Y);
   steppery.setSpeed(MIN_SPEED);
 }
+// Does not block, so the motors keep running while a command is coming in.
+bool read_command(String &command) {
+  while (Serial.available() > 0) {
+    char c = Serial.read();
+    if (c == '\n') {
+      command = line_buffer;
+      command.trim();
+      line_buffer = "";
+      return true;
+    }
+    line_buffer += c;
+  }
+  return false;
+}
+
+// T<seq>,<x>,<y>,<vx>,<vy>,<age> with positions in steps, velocities in steps per second and the milliseconds
+// since the host computed the setpoint. The host resends the latest setpoint, the age keeps the extrapolation
+// going from when it was computed instead of starting over with every copy.
+void set_setpoint(String &command) {
+  int first = command.indexOf(',');
+  int second = command.indexOf(',', first + 1);
+  int third = command.indexOf(',', second + 1);
+  int fourth = command.indexOf(',', third + 1);
+  if (first < 0 || second < 0 || third < 0 || fourth < 0) {
+    return;
+  }
+  int fifth = command.indexOf(',', fourth + 1);
+  setpoint_seq = command.substring(1, first).toInt();
+  setpoint_x = command.substring(first + 1, second).toInt();
+  setpoint_y = command.substring(second + 1, third).toInt();
+  setpoint_vx = command.substring(third + 1, fourth).toInt();
+  setpoint_received = millis();
+  if (fifth < 0) {
+    setpoint_vy = command.substring(fourth + 1).toInt();
+    setpoint_time = setpoint_received;
+  } else {
+    setpoint_vy = command.substring(fourth + 1, fifth).toInt();
+    setpoint_time = setpoint_received - command.substring(fifth + 1).toInt();
+  }
+  stream_stopped = false;
+}
+
+void stream() {
+  unsigned long now = millis();
+  if (now - setpoint_received > STREAM_TIMEOUT_MS) {
+    // The host stopped sending, brake instead of running on.
+    if (!stream_stopped) {
+      stepperx.stop();
+      steppery.stop();
+      stream_stopped = true;
+      stream_target_x = -1;
+      stream_target_y = -1;
+    }
+  } else {
+    // Extrapolate with the velocity from when the setpoint was computed, a setpoint the host did not
+    // update for a while is only followed as far as a missing one would be.
+    float age = min(now - setpoint_time, (unsigned long)STREAM_TIMEOUT_MS) / 1000.0;
+    long x = constrain(setpoint_x + (long)(setpoint_vx * age), 0, MAX_X);
+    long y = constrain(setpoint_y + (long)(setpoint_vy * age), 0, MAX_Y);
+    // moveTo recalculates the speed, only call it when the target changed.
+    if (x != stream_target_x) {
+      stepperx.moveTo(x);
+      stream_target_x = x;
+    }
+    if (y != stream_target_y) {
+      steppery.moveTo(y);
+      stream_target_y = y;
+    }
+  }
+  stepperx.run();
+  steppery.run();
+  if (now - status_time >= STATUS_INTERVAL_MS) {
+    status_time = now;
+    // Q<seq of the last setpoint>,<x>,<y>
+    Serial.print('Q');
+    Serial.print(setpoint_seq);
+    Serial.print(',');
+    Serial.print(stepperx.currentPosition());
+    Serial.print(',');
+    Serial.println(steppery.currentPosition());
+  }
+}
+
 void loop() {
   if (!st_enabled) {
     enable_steppers();
   }
-  if (Serial.available() > 0) {
-    String command = Serial.readStringUntil('\n');
-    command.trim();
-    if (strcmp(command.c_str(), "MAXIMA") == 0) {
+  if (streaming) {
+    stream();
+  }
+  String command;
+  if (read_command(command)) {
+    if (command.charAt(0) == 'T') {
+      // Setpoints are only followed in streaming mode and never answered.
+      if (streaming) {
+        set_setpoint(command);
+      }
+    } else if (strcmp(command.c_str(), "STREAM") == 0) {
+      SetStepperSettings();
+      streaming = true;
+      stream_stopped = true;
+      stream_target_x = -1;
+      stream_target_y = -1;
+      setpoint_received = millis() - STREAM_TIMEOUT_MS - 1;
+      Serial.println("OK");
+    } else if (strcmp(command.c_str(), "STOP") == 0) {
+      save_position(false);
+      streaming = false;
+      stepperx.stop();
+      steppery.stop();
+      stepperx.runToPosition();
+      steppery.runToPosition();
+      Serial.println("OK");
+    } else if (strcmp(command.c_str(), "MAXIMA") == 0) {
       Serial.println(String(MAX_X) + "," + String(MAX_Y));
     } else if (strcmp(command.c_str(), "POSITION") == 0) {
       Serial.println(String(stepperx.currentPosition()) + "," + String(steppery.currentPosition()));
@@ -64,6 +228,7 @@ void loop() {
       long movement_x = command.substring(0, delimiterIndex).toInt();   //new x pos
       long movement_y = command.substring(delimiterIndex + 1).toInt();  //new y pos
       if (movement_x >= 0 && movement_x <= MAX_X && movement_y >= 0 && movement_y <= MAX_Y) {
+        save_position(false);
         SetStepperSettings();
         stepperx.runToNewPosition(movement_x);
         steppery.runToNewPosition(movement_y);
@@ -71,4 +236,5 @@ void loop() {
       Serial.println("OK");
     }
   }
+  save_position(!stepperx.isRunning() && !steppery.isRunning());
 }
@@ -1,29 +1,94 @@
-import serial
 import time
 from queue import Queue
-from PyQt5.QtCore import QThread
+from collections import namedtuple
+from PyQt5.QtCore import QThread, pyqtSignal
 from enum import Enum
+from Constants import *
+from Runtime import pinCurrentThread
+from .StepperEmulator import StepperEmulator
+
+# Lines the firmware sends when it is ready. READY is also printed once after a reset.
+READY_RESPONSES = ("READY", "BUSY")
+# Boards that do not reset when the port is opened never print the banner.
+# After this many seconds without a banner we ask for the status instead.
+BANNER_GRACE_TIME = 1.5
+STATUS_POLL_INTERVAL = 0.25
+# Seconds to wait after the firmware is ready for answers to STATUS polls that were still on the way.
+READY_DRAIN_TIME = 0.05
+
+# Position report of the firmware in streaming mode. sequence is the number of the last setpoint it got.
+StepperStatus = namedtuple("StepperStatus", ["timestamp", "sequence", "x", "y"])
+
+
+def isWithinDeadband(x, y, lastPosition, deadband=STEPPER_DEADBAND):
+    # Discrete moves this close to the last one are not sent. Streamed setpoints are always sent.
+    return abs(x - lastPosition[0]) < deadband and abs(y - lastPosition[1]) < deadband
 
 
 class StepperController:
-    def __init__(self, port, baudrate):
+    def __init__(self, port, baudrate, emulator=None):
         super().__init__()
         self.port = port
         self.baudrate = baudrate
+        # StepperEmulator used for STEPPER_EMULATOR_PORT, a new one if None.
+        self.emulator = emulator
         self.connection = None
         self.position_queue = Queue()
+        # Received bytes of status frames that are not complete yet.
+        self.read_buffer = b""
+
+    def connect(self, ready_timeout=5):
+        if self.port == STEPPER_EMULATOR_PORT:
+            connection = self.emulator if self.emulator is not None else StepperEmulator()
+        else:
+            # pyserial is only imported when we actually talk to the Arduino.
+            import serial
+            connection = serial.Serial(self.port, self.baudrate, timeout=0.1)
+        if not self.wait_until_ready(connection, ready_timeout):
+            connection.close()
+            raise TimeoutError("Arduino on " + self.port + " did not report ready.")
+        connection.timeout = 1
+        # Every answer from before is dropped, or each move would read the answer of the previous command.
+        time.sleep(READY_DRAIN_TIME)
+        connection.reset_input_buffer()
+        # Only set the connection once the firmware answered so nobody writes to it before.
+        self.connection = connection
 
-    def connect(self):
-        self.connection = serial.Serial(self.port, self.baudrate, timeout=1)
-        time.sleep(2)  # wait for the Arduino to reset
-        self.connection.flushInput()
+    def wait_until_ready(self, connection, timeout):
+        start_time = time.monotonic()
+        next_poll = start_time + BANNER_GRACE_TIME
+        while time.monotonic() - start_time < timeout:
+            response = connection.readline().decode(errors="ignore").strip()
+            if response in READY_RESPONSES:
+                return True
+            if time.monotonic() >= next_poll:
+                connection.write(b'STATUS\n')
+                next_poll += STATUS_POLL_INTERVAL
+        return False
+
+    def is_connected(self):
+        return self.connection is not None
 
     def move_to_position(self, x, y):
-        command = str(x) + ',' + str(y) + '\n'
-        self.connection.write(command.encode())
+        self.send_move(x, y)
         response = self.connection.readline().decode().strip()
         return response
 
+    def send_move(self, x, y):
+        # The firmware answers once the motors reached the target.
+        command = str(x) + ',' + str(y) + '\n'
+        self.connection.write(command.encode())
+
+    def read_answer(self):
+        # Never blocks, the next line if a complete one arrived, None otherwise.
+        waiting = self.connection.in_waiting
+        if waiting:
+            self.read_buffer += self.connection.read(waiting)
+        if b'\n' not in self.read_buffer:
+            return None
+        line, _, self.read_buffer = self.read_buffer.partition(b'\n')
+        return line.decode(errors="ignore").strip()
+
     def set_offset(self, x, y):
         if x >= 0:
             x_offset = "+"
@@ -42,13 +107,58 @@ class StepperController:
             self.connection.write(b'OFFSETX' + x_offset.encode())
             self.connection.readline()
 
-    def calibrate(self):
+    def calibrate(self, timeout=STEPPER_HOMING_TIMEOUT):
+        # The firmware answers once homing is done, which takes longer than the timeout of a readline.
+        # Returns "OK", or an empty string if there was no answer in time.
         self.connection.write(b'CALIBRATE\n')
-        response = self.connection.readline().decode().strip()
-        return response
+        start_time = time.monotonic()
+        while time.monotonic() - start_time < timeout:
+            response = self.connection.readline().decode(errors="ignore").strip()
+            if response:
+                return response
+        return ""
+
+    def start_stream(self):
+        self.read_buffer = b""
+        self.connection.write(b'STREAM\n')
+        return self.connection.readline().decode().strip()
+
+    def stop_stream(self):
+        # Status frames that are still coming in are skipped.
+        self.connection.write(b'STOP\n')
+        while True:
+            response = self.connection.readline().decode().strip()
+            if not response.startswith("Q"):
+                return response
+
+    def send_setpoint(self, sequence, x, y, velocity_x, velocity_y, age=0):
+        # Not answered, the firmware only reports its position every few setpoints.
+        # age is how many milliseconds ago the setpoint was computed.
+        command = 'T' + str(sequence) + ',' + str(x) + ',' + str(y) + ',' + str(velocity_x) + ',' + str(velocity_y) + \
+            ',' + str(age) + '\n'
+        self.connection.write(command.encode())
+
+    def read_statuses(self):
+        # Never blocks, returns the status frames that arrived since the last call.
+        waiting = self.connection.in_waiting
+        if waiting == 0:
+            return []
+        self.read_buffer += self.connection.read(waiting)
+        *lines, self.read_buffer = self.read_buffer.split(b'\n')
+        timestamp = time.time()
+        statuses = []
+        for line in lines:
+            fields = line.decode(errors="ignore").strip()[1:].split(',')
+            if line.startswith(b'Q') and len(fields) == 3:
+                try:
+                    statuses.append(StepperStatus(timestamp, *(int(field) for field in fields)))
+                except ValueError:
+                    pass
+        return statuses
 
     def disconnect(self):
         self.connection.close()
+        self.connection = None
 
 
 class MoveType(Enum):
@@ -61,15 +171,157 @@ class MoveWorker(QThread):
         super().__init__(parent)
         self.queue = Queue()
         self.stepperController = stepperController
+        # Optional TelemetryLogger that gets every acknowledged move.
+        self.telemetry = None
+        # Real-time mode. Cores this thread is pinned to.
+        self.cpu_cores = None
+        # Move poll() sent that was not answered yet.
+        self.pending = None
 
     def run(self):
+        if self.cpu_cores is not None:
+            pinCurrentThread(self.cpu_cores)
         while True:
-            type, x, y = self.queue.get()  # Blocks until there are values in the queue
-            if self.stepperController is not None:
+            values = self.queue.get()  # Blocks until there are values in the queue
+            if values is None:
+                break
+            type, x, y = values
+            # Commands given while the Arduino is still connecting are dropped.
+            if self.stepperController is not None and self.stepperController.is_connected():
                 if type == MoveType.NORMAL:
-                    self.stepperController.move_to_position(int(x), int(y))
+                    response = self.stepperController.move_to_position(int(x), int(y))
+                    if self.telemetry is not None:
+                        self.telemetry.log_ack(time.time(), x, y, response == "OK")
                 elif type == MoveType.CALIBRATE:
                     self.stepperController.calibrate()
 
+    def poll(self):
+        # What run() does, without the thread and without waiting for the answers, for the digital twin on a
+        # virtual clock. Sends the next queued move once the previous one was answered.
+        controller = self.stepperController
+        if controller is None or not controller.is_connected():
+            return
+        if self.pending is not None:
+            response = controller.read_answer()
+            if response is None:
+                return
+            type, x, y = self.pending
+            self.pending = None
+            if type == MoveType.NORMAL and self.telemetry is not None:
+                self.telemetry.log_ack(time.time(), x, y, response == "OK")
+        if self.queue.empty():
+            return
+        values = self.queue.get_nowait()
+        if values is None:
+            return
+        type, x, y = values
+        if type == MoveType.NORMAL:
+            controller.send_move(int(x), int(y))
+        elif type == MoveType.CALIBRATE:
+            controller.connection.write(b'CALIBRATE\n')
+        self.pending = values
+
     def set_values(self, type, x, y):
         self.queue.put((type, x, y))
+
+    def stop(self):
+        # Moves queued before are still sent.
+        self.queue.put(None)
+
+
+class StreamWorker(QThread):
+    # Sends the latest setpoint at a fixed rate in streaming mode and collects the status frames.
+    # Setting a target only replaces a tuple, so the frame loop never waits for the serial port.
+    def __init__(self, stepperController, rate=STEPPER_STREAM_RATE, parent=None):
+        super().__init__(parent)
+        self.stepperController = stepperController
+        self.period = 1 / rate
+        # (x, y, velocity x, velocity y, time) in steps, steps per second and perf_counter() seconds when it was
+        # set, None until the first target.
+        self.setpoint = None
+        self.sequence = 0
+        # Last StepperStatus of the firmware.
+        self.status = None
+        self.sent = 0
+        self.late = 0
+        self.stopped = False
+        self.calibrate_requested = False
+        # Real-time mode. Cores this thread is pinned to.
+        self.cpu_cores = None
+        # Seconds the setpoints are stamped with, the virtual clock of the emulator in the digital twin.
+        self.clock = time.perf_counter
+
+    def set_target(self, x, y, velocity_x=0, velocity_y=0):
+        self.setpoint = (int(x), int(y), int(velocity_x), int(velocity_y), self.clock())
+
+    def calibrate(self):
+        self.calibrate_requested = True
+
+    def get_lag(self):
+        # Setpoints sent that the firmware had not received yet at its last report.
+        if self.status is None:
+            return None
+        return (self.sequence - self.status.sequence) % STEPPER_STREAM_SEQUENCE_MODULO
+
+    def run(self):
+        if self.cpu_cores is not None:
+            pinCurrentThread(self.cpu_cores)
+        controller = self.stepperController
+        controller.start_stream()
+        next_time = time.perf_counter()
+        while not self.stopped:
+            self.tick()
+            next_time += self.period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.late += 1
+                # Do not try to catch up on missed ticks, only the latest setpoint matters.
+                if delay < -self.period:
+                    next_time = time.perf_counter()
+        controller.stop_stream()
+
+    def tick(self):
+        # One period of run(). The digital twin calls it on its own once streaming started.
+        controller = self.stepperController
+        if self.calibrate_requested:
+            # Homing needs the normal mode. Streaming goes on with the latest setpoint afterwards.
+            self.calibrate_requested = False
+            controller.stop_stream()
+            if controller.calibrate() != "OK":
+                # The firmware did not finish homing, streaming to it makes no sense.
+                self.stopped = True
+                return
+            controller.start_stream()
+        setpoint = self.setpoint
+        if setpoint is not None:
+            # The same setpoint goes out every tick, its age lets the firmware extrapolate from when it was set.
+            x, y, velocity_x, velocity_y, set_time = setpoint
+            age = int((self.clock() - set_time) * 1000)
+            self.sequence = (self.sequence + 1) % STEPPER_STREAM_SEQUENCE_MODULO
+            controller.send_setpoint(self.sequence, x, y, velocity_x, velocity_y, age)
+            self.sent += 1
+        statuses = controller.read_statuses()
+        if statuses:
+            self.status = statuses[-1]
+
+    def stop(self):
+        self.stopped = True
+
+
+class ConnectWorker(QThread):
+    # Emitted with True once the Arduino reported ready, False if it could not be reached.
+    connected = pyqtSignal(bool)
+
+    def __init__(self, stepperController, ready_timeout, parent=None):
+        super().__init__(parent)
+        self.stepperController = stepperController
+        self.ready_timeout = ready_timeout
+
+    def run(self):
+        try:
+            self.stepperController.connect(self.ready_timeout)
+            self.connected.emit(True)
+        except Exception:
+            self.connected.emit(False)
@@ -0,0 +1,214 @@
+import math
+import time
+from collections import deque
+from threading import Lock
+from Constants import *
+from Simulation import MotionModel
+
+# Resolution of the simulated firmware loop in seconds.
+EMULATOR_STEP = 0.001
+
+
+def toInt(text):
+    # Like String.toInt() of the Arduino: leading sign and digits, 0 if there are none.
+    text = text.strip()
+    end = 1 if text[:1] in ("+", "-") else 0
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    try:
+        return int(text[:end])
+    except ValueError:
+        return 0
+
+
+class StepperEmulator:
+    # Stands in for serial.Serial and answers like StepperController.ino, with the motors simulated by MotionModel.
+    # Runs on the wall clock by default. With virtualTime=True time only passes in wait() and while readline()
+    # waits for an answer, so tests run as fast as possible and give the same result every time.
+    # warmReset=True is a reset of a board that was running, the firmware keeps its position and does not home.
+    def __init__(self, maxSpeed=STEPPER_MAX_SPEED, maxAcceleration=STEPPER_MAX_ACCELERATION, maxX=TABLE_MAX_X,
+                 maxY=TABLE_MAX_Y, statusInterval=STEPPER_STATUS_INTERVAL, streamTimeout=STEPPER_STREAM_TIMEOUT,
+                 homingTime=STEPPER_EMULATOR_HOMING_TIME, virtualTime=False, warmReset=False):
+        self.model = MotionModel(0, 0, maxSpeed, maxAcceleration)
+        self.maxX = maxX
+        self.maxY = maxY
+        self.statusInterval = statusInterval
+        self.streamTimeout = streamTimeout
+        self.virtualTime = virtualTime
+        self.virtualNow = 0.0
+        self.time = self.now()
+        # Seconds readline() waits for a line, like serial.Serial.
+        self.timeout = 1
+        self.output = bytearray()
+        self.input = bytearray()
+        # Homing blocks the firmware, commands wait in the input until it is done. After a reset the firmware
+        # homes, drops what came in meanwhile and prints the banner, CALIBRATE answers OK afterwards.
+        self.homingTime = homingTime
+        self.homingEnd = self.time + (0 if warmReset else homingTime)
+        self.homingAnswer = b"READY\n"
+        # Targets of a discrete move, the firmware moves X first and then Y before it answers.
+        self.moves = []
+        self.streaming = False
+        self.setpoint = None
+        # When the latest setpoint was computed by the host and when it arrived.
+        self.setpointTime = 0.0
+        self.setpointReceived = 0.0
+        self.statusTime = 0.0
+        # Times the motors started to move after standing still, for latency measurements.
+        self.moving = False
+        self.motionStarts = deque(maxlen=1000)
+        self.lock = Lock()
+
+    def now(self):
+        return self.virtualNow if self.virtualTime else time.monotonic()
+
+    def wait(self, duration):
+        if self.virtualTime:
+            self.virtualNow += duration
+        else:
+            time.sleep(duration)
+
+    def advance(self):
+        # Runs the firmware loop up to now.
+        now = self.now()
+        while self.time < now:
+            dt = min(EMULATOR_STEP, now - self.time)
+            self.time += dt
+            if self.homingAnswer is not None:
+                if self.time >= self.homingEnd:
+                    self.finishHoming()
+                continue
+            if self.streaming:
+                self.stream()
+            elif self.moves:
+                self.model.setTarget(*self.moves[0])
+                if not self.model.isMoving():
+                    self.moves.pop(0)
+                    if not self.moves:
+                        self.output += b"OK\n"
+            self.model.advance(dt)
+            moving = self.model.isMoving()
+            if moving and not self.moving:
+                self.motionStarts.append(self.time)
+            self.moving = moving
+
+    def finishHoming(self):
+        # Homing is not simulated, the motors are at zero afterwards.
+        self.model = MotionModel(0, 0, self.model.maxSpeed, self.model.maxAcceleration)
+        self.moving = False
+        if self.homingAnswer == b"READY\n":
+            self.input.clear()
+        self.output += self.homingAnswer
+        self.homingAnswer = None
+        self.handleInput()
+
+    def handleInput(self):
+        while b"\n" in self.input and self.homingAnswer is None:
+            line, _, self.input = self.input.partition(b"\n")
+            self.handle(line.decode(errors="ignore").strip())
+
+    def get_state(self):
+        # Position and velocity of the motors now, for simulations that show the robot.
+        with self.lock:
+            self.advance()
+            return tuple(self.model.position), tuple(self.model.velocity)
+
+    def stream(self):
+        if self.setpoint is not None:
+            sequence, x, y, velocityX, velocityY = self.setpoint
+            age = min(self.time - self.setpointTime, self.streamTimeout)
+            if self.time - self.setpointReceived > self.streamTimeout:
+                self.stop()
+                self.setpoint = None
+            else:
+                self.model.setTarget(min(max(x + int(velocityX * age), 0), self.maxX),
+                                     min(max(y + int(velocityY * age), 0), self.maxY))
+        if self.time - self.statusTime >= self.statusInterval:
+            self.statusTime = self.time
+            sequence = self.setpoint[0] if self.setpoint is not None else 0
+            self.output += f"Q{sequence},{round(self.model.position[0])},{round(self.model.position[1])}\n".encode()
+
+    def stop(self):
+        # Like AccelStepper.stop(): brake as hard as allowed.
+        target = []
+        for axis in range(2):
+            velocity = self.model.velocity[axis]
+            target.append(self.model.position[axis] +
+                          math.copysign(velocity * velocity / (2 * self.model.maxAcceleration), velocity))
+        self.model.setTarget(*target)
+
+    def handle(self, command):
+        position = self.model.position
+        if command.startswith("T"):
+            if self.streaming:
+                fields = command[1:].split(",")
+                if len(fields) in (5, 6):
+                    self.setpoint = tuple(toInt(field) for field in fields[:5])
+                    # Extrapolated from when the host computed it, see set_setpoint of the firmware.
+                    self.setpointReceived = self.time
+                    self.setpointTime = self.time - (toInt(fields[5]) / 1000 if len(fields) == 6 else 0)
+        elif command == "STREAM":
+            self.streaming = True
+            self.setpoint = None
+            self.output += b"OK\n"
+        elif command == "STOP":
+            self.streaming = False
+            self.stop()
+            self.moves = [tuple(self.model.target)]
+        elif command == "MAXIMA":
+            self.output += f"{self.maxX},{self.maxY}\n".encode()
+        elif command == "POSITION":
+            self.output += f"{round(position[0])},{round(position[1])}\n".encode()
+        elif command == "CALIBRATE":
+            self.homingEnd = self.time + self.homingTime
+            self.homingAnswer = b"OK\n"
+        elif command == "STATUS":
+            self.output += b"BUSY\n" if self.model.isMoving() else b"READY\n"
+        else:
+            x, _, y = command.partition(",")
+            x, y = toInt(x), toInt(y)
+            if 0 <= x <= self.maxX and 0 <= y <= self.maxY:
+                self.moves = [(x, position[1]), (x, y)]
+            else:
+                self.output += b"OK\n"
+
+    def write(self, data):
+        with self.lock:
+            self.advance()
+            self.input += data
+            self.handleInput()
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        with self.lock:
+            self.advance()
+            return len(self.output)
+
+    def read(self, size=1):
+        with self.lock:
+            self.advance()
+            data = bytes(self.output[:size])
+            del self.output[:size]
+        return data
+
+    def readline(self):
+        deadline = self.now() + self.timeout
+        while True:
+            with self.lock:
+                self.advance()
+                if b"\n" in self.output:
+                    line, _, rest = self.output.partition(b"\n")
+                    self.output = bytearray(rest)
+                    return bytes(line) + b"\n"
+            if self.now() >= deadline:
+                return b""
+            self.wait(EMULATOR_STEP)
+
+    def reset_input_buffer(self):
+        with self.lock:
+            self.advance()
+            self.output.clear()
+
+    def close(self):
+        pass
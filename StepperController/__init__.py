@@ -1,3 +1,8 @@
 from .StepperController import StepperController
 from .StepperController import MoveWorker
 from .StepperController import MoveType
+from .StepperController import ConnectWorker
+from .StepperController import StreamWorker
+from .StepperController import StepperStatus
+from .StepperController import isWithinDeadband
+from .StepperEmulator import StepperEmulator
@@ -32,11 +32,16 @@ void calibrate_y() {
   steppery.setSpeed(MIN_SPEED);
   steppery.setAcceleration(MAX_ACCEL_Y);
 }
-void calibrate(){
+void home() {
   for(int i = 0; i<=3; i++) {
   calibrate_y();
   calibrate_x();
 }
+}
+void save_position(bool valid);
+void calibrate(){
+  save_position(false);
+  home();
   Serial.println("OK");
 }
 #endif
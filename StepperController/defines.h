@@ -13,4 +13,7 @@
 #define MAX_Y 1820
 #define END_PIN_Y 9
 #define END_PIN_X 10
+// Streaming mode: position report interval and how long the motors follow the last setpoint without a new one.
+#define STATUS_INTERVAL_MS 20
+#define STREAM_TIMEOUT_MS 100
 #endif
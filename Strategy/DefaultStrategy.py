@@ -0,0 +1,123 @@
+import math
+from Constants import *
+from Processing.Prediction import predictIntercept, predictContact
+from .Strategy import Strategy, StrategyState, Target
+
+
+class DefaultStrategy(Strategy):
+    # Intercepts shots on the defensive line and returns to the middle of the goal otherwise.
+    # Attacking slow pucks in our half is optional. Every call is constant time.
+    # If the opponent's mallet is tracked, a shot is anticipated from the predicted contact with the puck.
+    def __init__(self, defensiveLine=DEFENSIVE_LINE, tableWidth=CAMERA_FRAME_HEIGHT,
+                 robotMaxY=CAMERA_FRAME_ROBOT_MAX_Y, frameRate=CAMERA_FRAMERATE,
+                 reflectionFactor=STRATEGY_REFLECTION_FACTOR, maxBounces=STRATEGY_MAX_BOUNCES,
+                 edgeGuard=STRATEGY_EDGE_GUARD,
+                 speedThreshold=SPEED_THRESHOLD, attackEnabled=STRATEGY_ATTACK_ENABLED,
+                 homeTolerance=STRATEGY_HOME_TOLERANCE, contactHorizon=CONTACT_HORIZON,
+                 contactMinClosingSpeed=CONTACT_MIN_CLOSING_SPEED, contactRestitution=CONTACT_RESTITUTION,
+                 budget=STRATEGY_BUDGET):
+        super().__init__(budget)
+        self.defensiveLine = defensiveLine
+        self.tableWidth = tableWidth
+        self.robotMaxY = robotMaxY
+        self.frameRate = frameRate
+        self.reflectionFactor = reflectionFactor
+        self.maxBounces = maxBounces
+        self.edgeGuard = edgeGuard
+        self.speedThreshold = speedThreshold
+        self.attackEnabled = attackEnabled
+        self.homeTolerance = homeTolerance
+        self.contactHorizon = contactHorizon
+        self.contactMinClosingSpeed = contactMinClosingSpeed
+        self.contactRestitution = contactRestitution
+        self.reset()
+
+    def reset(self):
+        self.state = StrategyState.RETURN_HOME
+        self.target = self.getHomeTarget()
+        self.prediction = None
+        # The last ContactPrediction, only used for drawing and logging.
+        self.contact = None
+        self.wasApproaching = False
+
+    def getHomeTarget(self):
+        return Target(StrategyState.RETURN_HOME, self.tableWidth / 2, self.defensiveLine, math.inf)
+
+    def update(self, puck, robot, opponent=None):
+        # The puck has to move towards the robot by more than a pixel per frame.
+        approaching = puck is not None and puck.velocityY / self.frameRate < -1
+        # Two frames in a row, or one frame if the velocity came from a blur streak.
+        if approaching and (self.wasApproaching or puck.streak):
+            if self.state != StrategyState.INTERCEPT:
+                self.intercept(puck)
+        elif approaching and self.state == StrategyState.ANTICIPATE:
+            # The puck was hit as anticipated, keep the target until the shot is confirmed next frame.
+            pass
+        elif self.anticipate(puck, opponent):
+            pass
+        elif self.attackEnabled and self.canAttack(puck):
+            self.state = StrategyState.ATTACK
+            self.prediction = None
+            self.target = Target(StrategyState.ATTACK, puck.x, puck.y, puck.timestamp)
+        elif self.state in (StrategyState.INTERCEPT, StrategyState.ATTACK, StrategyState.ANTICIPATE):
+            self.state = StrategyState.RETURN_HOME
+            self.prediction = None
+            self.target = self.getHomeTarget()
+        elif self.state == StrategyState.RETURN_HOME and self.isAtHome(robot):
+            self.state = StrategyState.DEFEND
+            home = self.getHomeTarget()
+            self.target = Target(StrategyState.DEFEND, home.x, home.y, math.inf)
+        self.wasApproaching = approaching
+        return self.target
+
+    def intercept(self, puck):
+        # Only one prediction per shot, the target stays until the puck stops coming towards us.
+        prediction = self.predict(puck.x, puck.y, puck.velocityX, puck.velocityY, puck.radius)
+        if prediction is None:
+            return
+        self.state = StrategyState.INTERCEPT
+        self.prediction = prediction
+        # Close to the walls the robot cannot reach, keep the last target then.
+        if self.edgeGuard < prediction.x < self.tableWidth - self.edgeGuard:
+            speed = math.hypot(puck.velocityX, puck.velocityY)
+            self.target = Target(StrategyState.INTERCEPT, prediction.x, prediction.y,
+                                 puck.timestamp + prediction.pathLength / speed)
+
+    def anticipate(self, puck, opponent):
+        # Moves to where the puck will cross the defensive line after the opponent's mallet hits it,
+        # before the puck has even started moving towards us. Returns False if no such shot is coming.
+        self.contact = None
+        if puck is None or opponent is None:
+            return False
+        contact = predictContact(puck.x, puck.y, puck.velocityX, puck.velocityY, puck.radius,
+                                 opponent.x, opponent.y, opponent.velocityX, opponent.velocityY, opponent.radius,
+                                 self.contactHorizon, self.contactMinClosingSpeed, self.contactRestitution)
+        if contact is None or contact.velocityY / self.frameRate >= -1:
+            return False
+        prediction = self.predict(contact.x, contact.y, contact.velocityX, contact.velocityY, puck.radius)
+        if prediction is None:
+            return False
+        self.contact = contact
+        self.state = StrategyState.ANTICIPATE
+        self.prediction = prediction
+        if self.edgeGuard < prediction.x < self.tableWidth - self.edgeGuard:
+            speed = math.hypot(contact.velocityX, contact.velocityY)
+            self.target = Target(StrategyState.ANTICIPATE, prediction.x, prediction.y,
+                                 puck.timestamp + contact.time + prediction.pathLength / speed)
+        return True
+
+    def predict(self, x, y, velocityX, velocityY, radius):
+        return predictIntercept(x, y, velocityX, velocityY, radius, self.defensiveLine, self.tableWidth,
+                                self.reflectionFactor, self.maxBounces)
+
+    def canAttack(self, puck):
+        # Slow puck in the area the robot can reach.
+        if puck is None or puck.y > self.robotMaxY:
+            return False
+        return math.hypot(puck.velocityX, puck.velocityY) / self.frameRate < self.speedThreshold
+
+    def isAtHome(self, robot):
+        if robot is None:
+            return False
+        home = self.getHomeTarget()
+        return math.hypot(robot.x - home.x, robot.y - home.y) < self.homeTolerance
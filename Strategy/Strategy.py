@@ -0,0 +1,48 @@
+import time
+from enum import Enum
+from collections import namedtuple
+from Constants import *
+
+# Estimated state of the puck. Positions are in pixels of the warped frame, velocities in pixels per second.
+# streak is True if the velocity was measured from a motion blur streak in this frame.
+PuckState = namedtuple("PuckState", ["timestamp", "x", "y", "velocityX", "velocityY", "radius", "streak"])
+# Estimated state of our robot, same units as the puck.
+RobotState = namedtuple("RobotState", ["timestamp", "x", "y", "velocityX", "velocityY"])
+# Estimated state of the opponent's mallet, same units as the puck.
+OpponentState = namedtuple("OpponentState", ["timestamp", "x", "y", "velocityX", "velocityY", "radius"])
+# Where the robot should be and the time it has to be there by. No hurry if the deadline is infinite.
+Target = namedtuple("Target", ["state", "x", "y", "deadline"])
+
+
+class StrategyState(Enum):
+    DEFEND = 1
+    INTERCEPT = 2
+    ATTACK = 3
+    RETURN_HOME = 4
+    ANTICIPATE = 5
+
+
+class Strategy:
+    # A strategy turns the estimated puck and robot state into a target once per camera frame.
+    # It must not know about the GUI so it can run in the live loop, the simulator and offline tools.
+    def __init__(self, budget=STRATEGY_BUDGET):
+        self.budget = budget
+        self.lastDuration = 0.0
+        self.overruns = 0
+        # The last Prediction from Processing.Prediction, only used for drawing and logging.
+        self.prediction = None
+
+    def step(self, puck, robot, opponent=None):
+        # puck, robot and opponent are None if they were not found in this frame.
+        start_time = time.perf_counter()
+        target = self.update(puck, robot, opponent)
+        self.lastDuration = time.perf_counter() - start_time
+        if self.lastDuration > self.budget:
+            self.overruns += 1
+        return target
+
+    def update(self, puck, robot, opponent=None):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
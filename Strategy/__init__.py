@@ -0,0 +1,12 @@
+from .Strategy import Strategy
+from .Strategy import StrategyState
+from .Strategy import PuckState
+from .Strategy import RobotState
+from .Strategy import OpponentState
+from .Strategy import Target
+from .DefaultStrategy import DefaultStrategy
+
+# Strategies that can be selected with STRATEGY in Constants.py.
+STRATEGIES = {
+    "default": DefaultStrategy,
+}
@@ -0,0 +1,193 @@
+import json
+import math
+import time
+from collections import namedtuple, deque
+from threading import Thread
+import numpy as np
+from Constants import *
+from Calibration import CalibrationProfile
+from Camera.Camera import Camera
+from Processing.Pipeline import VisionPipeline
+from Runtime import QualityGovernor, QualityLevel
+from StepperController import StepperController, MoveWorker, MoveType, StreamWorker, isWithinDeadband
+from Strategy import STRATEGIES, StrategyState
+
+# One table of a multi-table setup. camera is a camera index or the path of a video, port a serial port
+# or STEPPER_EMULATOR_PORT. Moves are only sent to active tables.
+TableConfig = namedtuple("TableConfig", ["name", "camera", "port", "profile", "active"])
+
+
+def loadTableConfigs(path):
+    # {"tables": [{"name": "left", "camera": 0, "port": "COM3", "profile": "left"}, ...]}
+    # profile defaults to the name and active to true.
+    with open(path) as file:
+        values = json.load(file)
+    configs = []
+    for table in values["tables"]:
+        configs.append(TableConfig(table["name"], table["camera"], table["port"], table.get("profile", table["name"]),
+                                   table.get("active", True)))
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("Table names in " + path + " are not unique.")
+    return configs
+
+
+class TableMetrics:
+    # Counters and the recent frame times of one table. Written by the worker that processes the table,
+    # read by the runtime for the reports.
+    def __init__(self, window=MULTI_TABLE_METRICS_WINDOW):
+        self.frames = 0
+        self.errors = 0
+        self.lastError = None
+        # Seconds from the start of step() until the target was handed to the stepper thread.
+        self.processingTimes = deque(maxlen=window)
+        # Seconds from the capture of the frame until then.
+        self.latencies = deque(maxlen=window)
+        self.rateTime = time.monotonic()
+        self.rateFrames = 0
+
+    def record(self, processingTime, latency):
+        self.frames += 1
+        self.processingTimes.append(processingTime)
+        self.latencies.append(latency)
+
+    def recordError(self, error):
+        self.errors += 1
+        self.lastError = repr(error)
+
+    def snapshot(self):
+        # Frame rate since the last snapshot, times in milliseconds.
+        now = time.monotonic()
+        fps = (self.frames - self.rateFrames) / max(now - self.rateTime, 1e-6)
+        self.rateTime = now
+        self.rateFrames = self.frames
+        processingTimes = np.array(self.processingTimes) * 1000
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "frames": self.frames,
+            "fps": fps,
+            "errors": self.errors,
+            "lastError": self.lastError,
+            "processingMeanMs": float(processingTimes.mean()) if len(processingTimes) else math.nan,
+            "processingP99Ms": float(np.percentile(processingTimes, 99)) if len(processingTimes) else math.nan,
+            "latencyMeanMs": float(latencies.mean()) if len(latencies) else math.nan,
+            "latencyP99Ms": float(np.percentile(latencies, 99)) if len(latencies) else math.nan,
+        }
+
+
+class TableEngine:
+    # Everything of one table: camera, stepper link, calibration profile, vision pipeline, strategy and metrics.
+    # Does what MainWindow.update does without the display. The runtime never runs step() of the same table
+    # on two workers at once. camera, emulator and profile replace the ones of the config, for the digital twin.
+    def __init__(self, config, realTime=False, camera=None, emulator=None, profile=None, stream=STEPPER_STREAM_ENABLED):
+        self.config = config
+        self.name = config.name
+        self.profile = profile if profile is not None else CalibrationProfile.load(config.profile)
+        self.camera = camera
+        if self.camera is None:
+            self.camera = Camera(
+                config.camera,
+                CAMERA_FRAME_WIDTH,
+                CAMERA_FRAME_HEIGHT,
+                CAMERA_FOCUS,
+                CAMERA_BUFFERSIZE,
+                CAMERA_FRAMERATE,
+                CAMERA_FOURCC,
+                CAMERA_DECODE_THREADS,
+            )
+        self.stepperController = StepperController(config.port, STEPPER_BAUDRATE, emulator)
+        self.moveWorker = MoveWorker(self.stepperController)
+        self.streamWorker = None
+        if stream:
+            self.streamWorker = StreamWorker(self.stepperController)
+        if realTime:
+            # Capture and the serial link stay off the vision cores like in main.py.
+            self.camera.cpu_cores = REALTIME_CAPTURE_CORES
+            self.camera.decode_cores = REALTIME_DECODE_CORES
+            self.camera.priority = REALTIME_PRIORITY
+            self.moveWorker.cpu_cores = REALTIME_CAPTURE_CORES
+            if self.streamWorker is not None:
+                self.streamWorker.cpu_cores = REALTIME_CAPTURE_CORES
+        self.pipeline = VisionPipeline(self.profile)
+        self.strategy = STRATEGIES[STRATEGY](defensiveLine=self.profile.defensiveLine,
+                                             speedThreshold=self.profile.speedThreshold)
+        self.governor = None
+        if QUALITY_GOVERNOR_ENABLED:
+            self.governor = QualityGovernor(1 / CAMERA_FRAMERATE)
+        self.metrics = TableMetrics()
+        # None while connecting, then True or False.
+        self.connected = None
+        self.lastTargetPosition = None
+        self.lastMovePosition = (0, 0)
+        # Set by the runtime while a worker processes a frame of this table.
+        self.busy = False
+
+    def start(self):
+        self.camera.start()
+        self.moveWorker.start()
+        Thread(target=self.connect, daemon=True).start()
+        return self
+
+    def connect(self):
+        try:
+            self.stepperController.connect(STEPPER_READY_TIMEOUT)
+        except Exception as error:
+            self.metrics.recordError(error)
+            self.connected = False
+            self.moveWorker.stepperController = None
+            return
+        self.connected = True
+        if self.streamWorker is not None:
+            self.streamWorker.start()
+
+    def step(self, frame, captureTimestamp):
+        start = time.perf_counter()
+        level = self.governor.level if self.governor is not None else QualityLevel.FULL
+        frame = self.pipeline.warp(frame)
+        detection = self.pipeline.detect(frame, captureTimestamp, level)
+        target = self.strategy.step(detection.puck, detection.robot, detection.opponent)
+        if (target.x, target.y) != self.lastTargetPosition:
+            self.lastTargetPosition = (target.x, target.y)
+            if self.config.active:
+                velocity = (0.0, 0.0)
+                if target.state == StrategyState.ATTACK:
+                    velocity = (detection.puckVelocityX, detection.puckVelocityY)
+                self.sendTarget(target, velocity)
+        processingTime = time.perf_counter() - start
+        self.metrics.record(processingTime, time.time() - captureTimestamp)
+        if self.governor is not None:
+            self.governor.update(processingTime)
+        return detection, target
+
+    def sendTarget(self, target, velocity):
+        # Same mapping as MainWindow.sendTarget.
+        x, y, velocityX, velocityY = self.profile.targetToSteps(target.x, target.y, velocity[0], velocity[1])
+        if self.streamWorker is not None:
+            self.lastMovePosition = (x, y)
+            self.streamWorker.set_target(x, y, velocityX, velocityY)
+            return
+        if isWithinDeadband(x, y, self.lastMovePosition):
+            return
+        self.lastMovePosition = (x, y)
+        self.moveWorker.set_values(MoveType.NORMAL, x, y)
+
+    def getMetrics(self):
+        metrics = self.metrics.snapshot()
+        metrics["name"] = self.name
+        metrics["connected"] = self.connected
+        # Frames the camera delivered that were replaced by a newer one before a worker was free.
+        metrics["dropped"] = max(0, self.camera.decoded - self.metrics.frames - int(self.busy))
+        metrics["level"] = self.governor.level.name if self.governor is not None else QualityLevel.FULL.name
+        metrics["state"] = self.strategy.state.name
+        metrics["streamLag"] = self.streamWorker.get_lag() if self.streamWorker is not None else None
+        metrics["warnings"] = self.camera.take_warnings()
+        return metrics
+
+    def stop(self):
+        self.camera.stop()
+        if self.streamWorker is not None and self.streamWorker.isRunning():
+            self.streamWorker.stop()
+            self.streamWorker.wait(1000)
+        if self.moveWorker.isRunning():
+            self.moveWorker.stop()
+            self.moveWorker.wait(1000)
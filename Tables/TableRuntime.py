@@ -0,0 +1,77 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from Constants import *
+from Runtime import pinCurrentThread, raiseCurrentThreadPriority
+from .TableEngine import TableEngine
+
+
+class TableRuntime:
+    # Drives several tables from one process. Every table has its own engine, the vision workers are shared.
+    # OpenCV releases the GIL, so a pool of threads keeps as many cores busy as there are workers.
+    # Every table has at most one frame in work and always gets its newest frame, and the table whose frame
+    # was captured first is served first when several are waiting.
+    def __init__(self, configs, workers=MULTI_TABLE_WORKERS, realTime=False):
+        self.engines = [TableEngine(config, realTime) for config in configs]
+        self.workers = workers or os.cpu_count()
+        self.realTime = realTime
+        self.pool = None
+        self.stopped = False
+
+    def start(self):
+        if self.workers > 1:
+            # The parallelism comes from the workers, OpenCV threads would only compete with them.
+            cv2.setNumThreads(1)
+        self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="vision", initializer=self.initWorker)
+        for engine in self.engines:
+            engine.start()
+        return self
+
+    def initWorker(self):
+        if self.realTime:
+            pinCurrentThread(REALTIME_VISION_CORES)
+            raiseCurrentThreadPriority(REALTIME_PRIORITY)
+
+    def run(self, report=None, reportInterval=MULTI_TABLE_REPORT_INTERVAL, duration=None):
+        # Dispatches frames until stop() is called or the duration is over.
+        # report is called with the metrics of all tables every reportInterval seconds.
+        start = time.monotonic()
+        nextReport = start + reportInterval
+        while not self.stopped:
+            self.dispatch()
+            now = time.monotonic()
+            if report is not None and now >= nextReport:
+                nextReport = now + reportInterval
+                report(self.getMetrics())
+            if duration is not None and now - start >= duration:
+                break
+            time.sleep(MULTI_TABLE_DISPATCH_INTERVAL)
+
+    def dispatch(self):
+        ready = [engine for engine in self.engines if engine.camera.new_frame and not engine.busy]
+        ready.sort(key=lambda engine: engine.camera.frame_timestamp)
+        for engine in ready:
+            engine.busy = True
+            captureTimestamp = engine.camera.frame_timestamp
+            frame = engine.camera.get_current_frame()
+            self.pool.submit(self.process, engine, frame, captureTimestamp)
+
+    def process(self, engine, frame, captureTimestamp):
+        try:
+            engine.step(frame, captureTimestamp)
+        except Exception as error:
+            # One broken table must not stop the others.
+            engine.metrics.recordError(error)
+        finally:
+            engine.busy = False
+
+    def getMetrics(self):
+        return [engine.getMetrics() for engine in self.engines]
+
+    def stop(self):
+        self.stopped = True
+        for engine in self.engines:
+            engine.stop()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
@@ -0,0 +1,5 @@
+from .TableEngine import TableConfig
+from .TableEngine import loadTableConfigs
+from .TableEngine import TableMetrics
+from .TableEngine import TableEngine
+from .TableRuntime import TableRuntime
@@ -0,0 +1,81 @@
+import socket
+import numpy as np
+
+# One datagram per frame. The layout is fixed so clients can decode it with np.frombuffer.
+# Positions are in pixels of the warped frame, velocities in pixels per second, NaN if unknown.
+STATE_MAGIC = 0x31545352  # "RST1"
+STATE_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("sequence", "<u4"),
+    ("timestamp", "<f8"),
+    ("frame", "<u4"),
+    # Values of StrategyState and QualityLevel.
+    ("strategyState", "u1"),
+    ("qualityLevel", "u1"),
+    # Bit 0 puck found, bit 1 robot found, bit 2 opponent found, bit 3 robot activated.
+    ("flags", "u1"),
+    ("reserved", "u1"),
+    ("puckX", "<f4"),
+    ("puckY", "<f4"),
+    ("puckVelocityX", "<f4"),
+    ("puckVelocityY", "<f4"),
+    ("puckRadius", "<f4"),
+    ("robotX", "<f4"),
+    ("robotY", "<f4"),
+    ("robotVelocityX", "<f4"),
+    ("robotVelocityY", "<f4"),
+    ("opponentX", "<f4"),
+    ("opponentY", "<f4"),
+    ("opponentVelocityX", "<f4"),
+    ("opponentVelocityY", "<f4"),
+    ("predictedX", "<f4"),
+    ("predictedY", "<f4"),
+    ("targetX", "<f4"),
+    ("targetY", "<f4"),
+    # Last command sent to the steppers, in stepper units.
+    ("commandX", "<f4"),
+    ("commandY", "<f4"),
+    # Stage timings of this frame in milliseconds. latency is from grabbing the frame until the target was decided.
+    ("warpTime", "<f4"),
+    ("detectTime", "<f4"),
+    ("strategyTime", "<f4"),
+    ("latency", "<f4"),
+])
+FLAG_PUCK = 1
+FLAG_ROBOT = 2
+FLAG_OPPONENT = 4
+FLAG_ACTIVE = 8
+
+
+class StateBroadcaster:
+    # Sends the state of every frame as one UDP datagram. Sending never blocks, a datagram that does not
+    # fit into the socket buffer is dropped. Any number of clients can listen on the port.
+    def __init__(self, address, port):
+        self.destination = (address, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.socket.setblocking(False)
+        # The record is reused for every frame, only the values change.
+        self.record = np.zeros(1, dtype=STATE_DTYPE)
+        self.sequence = 0
+        self.dropped = 0
+
+    def send(self, timestamp, frame, strategyState, qualityLevel, flags, detection, prediction, target, command,
+             timings):
+        # One assignment of the whole record is a lot faster than setting the fields one by one.
+        self.record[0] = (
+            STATE_MAGIC, self.sequence, timestamp, frame, strategyState, qualityLevel, flags, 0,
+            detection.puckX, detection.puckY, detection.puckVelocityX, detection.puckVelocityY, detection.puckRadius,
+            detection.robotX, detection.robotY, detection.robotVelocityX, detection.robotVelocityY,
+            detection.opponentX, detection.opponentY, detection.opponentVelocityX, detection.opponentVelocityY,
+            prediction[0], prediction[1], target[0], target[1], command[0], command[1],
+            timings[0], timings[1], timings[2], timings[3],
+        )
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        try:
+            self.socket.sendto(self.record.tobytes(), self.destination)
+        except OSError:
+            self.dropped += 1
+
+    def close(self):
+        self.socket.close()
@@ -0,0 +1,62 @@
+import socket
+import numpy as np
+from .StateBroadcast import STATE_DTYPE, STATE_MAGIC
+
+
+def decodeState(data):
+    # Returns the datagram as a structured record, None if it is not a state datagram.
+    if len(data) != STATE_DTYPE.itemsize:
+        return None
+    record = np.frombuffer(data, dtype=STATE_DTYPE)[0]
+    if record["magic"] != STATE_MAGIC:
+        return None
+    return record
+
+
+class StateClient:
+    # Receives the state datagrams of a running game. Several clients can listen on the same port
+    # as long as the game sends to a broadcast address.
+    # Usage:
+    #     client = StateClient(5005)
+    #     while True:
+    #         state = client.receive()
+    #         print(state["puckX"], state["puckY"])
+    def __init__(self, port, address=""):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((address, port))
+        self.lastSequence = None
+        # Datagrams that were lost or arrived out of order.
+        self.missed = 0
+
+    def receive(self, timeout=None):
+        # Blocks until the next state arrives. Returns None on timeout.
+        self.socket.settimeout(timeout)
+        while True:
+            try:
+                data = self.socket.recv(STATE_DTYPE.itemsize + 1)
+            except socket.timeout:
+                return None
+            record = decodeState(data)
+            if record is None:
+                continue
+            sequence = int(record["sequence"])
+            if self.lastSequence is not None and sequence != (self.lastSequence + 1) & 0xFFFFFFFF:
+                self.missed += 1
+            self.lastSequence = sequence
+            return record
+
+    def receiveMany(self, count, timeout=None):
+        # Collects count states into one structured array, fewer if the timeout hits.
+        records = np.zeros(count, dtype=STATE_DTYPE)
+        received = 0
+        while received < count:
+            record = self.receive(timeout)
+            if record is None:
+                break
+            records[received] = record
+            received += 1
+        return records[:received]
+
+    def close(self):
+        self.socket.close()
@@ -0,0 +1,146 @@
+import os
+import numpy as np
+from enum import Enum
+from queue import Queue, Empty, Full
+from threading import Thread
+
+# File layout: 8 byte magic, little endian uint64 record count, then the records.
+TELEMETRY_MAGIC = b"RHTLOG01"
+TELEMETRY_HEADER_SIZE = 16
+# Records are fixed width so the file can be mapped straight into a structured array.
+TELEMETRY_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("kind", "u1"),
+    ("ack", "u1"),
+    ("frame", "<u4"),
+    ("puckX", "<f4"),
+    ("puckY", "<f4"),
+    ("puckRadius", "<f4"),
+    ("robotX", "<f4"),
+    ("robotY", "<f4"),
+    ("robotRadius", "<f4"),
+    ("puckVelocityX", "<f4"),
+    ("puckVelocityY", "<f4"),
+    ("predictedX", "<f4"),
+    ("predictedY", "<f4"),
+    ("commandX", "<f4"),
+    ("commandY", "<f4"),
+])
+# The file grows by this many records at a time.
+TELEMETRY_CHUNK_RECORDS = 16384
+NAN = float("nan")
+
+
+class RecordKind(Enum):
+    FRAME = 1
+    COMMAND = 2
+    ACK = 3
+
+
+class TelemetryLogger:
+    def __init__(self, path, queue_size=4096):
+        self.path = path
+        self.queue = Queue(maxsize=queue_size)
+        self.count = 0
+        self.capacity = 0
+        # Records that did not fit into the queue. The frame loop never waits for the writer.
+        self.dropped = 0
+        self.records = None
+        self.header = None
+        self.thread = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "wb") as file:
+            file.write(TELEMETRY_MAGIC)
+            file.write(np.uint64(0).tobytes())
+        self.grow()
+        self.thread = Thread(target=self.run, args=(), daemon=True)
+        self.thread.start()
+        return self
+
+    def log_frame(self, timestamp, frame, puck, puckRadius, robot, robotRadius, velocity, prediction):
+        self.put((timestamp, RecordKind.FRAME.value, 0, frame, puck[0], puck[1], puckRadius,
+                  robot[0], robot[1], robotRadius, velocity[0], velocity[1],
+                  prediction[0], prediction[1], NAN, NAN))
+
+    def log_command(self, timestamp, x, y):
+        self.put((timestamp, RecordKind.COMMAND.value, 0, 0, NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN,
+                  NAN, NAN, x, y))
+
+    def log_ack(self, timestamp, x, y, acknowledged):
+        self.put((timestamp, RecordKind.ACK.value, int(acknowledged), 0, NAN, NAN, NAN, NAN, NAN, NAN,
+                  NAN, NAN, NAN, NAN, x, y))
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            # Write everything that is waiting in one go and update the count once.
+            batch = [record]
+            try:
+                while len(batch) < TELEMETRY_CHUNK_RECORDS:
+                    record = self.queue.get_nowait()
+                    if record is None:
+                        self.write(batch)
+                        return
+                    batch.append(record)
+            except Empty:
+                pass
+            self.write(batch)
+
+    def write(self, batch):
+        if self.count + len(batch) > self.capacity:
+            self.grow()
+        self.records[self.count:self.count + len(batch)] = batch
+        self.count += len(batch)
+        self.header[0] = self.count
+
+    def grow(self):
+        # The maps have to be closed before the file can be resized on Windows.
+        if self.records is not None:
+            self.records.flush()
+            self.header.flush()
+            self.records = None
+            self.header = None
+        self.capacity += TELEMETRY_CHUNK_RECORDS
+        with open(self.path, "r+b") as file:
+            file.truncate(TELEMETRY_HEADER_SIZE + self.capacity * TELEMETRY_DTYPE.itemsize)
+        self.records = np.memmap(self.path, dtype=TELEMETRY_DTYPE, mode="r+",
+                                 offset=TELEMETRY_HEADER_SIZE, shape=(self.capacity,))
+        self.header = np.memmap(self.path, dtype="<u8", mode="r+", offset=len(TELEMETRY_MAGIC), shape=(1,))
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.records.flush()
+        self.header.flush()
+        self.records = None
+        self.header = None
+        # Cut off the unused part of the last chunk.
+        with open(self.path, "r+b") as file:
+            file.truncate(TELEMETRY_HEADER_SIZE + self.count * TELEMETRY_DTYPE.itemsize)
+
+
+def loadTelemetry(path):
+    # Returns the records as a structured array mapped from the file. Works on logs that are still written.
+    with open(path, "rb") as file:
+        header = file.read(TELEMETRY_HEADER_SIZE)
+    if len(header) < TELEMETRY_HEADER_SIZE or header[:len(TELEMETRY_MAGIC)] != TELEMETRY_MAGIC:
+        raise ValueError(path + " is not a telemetry log.")
+    count = int(np.frombuffer(header, dtype="<u8", offset=len(TELEMETRY_MAGIC))[0])
+    if count == 0:
+        return np.zeros(0, dtype=TELEMETRY_DTYPE)
+    return np.memmap(path, dtype=TELEMETRY_DTYPE, mode="r", offset=TELEMETRY_HEADER_SIZE, shape=(count,))
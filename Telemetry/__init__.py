@@ -0,0 +1,7 @@
+from .TelemetryLog import TelemetryLogger
+from .TelemetryLog import RecordKind
+from .TelemetryLog import loadTelemetry
+from .StateBroadcast import StateBroadcaster
+from .StateBroadcast import STATE_DTYPE
+from .StateClient import StateClient
+from .StateClient import decodeState
@@ -0,0 +1,149 @@
+# Runs the vision pipeline and the strategy over a recorded video as fast as possible, without Qt
+# and without real-time pacing. The video is split into chunks that are processed by worker processes.
+# Usage: python -m Tools.BatchProcess recording.avi --profile lab --output tracking.csv
+import os
+import sys
+import math
+import time
+import argparse
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Constants import *
+from Calibration import CalibrationProfile
+from Camera import orientFrame
+from Processing.Pipeline import VisionPipeline
+from Strategy import STRATEGIES
+
+# One row per frame of the video. Positions are in pixels of the warped frame, NaN if the object was not found.
+BATCH_DTYPE = np.dtype([
+    ("frame", "<u4"),
+    ("timestamp", "<f8"),
+    ("puckX", "<f4"),
+    ("puckY", "<f4"),
+    ("puckRadius", "<f4"),
+    ("puckConfidence", "<f4"),
+    ("puckVelocityX", "<f4"),
+    ("puckVelocityY", "<f4"),
+    ("streak", "u1"),
+    ("robotX", "<f4"),
+    ("robotY", "<f4"),
+    ("robotRadius", "<f4"),
+    ("robotConfidence", "<f4"),
+    ("opponentX", "<f4"),
+    ("opponentY", "<f4"),
+    ("opponentRadius", "<f4"),
+    ("predictedX", "<f4"),
+    ("predictedY", "<f4"),
+    ("targetX", "<f4"),
+    ("targetY", "<f4"),
+])
+
+
+def getVideoInfo(path):
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise OSError("Cannot open video " + path + ".")
+    frameCount = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    frameRate = capture.get(cv2.CAP_PROP_FPS) or CAMERA_FRAMERATE
+    capture.release()
+    return frameCount, frameRate
+
+
+def initWorker():
+    # The parallelism comes from the processes, OpenCV threads would only compete with them.
+    cv2.setNumThreads(1)
+
+
+def processChunk(path, start, end, frameRate, profileName, profileDirectory, warp, orient=True):
+    # Processes frames [start, end). The frames of the overlap before start only warm up the track and the strategy.
+    # Raw camera frames are oriented like Camera does before they are warped with the corners of the profile.
+    profile = CalibrationProfile.load(profileName, profileDirectory)
+    pipeline = VisionPipeline(profile)
+    strategy = STRATEGIES[STRATEGY](defensiveLine=profile.defensiveLine, speedThreshold=profile.speedThreshold)
+    first = max(0, start - BATCH_CHUNK_OVERLAP)
+    capture = cv2.VideoCapture(path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+    rows = np.zeros(end - start, dtype=BATCH_DTYPE)
+    count = 0
+    for index in range(first, end):
+        ok, frame = capture.read()
+        if not ok:
+            break
+        timestamp = index / frameRate
+        if warp:
+            if orient:
+                frame = orientFrame(frame)
+            frame = pipeline.warp(frame)
+        detection = pipeline.detect(frame, timestamp)
+        target = strategy.step(detection.puck, detection.robot, detection.opponent)
+        if index < start:
+            continue
+        prediction = strategy.prediction
+        rows[count] = (
+            index, timestamp,
+            detection.puckX, detection.puckY, detection.puckRadius, detection.puckConfidence,
+            detection.puckVelocityX, detection.puckVelocityY, detection.streak,
+            detection.robotX, detection.robotY, detection.robotRadius, detection.robotConfidence,
+            detection.opponentX, detection.opponentY, detection.opponentRadius,
+            math.nan if prediction is None else prediction.x, math.nan if prediction is None else prediction.y,
+            target.x, target.y,
+        )
+        count += 1
+    capture.release()
+    return rows[:count]
+
+
+def saveTable(path, table):
+    if path.endswith(".npy"):
+        np.save(path, table)
+        return
+    formats = ["%d" if table.dtype[name].kind in "iu" else "%.3f" for name in table.dtype.names]
+    np.savetxt(path, table, fmt=formats, delimiter=",", header=",".join(table.dtype.names), comments="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the vision pipeline over a recorded video.")
+    parser.add_argument("video")
+    parser.add_argument("--profile", default=CALIBRATION_PROFILE,
+                        help="Name of the calibration profile the video was recorded with.")
+    parser.add_argument("--profile-dir", default=CALIBRATION_PROFILE_DIR)
+    parser.add_argument("--no-warp", action="store_true", help="The video already shows the warped table.")
+    parser.add_argument("--oriented", action="store_true",
+                        help="The video is already rotated like the camera view of the GUI, not raw camera frames.")
+    parser.add_argument("--chunk-frames", type=int, default=BATCH_CHUNK_FRAMES)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="tracking.csv", help="CSV file, or .npy for a structured array.")
+    args = parser.parse_args()
+
+    frameCount, frameRate = getVideoInfo(args.video)
+    if frameCount <= 0:
+        print("ERROR: Cannot get the frame count of " + args.video + ".")
+        return 1
+    chunks = [(start, min(start + args.chunk_frames, frameCount))
+              for start in range(0, frameCount, args.chunk_frames)]
+    print(f"Processing {frameCount} frames in {len(chunks)} chunks with {args.processes} processes.")
+
+    start_time = time.perf_counter()
+    tables = []
+    with ProcessPoolExecutor(args.processes, initializer=initWorker) as executor:
+        futures = [executor.submit(processChunk, args.video, start, end, frameRate, args.profile,
+                                   args.profile_dir, not args.no_warp, not args.oriented)
+                   for start, end in chunks]
+        # Collect in order so the merged table is sorted by frame.
+        for i, future in enumerate(futures):
+            tables.append(future.result())
+            print(f"Chunk {i + 1}/{len(chunks)} done.")
+    table = np.concatenate(tables)
+    elapsed = time.perf_counter() - start_time
+
+    saveTable(args.output, table)
+    print(f"Processed {len(table)} frames in {elapsed:.1f}s ({len(table) / elapsed:.0f} FPS), "
+          f"wrote {args.output}.")
+    if len(table) < frameCount:
+        print(f"WARNING: {frameCount - len(table)} frames could not be read.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# Benchmarks the vision and control hot paths on fixed synthetic or recorded frames.
+# Needs no camera and no Arduino, the serial port is replaced by FakeSerialPort.
+# A baseline is only valid on the machine and library versions it was recorded with, record it there first.
+# Usage: python -m Tools.Benchmark --save-baseline, then after a change python -m Tools.Benchmark --baseline
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import cv2
+import numpy as np
+from Constants import *
+from Calibration import CalibrationProfile
+from Processing.Prediction import predictIntercept
+from Processing.Pipeline import VisionPipeline
+from Processing.TrackBuffer import TrackBuffer
+from Processing.ProcessFrame import (
+    filterFrameHSV,
+    detectPuck,
+    findBestBlob,
+    findPuckStreak,
+    thresholdFrame,
+    maskFromBits,
+    warpFrame,
+)
+from Runtime import QualityLevel
+from Strategy import DefaultStrategy, PuckState, RobotState
+from StepperController import StepperController
+
+BENCHMARK_SEED = 2023
+
+
+class FakeSerialPort:
+    # Stands in for serial.Serial. Every line written is answered with OK like the firmware does.
+    def __init__(self):
+        self.written = 0
+        self.timeout = 1
+
+    def write(self, data):
+        self.written += len(data)
+        return len(data)
+
+    def readline(self):
+        return b"OK\n"
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def makeSyntheticFrames(count, seed=BENCHMARK_SEED):
+    # Camera frames after rotation with a green puck moving across a dark table and a bright robot.
+    rng = np.random.default_rng(seed)
+    height, width = CAMERA_FRAME_WIDTH, CAMERA_FRAME_HEIGHT
+    frames = []
+    for i in range(count):
+        frame = rng.integers(0, 30, (height, width, 3), dtype=np.uint8)
+        puck = (int(60 + (i * 17) % (width - 120)), int(height - 60 - (i * 23) % (height - 120)))
+        cv2.circle(frame, puck, 14, (40, 200, 60), -1)
+        cv2.circle(frame, (width // 2, 40), 22, (200, 200, 200), -1)
+        frames.append(frame)
+    return frames
+
+
+def loadVideoFrames(path, count):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(frame)
+    capture.release()
+    if not frames:
+        raise OSError("Cannot read frames from " + path + ".")
+    return frames
+
+
+def makeCases(frames):
+    # Every case is called with the iteration number and cycles through the frames.
+    profile = CalibrationProfile("benchmark")
+    warpMaps = profile.getWarpMaps()
+    homography = profile.getHomography()
+    lut = profile.getThresholdLUT()
+    warped = [warpFrame(frame, warpMaps) for frame in frames]
+    puckLower, puckUpper = np.array(profile.puckLowerBoundary), np.array(profile.puckUpperBoundary)
+    robotLower, robotUpper = np.array(profile.robotLowerBoundary), np.array(profile.robotUpperBoundary)
+    filtered = [filterFrameHSV(frame, puckLower, puckUpper, robotLower, robotUpper) for frame in warped]
+    # A red puck whose hue range wraps through 0, the way colourRangeFromSample returns it.
+    redLower, redUpper = (170, puckLower[1], puckLower[2]), (10, puckUpper[1], puckUpper[2])
+    bits = [thresholdFrame(frame, lut) for frame in warped]
+    puckMasks = [maskFromBits(frameBits, 0) for frameBits in bits]
+    robotMasks = [maskFromBits(frameBits, 1) for frameBits in bits]
+    count = len(frames)
+    warpSize = profile.warpSize
+
+    pipelines = {}
+
+    def pipelineDetect(level):
+        pipeline = pipelines.setdefault(level, VisionPipeline(profile))
+        return lambda i: pipeline.detect(warped[i % count], i / CAMERA_FRAMERATE, level)
+
+    # Shots towards the robot from all over the table.
+    rng = np.random.default_rng(BENCHMARK_SEED)
+    shots = [(rng.uniform(20, CAMERA_FRAME_HEIGHT - 20), rng.uniform(300, CAMERA_FRAME_WIDTH - 20),
+              rng.uniform(-800, 800), rng.uniform(-2500, -300)) for _ in range(256)]
+
+    def interceptPrediction(i):
+        x, y, velocityX, velocityY = shots[i % len(shots)]
+        return predictIntercept(x, y, velocityX, velocityY, SIMULATION_PUCK_RADIUS, DEFENSIVE_LINE,
+                                CAMERA_FRAME_HEIGHT, STRATEGY_REFLECTION_FACTOR, STRATEGY_MAX_BOUNCES)
+
+    strategy = DefaultStrategy()
+    robot = RobotState(0.0, CAMERA_FRAME_HEIGHT / 2, DEFENSIVE_LINE, 0.0, 0.0)
+
+    def strategyUpdate(i):
+        x, y, velocityX, velocityY = shots[i % len(shots)]
+        # Alternate between shots and a resting puck so every state is visited.
+        if i % 4 == 3:
+            velocityX = velocityY = 0.0
+        return strategy.step(PuckState(i / CAMERA_FRAMERATE, x, y, velocityX, velocityY, 12, True), robot)
+
+    track = TrackBuffer(TRACK_BUFFER_SIZE)
+    for i in range(TRACK_BUFFER_SIZE):
+        track.append(i / CAMERA_FRAMERATE, i, 2 * i, 12, 180, 20, 20)
+
+    def trackUpdate(i):
+        track.append(i / CAMERA_FRAMERATE, i % 360, i % 640, 12, 180, 20, 20)
+        return track.puckVelocity(TRACK_VELOCITY_WINDOW)
+
+    def targetToSteps(i):
+        # The mapping MainWindow and TableEngine send every target through.
+        x, y, velocityX, velocityY = shots[i % len(shots)]
+        return profile.targetToSteps(x, y, velocityX, velocityY)
+
+    controller = StepperController("benchmark", STEPPER_BAUDRATE)
+    controller.connection = FakeSerialPort()
+
+    def stepperCommand(i):
+        return controller.move_to_position((i * 37) % TABLE_MAX_X, (i * 11) % TABLE_MAX_Y)
+
+    def stepperSetpoint(i):
+        return controller.send_setpoint(i, (i * 37) % TABLE_MAX_X, (i * 11) % TABLE_MAX_Y, 800, -400)
+
+    return {
+        "filterFrameHSV": lambda i: filterFrameHSV(warped[i % count], puckLower, puckUpper, robotLower, robotUpper),
+        "filterFrameHSVWrapped": lambda i: filterFrameHSV(warped[i % count], redLower, redUpper, robotLower,
+                                                          robotUpper),
+        "detectPuck": lambda i: detectPuck(filtered[i % count], puckLower, puckUpper),
+        "warpPerspective": lambda i: cv2.warpPerspective(frames[i % count], homography, warpSize),
+        "warpFrame": lambda i: warpFrame(frames[i % count], warpMaps),
+        "thresholdFrame": lambda i: thresholdFrame(warped[i % count], lut),
+        "findPuckStreak": lambda i: findPuckStreak(puckMasks[i % count]),
+        "findBestBlob": lambda i: findBestBlob(robotMasks[i % count], None, ROBOT_MIN_RADIUS, ROBOT_MAX_RADIUS),
+        "pipelineDetect": pipelineDetect(QualityLevel.FULL),
+        "pipelineDetectROI": pipelineDetect(QualityLevel.ROI),
+        "pipelineDetectCoarse": pipelineDetect(QualityLevel.COARSE),
+        "predictIntercept": interceptPrediction,
+        "strategyUpdate": strategyUpdate,
+        "trackVelocity": trackUpdate,
+        "targetToSteps": targetToSteps,
+        "stepperCommand": stepperCommand,
+        "stepperSetpoint": stepperSetpoint,
+    }
+
+
+def runCase(function, minTime, minIterations):
+    # Times every call on its own so the percentiles show the jitter, not only the mean.
+    for i in range(5):
+        function(i)
+    times = []
+    start = time.perf_counter()
+    i = 0
+    while i < minIterations or time.perf_counter() - start < minTime:
+        callStart = time.perf_counter_ns()
+        function(i)
+        times.append(time.perf_counter_ns() - callStart)
+        i += 1
+    times = np.array(times) / 1000
+    return {
+        "iterations": len(times),
+        "meanUs": float(times.mean()),
+        "medianUs": float(np.median(times)),
+        "p90Us": float(np.percentile(times, 90)),
+        "p99Us": float(np.percentile(times, 99)),
+        "minUs": float(times.min()),
+    }
+
+
+def compareMachines(machine, baseline):
+    # Fields of the machine block that differ from the baseline as "name: baseline != now".
+    return [f"{key}: {baseline.get(key)} != {value}" for key, value in machine.items() if baseline.get(key) != value]
+
+
+def compareResults(results, baseline, threshold, fastCaseThreshold=BENCHMARK_FAST_CASE_THRESHOLD,
+                   fastCaseUs=BENCHMARK_FAST_CASE_US):
+    # Returns the names of the cases whose median got slower than the baseline by more than the threshold.
+    # Cases of a few microseconds are compared by their minimum with fastCaseThreshold, the timer and the
+    # scheduler move their median.
+    regressions = []
+    for name, result in results["cases"].items():
+        if name not in baseline.get("cases", {}):
+            continue
+        fast = baseline["cases"][name]["medianUs"] < fastCaseUs
+        statistic = "minUs" if fast else "medianUs"
+        before = baseline["cases"][name][statistic]
+        after = result[statistic]
+        change = after / before - 1 if before > 0 else 0.0
+        result["compared"] = statistic
+        result["baselineUs"] = before
+        result["change"] = change
+        if change > (fastCaseThreshold if fast else threshold):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vision and control hot paths.")
+    parser.add_argument("--video", help="Use frames of this recording instead of synthetic ones.")
+    parser.add_argument("--frames", type=int, default=BENCHMARK_FRAMES)
+    parser.add_argument("--min-time", type=float, default=BENCHMARK_MIN_TIME, help="Seconds per case.")
+    parser.add_argument("--min-iterations", type=int, default=BENCHMARK_MIN_ITERATIONS)
+    parser.add_argument("--threads", type=int, help="OpenCV threads, the default of OpenCV if not given.")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", nargs="?", const=BENCHMARK_BASELINE,
+                        help="Results of an earlier run on this machine to compare with, " + BENCHMARK_BASELINE +
+                             " if no file is given.")
+    parser.add_argument("--save-baseline", nargs="?", const=BENCHMARK_BASELINE,
+                        help="Write the results as the baseline for later runs, " + BENCHMARK_BASELINE +
+                             " if no file is given.")
+    parser.add_argument("--other-machine", action="store_true",
+                        help="Compare with a baseline from another machine or other library versions anyway.")
+    parser.add_argument("--threshold", type=float,
+                        help="Relative slowdown of the median that counts as regression, cases below "
+                             "BENCHMARK_FAST_CASE_US use BENCHMARK_FAST_CASE_THRESHOLD. The threshold stored "
+                             "in the baseline if not given, BENCHMARK_REGRESSION_THRESHOLD without one.")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    if args.video:
+        frames = loadVideoFrames(args.video, args.frames)
+    else:
+        frames = makeSyntheticFrames(args.frames)
+    cases = makeCases(frames)
+    results = {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "opencvThreads": cv2.getNumThreads(),
+        },
+        "frames": "video " + args.video if args.video else f"synthetic {len(frames)}",
+        "threshold": args.threshold if args.threshold is not None else BENCHMARK_REGRESSION_THRESHOLD,
+        "cases": {},
+    }
+    for name, function in cases.items():
+        if args.filter not in name:
+            continue
+        results["cases"][name] = runCase(function, args.min_time, args.min_iterations)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        differences = compareMachines(results["machine"], baseline.get("machine", {}))
+        if differences:
+            print(f"The baseline {args.baseline} was recorded on another machine or with other versions:")
+            for difference in differences:
+                print(f"  {difference}")
+            if not args.other_machine:
+                print("Record a baseline here with --save-baseline, or compare anyway with --other-machine.")
+                return 2
+        # Results written with --output can be the next baseline, they keep the threshold they were compared with.
+        if args.threshold is None:
+            results["threshold"] = baseline.get("threshold", BENCHMARK_REGRESSION_THRESHOLD)
+        regressions = compareResults(results, baseline, results["threshold"])
+
+    print(f"{'case':<22} {'median us':>10} {'min us':>10} {'p99 us':>10} {'change':>8}")
+    for name, result in results["cases"].items():
+        change = f"{result['change']:+8.1%} {result['compared'][:-2]}" if "change" in result else ""
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<22} {result['medianUs']:10.1f} {result['minUs']:10.2f} {result['p99Us']:10.1f} {change}{flag}")
+    results["regressions"] = regressions
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(results, file, indent=4)
+    if regressions:
+        print(f"{len(regressions)} cases are more than {results['threshold']:.0%} slower than the baseline, "
+              f"or {BENCHMARK_FAST_CASE_THRESHOLD:.0%} for cases below {BENCHMARK_FAST_CASE_US} us.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# Plays simulated shots against the real vision pipeline, strategy and stepper link. A TwinWorld renders the
+# camera frames and the StepperEmulator stands in for the Arduino, the robot in the frames is where the emulated
+# motors are. TableEngine.step does what MainWindow.update does and sends the targets through the same
+# CalibrationProfile.targetToSteps. Reports the save rate and how long the robot takes to react, and fails if they
+# are worse than allowed. With --virtual-time everything runs on the clock of the emulator in one thread, so the
+# results are the same on every run and machine and the thresholds can gate a build.
+# Usage: python -m Tools.DigitalTwin --shots 50 --virtual-time --min-save-rate 0.6 --max-latency-ms 60
+import sys
+import json
+import math
+import time
+import argparse
+from threading import Thread, Event
+import numpy as np
+from Constants import *
+from Calibration import CalibrationProfile
+from Simulation import TwinWorld, SimulatedCamera, ShotOutcome
+from StepperController import StepperEmulator
+from Tables import TableConfig, TableEngine
+
+
+class WallClock:
+    # The engine runs on its own threads, waiting only lets time pass.
+    def now(self):
+        return time.monotonic()
+
+    def wait(self, duration):
+        time.sleep(duration)
+
+
+class VirtualClock:
+    # Runs the twin on the virtual clock of the emulator. Nothing runs on its own: while waiting, the frames are
+    # captured when they are due and processed processingTime later, and the move and stream workers are polled
+    # like their threads would run.
+    def __init__(self, emulator, camera, engine, processingTime=0.0, tick=0.001):
+        self.emulator = emulator
+        self.camera = camera
+        self.engine = engine
+        self.processingTime = processingTime
+        self.tick = tick
+        self.frameTime = 1 / camera.fps
+        self.nextFrame = emulator.now()
+        self.nextSetpoint = emulator.now()
+        # (time the processing is done, frame, capture timestamp) of the frames the engine is working on.
+        self.processing = []
+
+    def now(self):
+        return self.emulator.now()
+
+    def wait(self, duration):
+        end = self.now() + duration
+        while self.now() < end:
+            self.emulator.wait(min(self.tick, end - self.now()))
+            self.run(self.now())
+
+    def run(self, now):
+        engine = self.engine
+        if now >= self.nextFrame:
+            self.nextFrame += self.frameTime
+            self.camera.capture()
+            self.processing.append((now + self.processingTime, self.camera.get_current_frame(),
+                                    self.camera.frame_timestamp))
+        while self.processing and self.processing[0][0] <= now:
+            _, frame, captureTimestamp = self.processing.pop(0)
+            engine.step(frame, captureTimestamp)
+        engine.moveWorker.poll()
+        if engine.streamWorker is not None and now >= self.nextSetpoint:
+            self.nextSetpoint += engine.streamWorker.period
+            engine.streamWorker.tick()
+
+
+def startVirtual(engine, emulator):
+    # What TableEngine.start and connect do, without the threads. The processing time is not the time of the
+    # virtual clock, so the quality governor is left out.
+    engine.governor = None
+    try:
+        engine.stepperController.connect(STEPPER_READY_TIMEOUT)
+    except Exception as error:
+        engine.metrics.recordError(error)
+        engine.connected = False
+        return
+    engine.connected = True
+    if engine.streamWorker is not None:
+        engine.streamWorker.clock = emulator.now
+        engine.stepperController.start_stream()
+
+
+def runEngine(engine, stopped):
+    # What TableRuntime does for one table, frames are only processed once the link is up
+    # so the first target is not dropped.
+    while not stopped.is_set():
+        if engine.connected and engine.camera.new_frame:
+            captureTimestamp = engine.camera.frame_timestamp
+            engine.step(engine.camera.get_current_frame(), captureTimestamp)
+        else:
+            time.sleep(MULTI_TABLE_DISPATCH_INTERVAL)
+
+
+def waitUntilStill(emulator, clock, settleTime, timeout=3.0):
+    # Until the motors did not move for settleTime, a discrete move of both axes stops in between.
+    start = clock.now()
+    stillSince = start
+    while clock.now() - stillSince < settleTime and clock.now() - start < timeout:
+        if emulator.moving:
+            stillSince = clock.now()
+        clock.wait(0.005)
+
+
+def playShot(world, emulator, clock, shot, settleTime, timeout):
+    x, y, velocityX, velocityY = shot
+    world.place(x, y)
+    waitUntilStill(emulator, clock, settleTime)
+    launchTime = clock.now()
+    world.launch(velocityX, velocityY)
+    while world.outcome == ShotOutcome.NONE and world.puck is not None and clock.now() - launchTime < timeout:
+        clock.wait(0.001)
+    motionStarts = [start for start in list(emulator.motionStarts) if start >= launchTime]
+    motionStart = motionStarts[0] if motionStarts else None
+    frameTime = world.launchFrameTime
+    # The robot stays where it is if the shot cannot be reached or it already stands in the way,
+    # there is no reaction time then.
+    return {
+        "outcome": world.outcome.name,
+        "speed": math.hypot(velocityX, velocityY),
+        "moved": motionStart is not None,
+        # From the shot until the motors start to move.
+        "reactionMs": (motionStart - launchTime) * 1000 if motionStart is not None else None,
+        # From the exposure of the first frame that shows the shot until the motors start to move.
+        "captureToMotionMs": (motionStart - frameTime) * 1000
+        if motionStart is not None and frameTime is not None and motionStart >= frameTime else None,
+    }
+
+
+def summarize(shots):
+    def statistics(values):
+        values = np.array([value for value in values if value is not None])
+        if not len(values):
+            return {"count": 0, "meanMs": None, "p50Ms": None, "p95Ms": None}
+        return {"count": len(values), "meanMs": float(values.mean()), "p50Ms": float(np.percentile(values, 50)),
+                "p95Ms": float(np.percentile(values, 95))}
+
+    outcomes = [shot["outcome"] for shot in shots]
+    decided = outcomes.count(ShotOutcome.SAVED.name) + outcomes.count(ShotOutcome.GOAL.name)
+    return {
+        "shots": len(shots),
+        "saved": outcomes.count(ShotOutcome.SAVED.name),
+        "goals": outcomes.count(ShotOutcome.GOAL.name),
+        "undecided": outcomes.count(ShotOutcome.NONE.name),
+        "unmoved": sum(not shot["moved"] for shot in shots),
+        "saveRate": outcomes.count(ShotOutcome.SAVED.name) / decided if decided else None,
+        "reaction": statistics(shot["reactionMs"] for shot in shots),
+        "captureToMotion": statistics(shot["captureToMotionMs"] for shot in shots),
+    }
+
+
+def formatMs(value, width):
+    return f"{value:{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play simulated shots against the real control loop.")
+    parser.add_argument("--shots", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", help="Calibration profile to use, the defaults of Constants.py if not given.")
+    parser.add_argument("--stream", action="store_true", default=STEPPER_STREAM_ENABLED,
+                        help="Stream setpoints instead of discrete moves.")
+    parser.add_argument("--virtual-time", action="store_true",
+                        help="Run on the virtual clock of the emulator, the same results on every run.")
+    parser.add_argument("--processing-ms", type=float, default=0.0,
+                        help="Virtual time only. Milliseconds from the capture of a frame until its target is sent, "
+                             "the frame processing itself takes no virtual time.")
+    parser.add_argument("--settle-time", type=float, default=0.5,
+                        help="Seconds the puck lies still before the shot so the robot can return home.")
+    parser.add_argument("--timeout", type=float, default=4.0, help="Seconds until an undecided shot is given up.")
+    parser.add_argument("--min-save-rate", type=float, help="Fail if fewer shots are saved.")
+    parser.add_argument("--max-latency-ms", type=float,
+                        help="Fail if the 95th percentile of the capture to motion latency is higher.")
+    parser.add_argument("--output", help="Write the results and every shot to this JSON file.")
+    args = parser.parse_args()
+
+    profile = CalibrationProfile.load(args.profile) if args.profile else CalibrationProfile("twin")
+    emulator = StepperEmulator(virtualTime=args.virtual_time)
+    if args.virtual_time:
+        world = TwinWorld(profile, emulator, seed=args.seed, clock=emulator.now)
+        camera = SimulatedCamera(world, clock=emulator.now)
+    else:
+        world = TwinWorld(profile, emulator, seed=args.seed)
+        camera = SimulatedCamera(world)
+    engine = TableEngine(TableConfig("twin", None, STEPPER_EMULATOR_PORT, profile.name, True), camera=camera,
+                         emulator=emulator, profile=profile, stream=args.stream)
+    stopped = Event()
+    if args.virtual_time:
+        startVirtual(engine, emulator)
+        clock = VirtualClock(emulator, camera, engine, args.processing_ms / 1000)
+    else:
+        engine.start()
+        deadline = time.monotonic() + STEPPER_READY_TIMEOUT
+        while engine.connected is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        clock = WallClock()
+    if not engine.connected:
+        print(f"ERROR: The emulated stepper did not connect: {engine.metrics.lastError}")
+        engine.stop()
+        return 1
+    if not args.virtual_time:
+        Thread(target=runEngine, args=(engine, stopped), daemon=True).start()
+
+    physics = world.physics
+    rng = np.random.default_rng(args.seed)
+    shots = []
+    print(f"{'shot':>5} {'speed':>7} {'outcome':>8} {'react ms':>9} {'c2m ms':>7}")
+    for index in range(args.shots):
+        shot = playShot(world, emulator, clock, physics.randomShot(rng), args.settle_time, args.timeout)
+        shots.append(shot)
+        print(f"{index + 1:5d} {shot['speed']:7.0f} {shot['outcome']:>8} {formatMs(shot['reactionMs'], 9)} "
+              f"{formatMs(shot['captureToMotionMs'], 7)}")
+    stopped.set()
+    engine.stop()
+
+    results = summarize(shots)
+    results["engine"] = engine.getMetrics()
+    if args.virtual_time:
+        # Capture timestamps are virtual, the latencies of the engine would compare them with the wall clock.
+        del results["engine"]["latencyMeanMs"], results["engine"]["latencyP99Ms"]
+    results["stream"] = args.stream
+    results["virtualTime"] = args.virtual_time
+    results["shotResults"] = shots
+    capture = results["captureToMotion"]
+    saveRate = f"{results['saveRate']:.1%}" if results["saveRate"] is not None else "-"
+    print(f"Saved {results['saved']} of {results['saved'] + results['goals']} decided shots ({saveRate}), "
+          f"{results['undecided']} undecided. The robot did not move for {results['unmoved']} shots.")
+    print(f"Capture to motion: mean {formatMs(capture['meanMs'], 0)} ms, p95 {formatMs(capture['p95Ms'], 0)} ms "
+          f"over {capture['count']} shots.")
+    if not args.virtual_time:
+        print(f"Frame to command: mean {results['engine']['latencyMeanMs']:.1f} ms.")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    failures = []
+    if args.min_save_rate is not None and not (results["saveRate"] is not None and
+                                               results["saveRate"] >= args.min_save_rate):
+        failures.append(f"save rate {saveRate} is below {args.min_save_rate:.1%}")
+    if args.max_latency_ms is not None and not (capture["p95Ms"] is not None and
+                                                capture["p95Ms"] <= args.max_latency_ms):
+        failures.append(f"capture to motion p95 {formatMs(capture['p95Ms'], 0)} ms is above "
+                        f"{args.max_latency_ms:.1f} ms")
+    for failure in failures:
+        print(f"FAILED: {failure}.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# Runs the estimation and strategy over simulated shots and recorded sessions for every combination
+# of parameters and reports save rate, prediction error and compute time.
+# Only the strategy side is replayed: the tracks are puck positions, with simulated detection noise or as the
+# session logged them, and the vision pipeline is not run. Detection parameters cannot be swept with this.
+# The speed threshold only matters in configurations with the attack enabled, --attack 0 1 sweeps both.
+# Usage: python -m Tools.ParameterSweep --shots 500 --reflection-factor 2 2.5 3 --edge-guard 30 50
+import os
+import sys
+import csv
+import math
+import time
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Constants import *
+from Calibration import CalibrationProfile
+from Simulation import PuckPhysics
+from Simulation.Replay import replayTrack
+from Strategy import DefaultStrategy
+from Telemetry import RecordKind, loadTelemetry
+
+PARAMETERS = ["reflectionFactor", "edgeGuard", "defensiveLine", "attackEnabled", "speedThreshold", "deadband"]
+
+# Tracks and profile of the current worker process, set once by the pool initializer so they are not sent per task.
+workerTracks = []
+workerProfile = None
+
+
+def makeSimulatedTracks(count, seed, noise):
+    physics = PuckPhysics()
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for _ in range(count):
+        timestamps, observedX, observedY, trueX, trueY = physics.simulateShot(
+            *physics.randomShot(rng), CAMERA_FRAMERATE, noise, rng)
+        tracks.append((timestamps, observedX, observedY))
+    return tracks
+
+
+def loadRecordedTracks(paths):
+    tracks = []
+    for path in paths:
+        records = loadTelemetry(path)
+        frames = records[records["kind"] == RecordKind.FRAME.value]
+        if len(frames) > 1:
+            tracks.append((np.array(frames["timestamp"]), np.array(frames["puckX"], dtype=np.float64),
+                           np.array(frames["puckY"], dtype=np.float64)))
+    return tracks
+
+
+def initWorker(tracks, profile):
+    global workerTracks, workerProfile
+    workerTracks = tracks
+    workerProfile = profile
+
+
+def makeConfigs(args):
+    # Without the attack the speed threshold is not used, those configurations are only evaluated once.
+    configs = []
+    for values in itertools.product(args.reflection_factor, args.edge_guard, args.defensive_line, args.attack,
+                                    args.speed_threshold, args.deadband):
+        config = dict(zip(PARAMETERS, values))
+        config["attackEnabled"] = bool(config["attackEnabled"])
+        if not config["attackEnabled"]:
+            config["speedThreshold"] = math.nan
+        if config not in configs:
+            configs.append(config)
+    return configs
+
+
+def evaluate(config):
+    speedThreshold = config["speedThreshold"] if config["attackEnabled"] else SPEED_THRESHOLD
+    strategy = DefaultStrategy(defensiveLine=config["defensiveLine"], reflectionFactor=config["reflectionFactor"],
+                               edgeGuard=config["edgeGuard"], speedThreshold=speedThreshold,
+                               attackEnabled=config["attackEnabled"])
+    saves = 0
+    shots = 0
+    errors = []
+    computeTime = 0.0
+    frames = 0
+    for timestamps, xs, ys in workerTracks:
+        events, trackComputeTime = replayTrack(timestamps, xs, ys, strategy, workerProfile,
+                                                   config["deadband"])
+        computeTime += trackComputeTime
+        frames += len(timestamps)
+        for saved, predictionError in events:
+            shots += 1
+            saves += saved
+            if not math.isnan(predictionError):
+                errors.append(predictionError)
+    result = dict(config)
+    result["shots"] = shots
+    result["saveRate"] = saves / shots if shots else math.nan
+    result["predictionRate"] = len(errors) / shots if shots else math.nan
+    result["meanPredictionError"] = float(np.mean(errors)) if errors else math.nan
+    result["medianPredictionError"] = float(np.median(errors)) if errors else math.nan
+    result["computeTimePerFrameUs"] = computeTime / frames * 1e6 if frames else math.nan
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over simulated and recorded shots.")
+    parser.add_argument("--shots", type=int, default=500, help="Number of simulated shots.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=SIMULATION_POSITION_NOISE,
+                        help="Detection noise of the simulated shots in pixels.")
+    parser.add_argument("--sessions", nargs="*", default=[], help="Telemetry logs to replay as well.")
+    parser.add_argument("--profile", help="Calibration profile that maps targets to steps, the defaults of "
+                                          "Constants.py if not given.")
+    parser.add_argument("--reflection-factor", type=float, nargs="+", default=[STRATEGY_REFLECTION_FACTOR])
+    parser.add_argument("--edge-guard", type=float, nargs="+", default=[STRATEGY_EDGE_GUARD])
+    parser.add_argument("--defensive-line", type=float, nargs="+", default=[DEFENSIVE_LINE])
+    parser.add_argument("--attack", type=int, choices=[0, 1], nargs="+", default=[int(STRATEGY_ATTACK_ENABLED)],
+                        help="Attack slow pucks, 0 or 1.")
+    parser.add_argument("--speed-threshold", type=float, nargs="+", default=[SPEED_THRESHOLD],
+                        help="Only used with the attack.")
+    parser.add_argument("--deadband", type=float, nargs="+", default=[STEPPER_DEADBAND],
+                        help="Dead-band of the discrete moves in steps.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--output", help="Write all results to this CSV file.")
+    args = parser.parse_args()
+
+    profile = CalibrationProfile.load(args.profile) if args.profile else CalibrationProfile("sweep")
+    tracks = makeSimulatedTracks(args.shots, args.seed, args.noise) + loadRecordedTracks(args.sessions)
+    configs = makeConfigs(args)
+    print(f"Evaluating {len(configs)} configurations on {len(tracks)} tracks with {args.processes} processes.")
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(args.processes, initializer=initWorker, initargs=(tracks, profile)) as executor:
+        results = list(executor.map(evaluate, configs))
+    elapsed = time.perf_counter() - start_time
+
+    results.sort(key=lambda result: (-np.nan_to_num(result["saveRate"]), result["meanPredictionError"]))
+    print(f"{'reflect':>8} {'edge':>6} {'line':>6} {'attack':>6} {'speed':>6} {'dead':>6} "
+          f"{'saves':>7} {'pred':>7} {'err px':>8} {'us/frame':>9}")
+    for result in results:
+        speed = f"{result['speedThreshold']:6.0f}" if result["attackEnabled"] else f"{'-':>6}"
+        print(f"{result['reflectionFactor']:8.2f} {result['edgeGuard']:6.0f} {result['defensiveLine']:6.0f} "
+              f"{result['attackEnabled']:>6} {speed} {result['deadband']:6.0f} {result['saveRate']:7.1%} "
+              f"{result['predictionRate']:7.1%} {result['meanPredictionError']:8.1f} "
+              f"{result['computeTimePerFrameUs']:9.1f}")
+    print(f"Done in {elapsed:.1f}s.")
+
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,11 @@
+import os
 import sys
+import time
+import argparse
 import cv2
 import math
 import numpy as np
 from datetime import datetime
-from collections import deque
 from PyQt5.QtCore import Qt, QTimer, QFile, QIODevice, QTextStream
 from PyQt5.QtGui import QImage, QPixmap, QIcon, QFont
 from PyQt5.QtWidgets import (
@@ -22,21 +24,31 @@ from PyQt5.QtWidgets import (
 from Constants import *
 from Camera import Camera
 from StepperController import *
-from Processing.ProcessFrame import detectPuck, markInFrame, markRobotRectangle
-from Processing.Line import Line
+from Processing.ProcessFrame import (
+    markInFrame,
+    markRobotRectangle,
+    markPrediction,
+)
+from Calibration import CalibrationProfile
+from Processing.Pipeline import VisionPipeline
+from Runtime import QualityGovernor, QualityLevel
+# Telemetry, the preview, the strategies and the automatic calibration are imported where they are used,
+# so the splash screen shows without waiting for them.
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, profileName=CALIBRATION_PROFILE, realTime=False, preview=False):
         super().__init__()
         self.setWindowTitle("Rocky Hockey 2023")
         self.setWindowIcon(QIcon('RockyHockey2023Logo.png'))
+        # Calibration of this table and lighting. Falls back to the values in Constants.py.
+        self.profile = CalibrationProfile.load(profileName)
         self.setupUI()
         # Create a timer to continuously update and process the camera image.
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update)
         self.timer.start(1)
-        # Camera used for image.
+        # Camera used for image. It is opened in its own thread.
         self.camera = Camera(
             CAMERA_INDEX,
             CAMERA_FRAME_WIDTH,
@@ -44,40 +56,58 @@ class MainWindow(QMainWindow):
             CAMERA_FOCUS,
             CAMERA_BUFFERSIZE,
             CAMERA_FRAMERATE,
-        ).start()
-        self.stepperController = None
-        try:
-            self.stepperController = StepperController(
-                STEPPER_COM_PORT, STEPPER_BAUDRATE
-            )
-            self.stepperController.connect()
-        except Exception:
-            self.logTextbox.append(
-                "ERROR: No Arduino found on " + STEPPER_COM_PORT + "."
-            )
-            self.stepperController = None
+            CAMERA_FOURCC,
+            CAMERA_DECODE_THREADS,
+        )
+        if realTime:
+            # Keep capture and decoding off the vision cores.
+            self.camera.cpu_cores = REALTIME_CAPTURE_CORES
+            self.camera.decode_cores = REALTIME_DECODE_CORES
+            self.camera.priority = REALTIME_PRIORITY
+        self.camera.start()
+        self.stepperController = StepperController(
+            STEPPER_COM_PORT, STEPPER_BAUDRATE
+        )
+        # Session log of every frame and command, written in the background.
+        self.telemetry = None
+        if TELEMETRY_ENABLED:
+            from Telemetry import TelemetryLogger
+            self.telemetry = TelemetryLogger(
+                os.path.join(TELEMETRY_DIR, datetime.now().strftime("session-%Y%m%d-%H%M%S.rhlog")),
+                TELEMETRY_QUEUE_SIZE,
+            ).start()
+        # State of every frame as UDP datagram for external dashboards.
+        self.broadcaster = None
+        if BROADCAST_ENABLED:
+            from Telemetry import StateBroadcaster
+            self.broadcaster = StateBroadcaster(BROADCAST_ADDRESS, BROADCAST_PORT)
         # Thread for communication with the arduino so the UI does not hang.
         self.moveWorker = MoveWorker(self.stepperController)
+        self.moveWorker.telemetry = self.telemetry
+        if realTime:
+            self.moveWorker.cpu_cores = REALTIME_CAPTURE_CORES
         self.moveWorker.start()
+        # Streaming mode replaces the moves of the MoveWorker once the Arduino is connected.
+        self.streamWorker = None
+        if STEPPER_STREAM_ENABLED:
+            self.streamWorker = StreamWorker(self.stepperController)
+            if realTime:
+                self.streamWorker.cpu_cores = REALTIME_CAPTURE_CORES
+        # Connect to the arduino in the background while the camera opens and the UI shows up.
+        self.connectWorker = ConnectWorker(self.stepperController, STEPPER_READY_TIMEOUT)
+        self.connectWorker.connected.connect(self.onStepperConnected)
+        self.connectWorker.start()
         # Coordinates to crop the camera image to fit the table.
-        self.croppedTableCoords = [(TABLE_CORNER_TOP_LEFT_X, TABLE_CORNER_TOP_LEFT_Y),
-                                   (TABLE_CORNER_TOP_RIGHT_X,
-                                    TABLE_CORNER_TOP_RIGHT_Y),
-                                   (TABLE_CORNER_BOTTOM_RIGHT_X,
-                                    TABLE_CORNER_BOTTOM_RIGHT_Y),
-                                   (TABLE_CORNER_BOTTOM_LEFT_X, TABLE_CORNER_BOTTOM_LEFT_Y)]
+        self.croppedTableCoords = list(self.profile.tableCorners)
         # Is the image already cropped?
         self.cornersApplied = True
-        # Original corner coordinates when cropping is reset.
-        self.originalCorners = np.float32(
-            [
-                [0, 0],
-                [CAMERA_FRAME_HEIGHT - 1, 0],
-                [CAMERA_FRAME_HEIGHT - 1, CAMERA_FRAME_WIDTH - 1],
-                [0, CAMERA_FRAME_WIDTH - 1],
-            ]
-        )
-        self.speedThreshold = SPEED_THRESHOLD
+        # Camera frames collected for the automatic corner detection, None if it is not running.
+        self.autoCornerFrames = None
+        # "puck" or "robot" while the next left click picks the colour of that object, and the frame it picks from.
+        self.colourPick = None
+        self.colourPickFrame = None
+        self.speedThreshold = self.profile.speedThreshold
+        self.defensiveLine = self.profile.defensiveLine
         self.upperBorder = [(0, 0), (CAMERA_FRAME_WIDTH, 0)]
         self.lowerBorder = [
             (0, CAMERA_FRAME_HEIGHT),
@@ -88,34 +118,38 @@ class MainWindow(QMainWindow):
             (CAMERA_FRAME_WIDTH, 0),
             (CAMERA_FRAME_WIDTH, CAMERA_FRAME_HEIGHT),
         ]
-        self.lastPosition = (0, 0)
-        self.currentPosition = (0, 0)
+        # Warp and detection of puck and robot. Keeps the track of the last frames.
+        self.pipeline = VisionPipeline(self.profile)
         self.frameCounter = 0
-        self.moveForward = True
-        self.lastRobotPosition = (0, 0)
-        self.currentRobotPosition = (0, 0)
+        # Frames per second grabbed and decoded by the camera, updated about once per second.
+        self.cameraRates = (0.0, 0.0)
         self.robotSpeed = 0
         self.puckSpeed = 0
         self.robotIsStopped = True
-        self.robotWasStopped = True
-        self.puckPositions = deque(maxlen=MAX_PUCK_POSITION_BUFFER)
         self.positionsSent = 0
         self.botActivated = False
-        self.showDebugImages = True
-        self.wasPuckGoingToRobot = False
-        self.isPuckGoingToRobot = False
-        self.predictionMade = False
-        self.puckIsGoingLeft = False
-        self.puckWasGoingLeft = False
-        self.predictionLine = Line((0, 0), (0, 0))
-        self.predictedPoint = (0, 0)
-        self.collisionPoint = (0, 0)
-        self.reflectionLine = Line((0, 0), (0, 0))
-        self.puckCollides = False
-        self.savedPoint = (0, 0)
+        self.showDebugImages = LOCAL_DISPLAY_ENABLED
+        # Remote view of the annotated frame and the state over HTTP.
+        self.preview = None
+        if preview:
+            from Preview import PreviewServer
+            try:
+                self.preview = PreviewServer(PREVIEW_HOST, PREVIEW_PORT, PREVIEW_JPEG_QUALITY,
+                                             PREVIEW_DEFAULT_FPS, PREVIEW_MAX_FPS).start()
+                self.logTextbox.append(f"Preview on http://{PREVIEW_HOST}:{PREVIEW_PORT}/")
+            except OSError as error:
+                self.logTextbox.append(f"ERROR: Cannot start the preview on port {PREVIEW_PORT}: {error}")
+        # Decides where the robot goes. Knows nothing about the GUI.
+        from Strategy import STRATEGIES
+        self.strategy = STRATEGIES[STRATEGY](defensiveLine=self.defensiveLine,
+                                             speedThreshold=self.speedThreshold)
+        # Sheds display and detection work when frames take longer than the camera frame time.
+        self.governor = None
+        if QUALITY_GOVERNOR_ENABLED:
+            self.governor = QualityGovernor(1 / CAMERA_FRAMERATE)
+        # Position of the last target so it is only sent when it changes.
+        self.lastTargetPosition = None
         self.lastMovePosition = (0, 0)
-        self.wentBackToGoal = False
-        self.attacked = False
         self.testTime = datetime.now()
         self.currentFrameTimestamp = datetime.now()
         self.lastFrameTimestamp = datetime.now()
@@ -188,8 +222,22 @@ class MainWindow(QMainWindow):
         self.cornersApplyButton.clicked.connect(self.applyCorners)
         self.cornersResetButton = QPushButton("Reset Corners", self)
         self.cornersResetButton.clicked.connect(self.resetCorners)
+        self.saveProfileButton = QPushButton("Save Profile", self)
+        self.saveProfileButton.clicked.connect(self.saveProfile)
         self.cornersHBox.addWidget(self.cornersApplyButton)
         self.cornersHBox.addWidget(self.cornersResetButton)
+        self.cornersHBox.addWidget(self.saveProfileButton)
+        # Automatic calibration.
+        self.autoCalibrationHBox = QHBoxLayout()
+        self.autoCornersButton = QPushButton("Auto Corners", self)
+        self.autoCornersButton.clicked.connect(self.startAutoCorners)
+        self.pickPuckColourButton = QPushButton("Pick Puck Colour", self)
+        self.pickPuckColourButton.clicked.connect(lambda: self.startColourPick("puck"))
+        self.pickRobotColourButton = QPushButton("Pick Robot Colour", self)
+        self.pickRobotColourButton.clicked.connect(lambda: self.startColourPick("robot"))
+        self.autoCalibrationHBox.addWidget(self.autoCornersButton)
+        self.autoCalibrationHBox.addWidget(self.pickPuckColourButton)
+        self.autoCalibrationHBox.addWidget(self.pickRobotColourButton)
         self.botSettingsHBox = QHBoxLayout()
         self.activateBotCheckBox = QCheckBox("Bot Active")
         self.botSettingsHBox.addWidget(self.activateBotCheckBox)
@@ -205,6 +253,7 @@ class MainWindow(QMainWindow):
         self.vboxLeft.addLayout(self.robotValuesHBox)
         self.vboxLeft.addLayout(self.filterRobotVbox)
         self.vboxLeft.addLayout(self.cornersHBox)
+        self.vboxLeft.addLayout(self.autoCalibrationHBox)
         self.vboxLeft.addLayout(self.botSettingsHBox)
         self.vboxLeft.addWidget(self.logTextbox)
         self.vboxLeft.addWidget(self.exitButton)
@@ -239,12 +288,12 @@ class MainWindow(QMainWindow):
         self.upperSaturationRobotSlider.setMaximum(255)
         self.upperValueRobotSlider.setMinimum(0)
         self.upperValueRobotSlider.setMaximum(255)
-        self.lowerHueRobotSlider.setValue(CAMERA_ROBOT_LOWER_HUE)
-        self.lowerSaturationRobotSlider.setValue(CAMERA_ROBOT_LOWER_SATURATION)
-        self.lowerValueRobotSlider.setValue(CAMERA_ROBOT_LOWER_VALUE)
-        self.upperHueRobotSlider.setValue(CAMERA_ROBOT_UPPER_HUE)
-        self.upperSaturationRobotSlider.setValue(CAMERA_ROBOT_UPPER_SATURATION)
-        self.upperValueRobotSlider.setValue(CAMERA_ROBOT_UPPER_VALUE)
+        self.lowerHueRobotSlider.setValue(self.profile.robotLowerBoundary[0])
+        self.lowerSaturationRobotSlider.setValue(self.profile.robotLowerBoundary[1])
+        self.lowerValueRobotSlider.setValue(self.profile.robotLowerBoundary[2])
+        self.upperHueRobotSlider.setValue(self.profile.robotUpperBoundary[0])
+        self.upperSaturationRobotSlider.setValue(self.profile.robotUpperBoundary[1])
+        self.upperValueRobotSlider.setValue(self.profile.robotUpperBoundary[2])
         self.lowerHueRobotLabel = QLabel(str(self.lowerHueRobotSlider.value()))
         self.lowerSaturationRobotLabel = QLabel(
             str(self.lowerSaturationRobotSlider.value()))
@@ -360,12 +409,12 @@ class MainWindow(QMainWindow):
         self.upperSaturationSlider.setMaximum(255)
         self.upperValueSlider.setMinimum(0)
         self.upperValueSlider.setMaximum(255)
-        self.lowerHueSlider.setValue(CAMERA_LOWER_HUE)
-        self.lowerSaturationSlider.setValue(CAMERA_LOWER_SATURATION)
-        self.lowerValueSlider.setValue(CAMERA_LOWER_VALUE)
-        self.upperHueSlider.setValue(CAMERA_UPPER_HUE)
-        self.upperSaturationSlider.setValue(CAMERA_UPPER_SATURATION)
-        self.upperValueSlider.setValue(CAMERA_UPPER_VALUE)
+        self.lowerHueSlider.setValue(self.profile.puckLowerBoundary[0])
+        self.lowerSaturationSlider.setValue(self.profile.puckLowerBoundary[1])
+        self.lowerValueSlider.setValue(self.profile.puckLowerBoundary[2])
+        self.upperHueSlider.setValue(self.profile.puckUpperBoundary[0])
+        self.upperSaturationSlider.setValue(self.profile.puckUpperBoundary[1])
+        self.upperValueSlider.setValue(self.profile.puckUpperBoundary[2])
         self.lowerHueLabel = QLabel(str(self.lowerHueSlider.value()))
         self.lowerSaturationLabel = QLabel(
             str(self.lowerSaturationSlider.value()))
@@ -450,8 +499,43 @@ class MainWindow(QMainWindow):
     def exitApp(self):
         self.timer.stop()
         self.camera.stop()
+        if self.preview is not None:
+            self.preview.stop()
+        if self.broadcaster is not None:
+            self.broadcaster.close()
+        if self.streamWorker is not None and self.streamWorker.isRunning():
+            # Lets the firmware leave streaming mode.
+            self.streamWorker.stop()
+            self.streamWorker.wait(1000)
+        if self.moveWorker.isRunning():
+            self.moveWorker.stop()
+            self.moveWorker.wait(1000)
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        # Keep the live tweaks for the next start.
+        self.saveProfile()
         sys.exit()
 
+    def saveProfile(self):
+        try:
+            self.profile.save()
+            self.logTextbox.append(f"Saved calibration profile '{self.profile.name}'.")
+        except OSError as error:
+            self.logTextbox.append(f"ERROR: Cannot save calibration profile '{self.profile.name}': {error}")
+
+    def onStepperConnected(self, success):
+        if success:
+            self.logTextbox.append("Arduino ready on " + STEPPER_COM_PORT + ".")
+            if self.streamWorker is not None:
+                self.streamWorker.start()
+                self.logTextbox.append(f"Streaming setpoints at {STEPPER_STREAM_RATE} Hz.")
+        else:
+            self.logTextbox.append(
+                "ERROR: No Arduino found on " + STEPPER_COM_PORT + "."
+            )
+            self.stepperController = None
+            self.moveWorker.stepperController = None
+
     def setBotState(self):
         if self.activateBotCheckBox.checkState() == Qt.CheckState.Checked:
             self.botActivated = True
@@ -464,6 +548,7 @@ class MainWindow(QMainWindow):
                 "Applied corners. Fitting image. If the image does not look right then reset the corners. Start at the top left and then go counter clock wise."
             )
             self.cornersApplied = True
+            self.profile.setTableCorners(self.croppedTableCoords)
         else:
             self.logTextbox.append(
                 "ERROR: Not all corners set. There must be 4 corners set. Use left click to set the corners."
@@ -475,6 +560,60 @@ class MainWindow(QMainWindow):
         self.cornersApplied = False
         self.croppedTableCoords = []
 
+    def startAutoCorners(self):
+        # The corners are searched once AUTO_CALIBRATION_FRAMES camera frames are collected in update().
+        self.logTextbox.append("Searching the table corners. Keep hands off the table edges.")
+        self.autoCornerFrames = []
+
+    def collectAutoCornerFrame(self, frame):
+        # Copied because the corners are drawn into the unfitted frame.
+        self.autoCornerFrames.append(frame.copy())
+        if len(self.autoCornerFrames) < AUTO_CALIBRATION_FRAMES:
+            return
+        from Calibration.AutoCalibration import findTableCorners
+        start = time.perf_counter()
+        corners = findTableCorners(self.autoCornerFrames, self.profile.tableCorners)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.autoCornerFrames = None
+        if corners is None:
+            self.logTextbox.append(
+                "ERROR: Table corners not found, neither near the current ones nor anywhere else in the image. "
+                "Set them by hand.")
+            return
+        self.croppedTableCoords = corners
+        self.cornersApplied = True
+        self.profile.setTableCorners(corners)
+        self.logTextbox.append(f"Found the table corners {corners} in {elapsed:.0f}ms.")
+
+    def startColourPick(self, target):
+        self.colourPick = target
+        self.logTextbox.append(f"Left click on the {target} in the image to pick its colour.")
+
+    def pickColour(self, x, y):
+        target = self.colourPick
+        self.colourPick = None
+        if self.colourPickFrame is None:
+            return
+        from Calibration.AutoCalibration import colourRangeFromSample
+        start = time.perf_counter()
+        colourRange = colourRangeFromSample(self.colourPickFrame, x, y)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.colourPickFrame = None
+        if colourRange is None:
+            self.logTextbox.append("ERROR: Clicked outside the image.")
+            return
+        lowerBoundary, upperBoundary = colourRange
+        if target == "puck":
+            sliders = (self.lowerHueSlider, self.lowerSaturationSlider, self.lowerValueSlider,
+                       self.upperHueSlider, self.upperSaturationSlider, self.upperValueSlider)
+        else:
+            sliders = (self.lowerHueRobotSlider, self.lowerSaturationRobotSlider, self.lowerValueRobotSlider,
+                       self.upperHueRobotSlider, self.upperSaturationRobotSlider, self.upperValueRobotSlider)
+        # The next frame hands the slider values to the profile.
+        for slider, value in zip(sliders, lowerBoundary + upperBoundary):
+            slider.setValue(value)
+        self.logTextbox.append(f"Picked the {target} colour {lowerBoundary} to {upperBoundary} in {elapsed:.0f}ms.")
+
     def getImageClickPos(self, event):
         # The Camera image is double the size of the debug window image.
         x = event.pos().x()
@@ -482,43 +621,55 @@ class MainWindow(QMainWindow):
         print(f"Clicked x:{x}, y:{y}")
         # 1 is left click, 2 is right click
         mouseButton = event.button()
-        if mouseButton == 1 and len(self.croppedTableCoords) < 4:
+        if mouseButton == 1 and self.colourPick is not None:
+            self.pickColour(x, y)
+        elif mouseButton == 1 and len(self.croppedTableCoords) < 4:
             self.croppedTableCoords.append((x, y))
         elif mouseButton == 2:
-            moveX, moveY = self.mapCoordinates(
-                x,
-                y,
-                CAMERA_FRAME_HEIGHT,
-                CAMERA_FRAME_ROBOT_MAX_Y,
-                TABLE_MAX_X,
-                TABLE_MAX_Y,
-            )
-            moveX = TABLE_MAX_X - moveX
+            moveX, moveY, _, _ = self.profile.targetToSteps(x, y)
             self.logTextbox.append(
                 f"Clicked on {x},{y} in Image and moving to {int(moveX)},{int(moveY)}.")
-            self.sendMoveValues(moveX, moveY)
-
-    def sendMoveValues(self, x, y):
-        # Do scaling.
-        offset = (x - (TABLE_MAX_X / 2)) / 9
-        x += offset
-        y -= 50
+            self.sendSteps(moveX, moveY)
+
+    def sendMoveValues(self, x, y, velocityX=0.0, velocityY=0.0):
+        # Manual moves in steps, the stepper offset and stretch still apply.
+        self.sendSteps(*self.profile.calibrateSteps(x, y, velocityX, velocityY))
+
+    def sendSteps(self, x, y, velocityX=0.0, velocityY=0.0):
+        if self.streamWorker is not None:
+            # Every correction is streamed, the worker sends the latest one at the control rate.
+            if (x, y) != self.lastMovePosition:
+                self.lastMovePosition = (x, y)
+                self.positionsSent += 1
+                if self.telemetry is not None:
+                    self.telemetry.log_command(time.time(), x, y)
+            self.streamWorker.set_target(x, y, velocityX, velocityY)
+            return
 
-        if abs(x - self.lastMovePosition[0]) < 50 and abs(y - self.lastMovePosition[1]) < 50:
+        if isWithinDeadband(x, y, self.lastMovePosition):
             return
 
         self.lastMovePosition = (x, y)
 
         # if self.botActivated:
         self.positionsSent += 1
-        # print(f"Sending {self.positionsSent} (X:{int(x)}, Y:{int(y)})")
+        if self.telemetry is not None:
+            self.telemetry.log_command(time.time(), x, y)
         self.moveWorker.set_values(MoveType.NORMAL, x, y)
 
+    def sendTarget(self, target, velocity=(0.0, 0.0)):
+        # Targets are in pixels of the warped frame, the robot is mirrored in X.
+        # The velocity of a moving target is only used in streaming mode.
+        self.sendSteps(*self.profile.targetToSteps(target.x, target.y, velocity[0], velocity[1]))
+
     def calibrate(self):
         # Add your calibration code here
         if self.stepperController is not None:
             self.logTextbox.append("Calibrating...")
-            self.moveWorker.set_values(MoveType.CALIBRATE, 0, 0)
+            if self.streamWorker is not None and self.streamWorker.isRunning():
+                self.streamWorker.calibrate()
+            else:
+                self.moveWorker.set_values(MoveType.CALIBRATE, 0, 0)
             self.isAtZero = True
             self.sendMoveValues((TABLE_MAX_X / 2), 200)
         else:
@@ -557,38 +708,28 @@ class MainWindow(QMainWindow):
             )
 
     def update(self):
+        for warning in self.camera.take_warnings():
+            self.logTextbox.append(warning)
         if self.camera.new_frame:
             self.currentFrameTimestamp = datetime.now()
+            processingStart = time.perf_counter()
+            captureTimestamp = self.camera.frame_timestamp
             frame = self.camera.get_current_frame()
+            if self.autoCornerFrames is not None:
+                self.collectAutoCornerFrame(frame)
             if self.cornersApplied:
                 # If the corners are set then fit the image.
                 # Corners have to be inputted clockwise.
-                selectedCorners = np.float32(
-                    [
-                        [self.croppedTableCoords[0][0],
-                         self.croppedTableCoords[0][1]],
-                        [self.croppedTableCoords[1][0],
-                         self.croppedTableCoords[1][1]],
-                        [self.croppedTableCoords[2][0],
-                         self.croppedTableCoords[2][1]],
-                        [self.croppedTableCoords[3][0],
-                         self.croppedTableCoords[3][1]],
-                    ]
-                )
-
-                # Calculate transformation matrix.
-                matrix = cv2.getPerspectiveTransform(
-                    selectedCorners, self.originalCorners
-                )
-                # Warp the image.
-                frame = cv2.warpPerspective(
-                    frame, matrix, (CAMERA_FRAME_HEIGHT, CAMERA_FRAME_WIDTH)
-                )
+                frame = self.pipeline.warp(frame)
+            if self.colourPick is not None:
+                # The frame as shown, before anything is drawn into it.
+                self.colourPickFrame = frame.copy()
             if not self.cornersApplied:
                 # Draw the corners if they are set.
                 for corner in self.croppedTableCoords:
                     cv2.circle(
                         frame, (corner[0], corner[1]), 5, (255, 255, 255), 2)
+            warpDone = time.perf_counter()
 
             self.frameCounter = self.frameCounter + 1
             lowerBoundary = np.array(
@@ -616,191 +757,113 @@ class MainWindow(QMainWindow):
                 self.upperSaturationRobotSlider.value(),
                 self.upperValueRobotSlider.value(),
             ])
-            # Detect the puck and update UI values.
-            (x, y), radius = detectPuck(
-                frame, lowerBoundary, upperBoundary)
-            (robotX, robotY), robotRadius = detectPuck(
-                frame, robotLowerBoundary, robotUpperBoundary
-            )
-            # Robot detection is not that stable.
-            # If we find something with a very small or very large radius then set the position invalid.
-            if robotRadius < 10 or robotRadius > 50:
-                robotX = -1
-                robotY = -1
-                robotRadius = -1
-                self.robotSpeed = -1
-            # print(f"Robot: {robotX:.0f},{robotY:.0f}")
-            frame = markInFrame(frame, x, y, radius, FRAME_PUCK_OUTLINE_COLOR)
-            # Mark robot
-            if robotX != -1 and robotY != -1 and robotRadius != -1:
-                frame = markInFrame(frame, robotX, robotY,
-                                    robotRadius, FRAME_ROBOT_OUTLINE_COLOR)
-            frame = markRobotRectangle(frame)
-            self.currentPosition = (x, y)
-            self.currentRobotPosition = (robotX, robotY)
-            self.puckSpeed = math.sqrt((self.currentPosition[0] - self.lastPosition[0]) ** 2 + (
-                    self.currentPosition[1] - self.lastPosition[1]) ** 2)
-            self.robotSpeed = math.sqrt((self.currentRobotPosition[0] - self.lastRobotPosition[0]) ** 2 + (
-                    self.currentRobotPosition[1] - self.lastRobotPosition[1]) ** 2)
-            self.robotIsStopped = self.robotSpeed <= 1 or self.robotSpeed == -1
-            self.puckXLabel.setText(str(f"X: {x:.0f}"))
-            self.puckYLabel.setText(str(f"Y: {y:.0f}"))
-            self.puckRadiusLabel.setText(str(f"Radius: {radius:.0f}"))
-            self.puckSpeedLabel.setText(str(f"Speed: {self.puckSpeed:.1f}"))
-
-            self.robotXLabel.setText(str(f"X: {robotX:.0f}"))
-            self.robotYLabel.setText(str(f"Y: {robotY:.0f}"))
-            self.robotRadiusLabel.setText(str(f"Radius: {robotRadius:.0f}"))
-            self.robotSpeedLabel.setText(str(f"Speed: {self.robotSpeed:.1f}"))
-            self.isPuckGoingToRobot = self.currentPosition[1] < self.lastPosition[1] and (
-                    self.lastPosition[1] - self.currentPosition[1]) > 1
-            self.puckIsGoingLeft = self.currentPosition[0] < self.lastPosition[0] and (
-                    self.lastPosition[0] - self.currentPosition[0]) > 5
-            # Check if the puck is going in the direction of the robot.
-            if self.isPuckGoingToRobot and self.wasPuckGoingToRobot:
-                if not self.predictionMade:
-                    self.puckCollides = False
-                    self.predictionLine = Line(
-                        self.lastPosition, self.currentPosition)
-                    self.savedPoint = self.currentPosition
-                    try:
-                        if self.predictionLine.get_m() is not None:
-                            # Check if we have a collision with the wall on either side.
-                            if self.predictionLine.get_angle() >= 0:  # left edge
-                                self.collisionPoint = (
-                                    0 + (radius / 2), self.predictionLine.get_y(0 + (radius / 2)))
-                                self.puckCollides = True
-                            else:  # right edge
-                                self.collisionPoint = (
-                                    CAMERA_FRAME_HEIGHT - (radius / 2),
-                                    self.predictionLine.get_y(CAMERA_FRAME_HEIGHT - (radius / 2)))
-                                self.puckCollides = True
-                            # If puck collides with wall calculate the reflection point.
-                            if self.puckCollides and self.collisionPoint[1] > 0:
-                                self.reflectionLine = Line(
-                                    self.collisionPoint, None, (-1 * self.predictionLine.get_m() * 2.5))
-                                print(
-                                    f"Reflection line m={self.reflectionLine.get_m()}")
-                                self.predictedPoint = (self.reflectionLine.get_x(
-                                    DEFENSIVE_LINE), DEFENSIVE_LINE)
-                            else:
-                                self.predictedPoint = (
-                                    self.predictionLine.get_x(DEFENSIVE_LINE), DEFENSIVE_LINE)
-                            self.predictionMade = True
-                            self.wentBackToGoal = False
-                            self.attacked = False
-                            if 50 < self.predictedPoint[0] < CAMERA_FRAME_HEIGHT - 50:
-                                moveX, moveY = self.mapCoordinates(
-                                    self.predictedPoint[0],
-                                    self.predictedPoint[1],
-                                    CAMERA_FRAME_HEIGHT,
-                                    CAMERA_FRAME_ROBOT_MAX_Y,
-                                    TABLE_MAX_X,
-                                    TABLE_MAX_Y,
-                                )
-                                moveX = TABLE_MAX_X - moveX
-                                if self.botActivated:
-                                    self.logTextbox.append(
-                                        f"Move To: X={moveX:.0f}, Y={moveY:.0f}")
-                                    self.positionsSent += 1
-                                    self.sendMoveValues(moveX, moveY)
-                    except:
-                        pass
-            else:
-                if True:
-                    self.predictionMade = False
-                    if not self.wentBackToGoal:
-                        self.wentBackToGoal = True
-                        moveX, moveY = self.mapCoordinates(
-                            (CAMERA_FRAME_HEIGHT / 2),
-                            DEFENSIVE_LINE,
-                            CAMERA_FRAME_HEIGHT,
-                            CAMERA_FRAME_ROBOT_MAX_Y,
-                            TABLE_MAX_X,
-                            TABLE_MAX_Y,
-                        )
-                        if self.botActivated:
-                            self.sendMoveValues(int(moveX), int(moveY))
-
-            self.wasPuckGoingToRobot = self.isPuckGoingToRobot
-            self.puckWasGoingLeft = self.puckIsGoingLeft
-            self.lastPosition = self.currentPosition
-            self.lastRobotPosition = self.currentRobotPosition
-            self.robotWasStopped = self.robotIsStopped
-
-            # Draw the current prediction if we have one.
-            if self.predictionMade and self.predictionLine.get_m() is not None:
-                if self.showDebugImages:
-                    # Draw predicted point.
-                    cv2.circle(frame, (int(self.predictedPoint[0]), int(self.predictedPoint[1])),
-                               5, (255, 0, 255), -1)
-
-                    cv2.circle(frame, (int(self.savedPoint[0]),
-                                       int(self.savedPoint[1])), 5, (0, 0, 0), -1)
-
-                    # Draw prediction line.
-                    if not self.puckCollides:
-                        cv2.line(
-                            frame,
-                            (int(self.currentPosition[0]),
-                             int(self.currentPosition[1])),
-                            (int(self.predictedPoint[0]), int(
-                                self.predictedPoint[1])),
-                            (255, 0, 0),
-                            thickness=2,
-                            lineType=4,
-                        )
-                        cv2.line(
-                            frame,
-                            (int(self.savedPoint[0]),
-                             int(self.savedPoint[1])),
-                            (int(self.predictedPoint[0]), int(
-                                self.predictedPoint[1])),
-                            (255, 0, 0),
-                            thickness=2,
-                            lineType=4,
-                        )
-
-                    if self.puckCollides:
-                        # Draw collision point.
-                        cv2.circle(frame, (int(self.collisionPoint[0]), int(self.collisionPoint[1])),
-                                   10, (255, 255, 255), -1)
-
-                        # Draw prediction line for collision.
-                        cv2.line(frame,
-                                 (int(self.savedPoint[0]), int(
-                                     self.savedPoint[1])),
-                                 (int(self.collisionPoint[0]), int(
-                                     self.collisionPoint[1])),
-                                 (255, 0, 0), thickness=2, lineType=4)
-
-                        # Draw reflection line after collision.
-                        cv2.line(frame,
-                                 (int(self.collisionPoint[0]), int(
-                                     self.collisionPoint[1])),
-                                 (int(self.predictedPoint[0]), int(
-                                     self.predictedPoint[1])),
-                                 (255, 255, 0), thickness=2, lineType=4)
-
-            if self.showDebugImages:
+            # The threshold LUT is only rebuilt when a slider moved.
+            self.profile.setBoundaries(lowerBoundary, upperBoundary, robotLowerBoundary, robotUpperBoundary)
+            # Work that is shed when frames take too long, see Runtime/QualityGovernor.py.
+            level = self.governor.level if self.governor is not None else QualityLevel.FULL
+            display = self.showDebugImages and level.value < QualityLevel.NO_DISPLAY.value
+            detection = self.pipeline.detect(frame, captureTimestamp, level, self.cornersApplied)
+            detectDone = time.perf_counter()
+            x, y, radius = detection.puckX, detection.puckY, detection.puckRadius
+            robotX, robotY, robotRadius = detection.robotX, detection.robotY, detection.robotRadius
+            puckVelocityX, puckVelocityY = detection.puckVelocityX, detection.puckVelocityY
+            robotVelocityX, robotVelocityY = detection.robotVelocityX, detection.robotVelocityY
+            # Decide and send the move first so the display never delays the robot.
+            target = self.strategy.step(detection.puck, detection.robot, detection.opponent)
+            if (target.x, target.y) != self.lastTargetPosition:
+                self.lastTargetPosition = (target.x, target.y)
+                if self.botActivated:
+                    # An attack follows the puck, its velocity lets the firmware move on between setpoints.
+                    velocity = (0.0, 0.0)
+                    from Strategy import StrategyState
+                    if target.state == StrategyState.ATTACK:
+                        velocity = (puckVelocityX, puckVelocityY)
+                    self.sendTarget(target, velocity)
+
+            if self.broadcaster is not None:
+                from Telemetry.StateBroadcast import FLAG_PUCK, FLAG_ROBOT, FLAG_OPPONENT, FLAG_ACTIVE
+                strategyDone = time.perf_counter()
+                flags = ((FLAG_PUCK if detection.puck is not None else 0) |
+                         (FLAG_ROBOT if detection.robot is not None else 0) |
+                         (FLAG_OPPONENT if detection.opponent is not None else 0) |
+                         (FLAG_ACTIVE if self.botActivated else 0))
+                prediction = (math.nan, math.nan)
+                if self.strategy.prediction is not None:
+                    prediction = (self.strategy.prediction.x, self.strategy.prediction.y)
+                self.broadcaster.send(
+                    captureTimestamp, self.frameCounter, self.strategy.state.value, level.value, flags, detection,
+                    prediction, (target.x, target.y), self.lastMovePosition,
+                    ((warpDone - processingStart) * 1000, (detectDone - warpDone) * 1000,
+                     (strategyDone - detectDone) * 1000, (time.time() - captureTimestamp) * 1000))
+
+            if self.telemetry is not None:
+                prediction = (math.nan, math.nan)
+                if self.strategy.prediction is not None:
+                    prediction = (self.strategy.prediction.x, self.strategy.prediction.y)
+                self.telemetry.log_frame(
+                    captureTimestamp, self.frameCounter, (x, y), radius,
+                    (robotX, robotY), robotRadius, (puckVelocityX, puckVelocityY), prediction)
+
+            # Speeds are shown in pixels per frame.
+            self.puckSpeed = math.hypot(puckVelocityX, puckVelocityY) / CAMERA_FRAMERATE
+            self.robotSpeed = math.hypot(robotVelocityX, robotVelocityY) / CAMERA_FRAMERATE
+            self.robotIsStopped = self.robotSpeed <= 1
+            # Overlays are only drawn if somebody looks at them.
+            annotate = display or (self.preview is not None and self.preview.hasStreamClients())
+            if annotate and level.value < QualityLevel.NO_DISPLAY.value:
+                if detection.puck is not None:
+                    frame = markInFrame(frame, x, y, radius, FRAME_PUCK_OUTLINE_COLOR)
+                # Mark robot
+                if detection.robot is not None:
+                    frame = markInFrame(frame, robotX, robotY,
+                                        robotRadius, FRAME_ROBOT_OUTLINE_COLOR)
+                if detection.opponent is not None:
+                    frame = markInFrame(frame, detection.opponentX, detection.opponentY,
+                                        detection.opponentRadius, FRAME_OPPONENT_OUTLINE_COLOR)
+                frame = markRobotRectangle(frame)
+                # Draw the current prediction if we have one.
+                if self.strategy.prediction is not None:
+                    frame = markPrediction(frame, self.strategy.prediction)
+            if display:
+                self.puckXLabel.setText(str(f"X: {x:.0f}"))
+                self.puckYLabel.setText(str(f"Y: {y:.0f}"))
+                self.puckRadiusLabel.setText(str(f"Radius: {radius:.0f}"))
+                self.puckSpeedLabel.setText(str(f"Speed: {self.puckSpeed:.1f}"))
+
+                self.robotXLabel.setText(str(f"X: {robotX:.0f}"))
+                self.robotYLabel.setText(str(f"Y: {robotY:.0f}"))
+                self.robotRadiusLabel.setText(str(f"Radius: {robotRadius:.0f}"))
+                self.robotSpeedLabel.setText(str(f"Speed: {self.robotSpeed:.1f}"))
                 self.updateImageFromFrame(self.cameraImageLabel, frame)
+            if self.preview is not None:
+                # Only references are kept, the server encodes and converts them on its own threads.
+                self.preview.publish(frame, {
+                    "frame": self.frameCounter,
+                    "timestamp": captureTimestamp,
+                    "quality": level,
+                    "strategy": self.strategy.state,
+                    "puck": detection.puck,
+                    "robot": detection.robot,
+                    "opponent": detection.opponent,
+                    "target": target,
+                    "prediction": self.strategy.prediction,
+                })
+
+            if self.governor is not None and self.governor.update(time.perf_counter() - processingStart):
+                self.logTextbox.append(f"Quality level {self.governor.level.name}.")
 
             # Code for frame time and FPS.
             frameTimeMs = (self.currentFrameTimestamp -
                            self.lastFrameTimestamp).microseconds / 1000
             self.lastFrameTimestamp = self.currentFrameTimestamp
             fps = 1000 / frameTimeMs
+            if self.frameCounter % CAMERA_FRAMERATE == 0:
+                self.cameraRates = self.camera.get_rates()
             self.frameTimeLabel.setText(
-                f"Frame Time: {frameTimeMs:.0f}ms ({fps:.0f} FPS)")
-
-    def mapCoordinates(
-            self, x, y, maxWidthFrom, maxHeightFrom, maxWidthTo, maxHeightTo
-    ):
-        xScale = maxWidthTo / maxWidthFrom
-        yScale = maxHeightTo / maxHeightFrom
-        x = x * xScale
-        y = y * yScale
-        return x, y
+                f"Frame Time: {frameTimeMs:.0f}ms ({fps:.0f} FPS) "
+                f"Capture: {self.cameraRates[0]:.0f} FPS Decode: {self.cameraRates[1]:.0f} FPS "
+                f"Quality: {level.name}"
+                + (f" Stream lag: {self.streamWorker.get_lag()}" if self.streamWorker is not None else ""))
 
     def updateImageFromFrame(self, image, frame):
         # Resize to GUI size.
@@ -816,11 +879,29 @@ class MainWindow(QMainWindow):
 
 if __name__ == "__main__":
     cv2.ocl.setUseOpenCL(True)
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Rocky Hockey")
+    parser.add_argument("--profile", default=CALIBRATION_PROFILE,
+                        help="Name of the calibration profile for this table and lighting.")
+    parser.add_argument("--realtime", action="store_true", default=REALTIME_ENABLED,
+                        help="Pin threads to cores, raise the priority and lock memory where permitted.")
+    parser.add_argument("--preview", action="store_true", default=PREVIEW_ENABLED,
+                        help="Serve the annotated frame and the state over HTTP.")
+    args, qtArgs = parser.parse_known_args()
+    realTimeMessages = []
+    if args.realtime:
+        # Has to happen before Qt and OpenCV start their threads so they inherit the core mask.
+        from Runtime import enableRealTime
+        realTimeMessages, _ = enableRealTime(REALTIME_VISION_CORES, REALTIME_PRIORITY,
+                                             1 / CAMERA_FRAMERATE, REALTIME_JITTER_TEST_TIME)
+        for message in realTimeMessages:
+            print(message)
+    app = QApplication(sys.argv[:1] + qtArgs)
     # app.setStyleSheet(qdarkstyle.load_stylesheet())
     splash = QSplashScreen(QPixmap("splash.png"))
     splash.show()
-    main_window = MainWindow()
+    main_window = MainWindow(args.profile, args.realtime, args.preview)
+    for message in realTimeMessages:
+        main_window.logTextbox.append(message)
     splash.close()
 
     # Set style with stylesheet.